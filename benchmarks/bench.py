@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""Benchmark the conversion stages on a synthetic LaTeX corpus
+
+The corpus is generated by :py:func:`generate` with a controllable number of
+sections, theorems (of every type in
+:py:data:`latex_to_myst.helpers.SUPPORTED_AMSTHM_BLOCKS`), labelled display
+equations, figures, subfigure groups, nested divs and cross-references.
+Every stage of the conversion is timed separately: the pandoc parse,
+``prepare``, each filter in :py:data:`latex_to_myst.main.ACTIONS`,
+``finalize``, the fused and compact engines, both markdown writers and the
+JSON encoding of the filtered document with every codec of
+:py:mod:`latex_to_myst.codec`.
+The memory of the panflute document is reported next to the compact tree of
+:py:mod:`latex_to_myst.compact`, per node and at its peak while loading,
+along with the peak RSS of the benchmark process. Run it with::
+
+    $ python benchmarks/bench.py --sections 20 --output bench.json
+
+and compare two runs with::
+
+    $ python benchmarks/bench.py --compare baseline.json --output current.json
+"""
+import io
+import sys
+import json
+import time
+import random
+import resource
+import tracemalloc
+import platform
+import argparse
+import statistics
+import subprocess
+import typing as tp
+from pathlib import Path
+import panflute as pf
+from latex_to_myst import codec, compact
+from latex_to_myst.helpers import SUPPORTED_AMSTHM_BLOCKS, child_elements
+from latex_to_myst.pipeline import load_macros, pandoc_version, parse_json
+
+FORMAT_VERSION = 1
+DEFAULT_THRESHOLD = 1.2
+# images per subfigure group
+SUBFIGURE_PANELS = 2
+
+
+class Corpus(tp.NamedTuple):
+    """Shape of a synthetic document, counts are per section"""
+
+    sections: int = 10
+    theorems: int = 1
+    equations: int = 5
+    figures: int = 2
+    subfigures: int = 1
+    depth: int = 3
+    refs: int = 5
+    seed: int = 0
+
+
+def _section(index: int, corpus: Corpus, labels: tp.List[str], rng) -> str:
+    lines = [f"\\section{{Section {index}}}\\label{{sec:{index}}}", ""]
+    for block in SUPPORTED_AMSTHM_BLOCKS:
+        for k in range(corpus.theorems):
+            label = f"{block}:{index}:{k}"
+            lines += [
+                f"\\begin{{{block}}}[{block.title()} {index}.{k}]",
+                f"    Statement of {block} {k} with $a_{{{k}}} + b^2$.",
+                f"    \\label{{{label}}}",
+                f"\\end{{{block}}}",
+                "",
+            ]
+            labels.append(label)
+    for k in range(corpus.equations):
+        label = f"eq:{index}:{k}"
+        lines += [
+            "\\begin{equation}",
+            f"    x_{{{k}}} = \\sum_{{n=0}}^{{{k}}} \\frac{{1}}{{n!}}",
+            f"    \\label{{{label}}}",
+            "\\end{equation}",
+            "",
+        ]
+        labels.append(label)
+    for k in range(corpus.figures):
+        label = f"fig:{index}:{k}"
+        lines += [
+            "\\begin{figure}",
+            "    \\centering",
+            f"    \\includegraphics[width=0.5\\textwidth]{{figures/{index}-{k}.png}}",
+            f"    \\caption{{Figure {k} of section {index}.}}",
+            f"    \\label{{{label}}}",
+            "\\end{figure}",
+            "",
+        ]
+        labels.append(label)
+    for k in range(corpus.subfigures):
+        # images separated by \\ become a multi-image Para and a tabular of
+        # images a Table, both are rendered as a list-table of substitutions.
+        # pandoc drops the caption and label of such figures, so they are
+        # never referenced.
+        panels = [
+            f"\\includegraphics[width=0.45\\textwidth]{{figures/{index}-{k}-{s}}}"
+            for s in range(SUBFIGURE_PANELS)
+        ]
+        if k % 2:
+            body = [
+                f"    \\begin{{tabular}}{{{'c' * SUBFIGURE_PANELS}}}",
+                "    " + " & ".join(panels),
+                "    \\end{tabular}",
+            ]
+        else:
+            body = ["    " + " \\\\\n    ".join(panels)]
+        lines += ["\\begin{figure}", "    \\centering", *body]
+        lines += [
+            f"    \\caption{{Subfigures {k} of section {index}.}}",
+            "\\end{figure}",
+            "",
+        ]
+    if corpus.depth:
+        nested = f"Innermost paragraph of section {index}."
+        for level in range(corpus.depth):
+            indent = "    " * (corpus.depth - level - 1)
+            nested = (
+                f"{indent}\\begin{{block}}\n{nested}\n"
+                f"{indent}Paragraph at depth {level}.\n{indent}\\end{{block}}"
+            )
+        lines += [nested, ""]
+    if corpus.refs and labels:
+        refs = [rng.choice(labels) for _ in range(corpus.refs)]
+        text = ", ".join(
+            f"\\eqref{{{r}}}" if r.startswith("eq:") else f"\\ref{{{r}}}" for r in refs
+        )
+        lines += [f"See {text}.", ""]
+    return "\n".join(lines)
+
+
+def generate(corpus: Corpus = Corpus()) -> str:
+    """Generate a LaTeX document of the given shape"""
+    rng = random.Random(corpus.seed)
+    labels = []
+    sections = [_section(i, corpus, labels, rng) for i in range(corpus.sections)]
+    return (
+        "\\documentclass{article}\n"
+        "\\usepackage{amsmath,amsthm,graphicx,subcaption}\n"
+        "\\begin{document}\n\n" + "\n".join(sections) + "\n\\end{document}\n"
+    )
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def time_stages(text: str, macros: str) -> tp.Dict[str, float]:
+    """Convert the document once and time every stage, in seconds"""
+    from latex_to_myst.main import ACTIONS, prepare, finalize
+    from latex_to_myst.engine import FusedEngine
+    from latex_to_myst.compact_engine import CompactEngine
+    from latex_to_myst.pipeline import to_markdown
+    from latex_to_myst.writer import unsupported_elements
+
+    times = {}
+    ast, times["parse"] = _timed(parse_json, text, macros)
+    doc, times["load"] = _timed(pf.load, io.StringIO(ast))
+    _, times["prepare"] = _timed(prepare, doc)
+    for name, action in ACTIONS:
+        doc, times[f"action:{name}"] = _timed(lambda: pf.run_filter(action, doc=doc))
+    _, times["finalize"] = _timed(finalize, doc)
+    _, times["write:pandoc"] = _timed(to_markdown, doc)
+    if not unsupported_elements(doc):
+        _, times["write:native"] = _timed(to_markdown, doc, "native")
+
+    fused = pf.load(io.StringIO(ast))
+
+    def run_fused():
+        prepare(fused)
+        FusedEngine().run(fused)
+        finalize(fused)
+
+    _, times["fused"] = _timed(run_fused)
+    # from the JSON AST to the filtered one
+    _, times["compact"] = _timed(CompactEngine().run, ast)
+
+    for name in ("json", "orjson"):
+        try:
+            encoder = codec.create_codec(name)
+        except ModuleNotFoundError:
+            continue
+        _, times[f"encode:{name}"] = _timed(encoder.dump_doc, doc)
+
+    root, times["load:compact"] = _timed(compact.load, ast)
+    _, times["index:compact"] = _timed(compact.build_label_index, root)
+    return times
+
+
+def _count_elements(doc: pf.Doc) -> int:
+    stack, n = [doc], 0
+    while stack:
+        n += 1
+        stack.extend(child_elements(stack.pop()))
+    return n
+
+
+def measure_memory(ast: str) -> tp.Dict[str, tp.Dict[str, float]]:
+    """Memory of the panflute and compact trees of a JSON AST, in bytes"""
+    loaders = dict(
+        panflute=(lambda: pf.load(io.StringIO(ast)), _count_elements),
+        compact=(lambda: compact.load(ast), compact.count),
+    )
+    memory = {}
+    for name, (load, count) in loaders.items():
+        tracemalloc.start()
+        try:
+            tree = load()
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        nodes = count(tree)
+        del tree
+        memory[name] = dict(nodes=nodes, bytes=size, peak=peak, per_node=size / nodes)
+    return memory
+
+
+def _peak_rss() -> int:
+    """Peak resident set size of the process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _git_revision() -> tp.Optional[str]:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(Path(__file__).parent),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip()
+
+
+def run(corpus: Corpus, repeat: int = 3, macros: str = None) -> tp.Dict[str, tp.Any]:
+    """Benchmark the conversion of the corpus, repeated to report the spread"""
+    text = generate(corpus)
+    macros = load_macros() if macros is None else macros
+    # the first conversion imports the filters and warms up pandoc
+    time_stages(text, macros)
+    runs = [time_stages(text, macros) for _ in range(repeat)]
+    stages = {}
+    for name in runs[0]:
+        samples = [r[name] for r in runs if name in r]
+        stages[name] = dict(
+            min=min(samples), median=statistics.median(samples), runs=samples
+        )
+    memory = measure_memory(parse_json(text, macros))
+    return dict(
+        format_version=FORMAT_VERSION,
+        environment=dict(
+            python=platform.python_version(),
+            platform=platform.platform(),
+            pandoc=".".join(map(str, pandoc_version())),
+            panflute=pf.__version__,
+            revision=_git_revision(),
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        ),
+        corpus=dict(corpus._asdict(), bytes=len(text), lines=text.count("\n")),
+        repeat=repeat,
+        stages=stages,
+        memory=memory,
+        peak_rss=_peak_rss(),
+    )
+
+
+def compare(
+    baseline: tp.Dict[str, tp.Any],
+    current: tp.Dict[str, tp.Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> tp.List[str]:
+    """Stages that are slower than in the baseline by more than threshold"""
+    regressions = []
+    for name, stage in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old and old["min"] > 0 and stage["min"] / old["min"] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def format_report(
+    result: tp.Dict[str, tp.Any], baseline: tp.Dict[str, tp.Any] = None
+) -> str:
+    """Tabulate the stage timings, next to the baseline if given"""
+    corpus = result["corpus"]
+    lines = [f"Corpus: {corpus['bytes']} bytes, {corpus['sections']} sections"]
+    header = f"{'stage':<20} {'min (ms)':>10} {'median (ms)':>12}"
+    if baseline is not None:
+        header += f" {'baseline (ms)':>14} {'ratio':>7}"
+    lines.append(header)
+    for name, stage in result["stages"].items():
+        line = f"{name:<20} {stage['min'] * 1e3:>10.1f} {stage['median'] * 1e3:>12.1f}"
+        old = baseline["stages"].get(name) if baseline is not None else None
+        if old:
+            ratio = stage["min"] / old["min"] if old["min"] > 0 else float("inf")
+            line += f" {old['min'] * 1e3:>14.1f} {ratio:>7.2f}"
+        lines.append(line)
+    if "memory" in result:
+        lines.append(
+            f"{'tree':<20} {'nodes':>10} {'B/node':>12} {'MB':>8} {'peak MB':>8}"
+        )
+        for name, mem in result["memory"].items():
+            lines.append(
+                f"{name:<20} {mem['nodes']:>10} {mem['per_node']:>12.0f} "
+                f"{mem['bytes'] / 1e6:>8.1f} {mem['peak'] / 1e6:>8.1f}"
+            )
+        lines.append(f"Peak RSS: {result['peak_rss'] / 1e6:.1f} MB")
+    return "\n".join(lines)
+
+
+def main(argv: tp.Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    for field, default in Corpus._field_defaults.items():
+        parser.add_argument(
+            f"--{field}",
+            default=default,
+            type=int,
+            help=f"Corpus {field}, default to {default}.",
+        )
+    parser.add_argument(
+        "-r", "--repeat", default=3, type=int, help="Number of timed conversions."
+    )
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON results of a baseline run.")
+    parser.add_argument(
+        "--threshold",
+        default=DEFAULT_THRESHOLD,
+        type=float,
+        help="Slowdown ratio over the baseline reported as a regression.",
+    )
+    parser.add_argument("--save-corpus", help="Write the generated LaTeX to this file.")
+    args = parser.parse_args(argv)
+
+    corpus = Corpus(**{field: getattr(args, field) for field in Corpus._fields})
+    if args.save_corpus:
+        Path(args.save_corpus).write_text(generate(corpus))
+    result = run(corpus, repeat=args.repeat)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+    print(format_report(result, baseline))
+    if baseline is not None:
+        regressions = compare(baseline, result, args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold}x: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,3 +6,4 @@ __email__ = "tingkai.liu.21st@gmail.com"
 __version__ = "0.0.5"
 
 from latex_to_myst.cli import main
+from latex_to_myst.converter import Converter
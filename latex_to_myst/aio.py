@@ -0,0 +1,220 @@
+"""asyncio API
+
+:py:class:`AsyncConverter` converts documents without blocking the event
+loop, so that a service can have many conversions in flight in a single
+process:
+
+- pandoc runs as an asyncio subprocess, at most ``max_pandoc`` at a time,
+- the filters, which are CPU bound, run in an executor (the default executor
+  of the loop unless given, a :py:class:`concurrent.futures.ProcessPoolExecutor`
+  spreads them over several cores),
+- the parsed AST cache is read and written in the executor as well.
+
+::
+
+    converter = AsyncConverter(max_pandoc=8)
+    markdowns = await asyncio.gather(*(converter.convert(t) for t in texts))
+
+The limit is per converter, reuse one converter for all conversions.
+
+The output is the same as with :py:class:`latex_to_myst.converter.Converter`.
+With another pandoc backend than the subprocess one, e.g. a
+:py:class:`latex_to_myst.backend.ServerBackend`, the conversions are sent
+from the executor instead.
+"""
+import io
+import os
+import shutil
+import asyncio
+import typing as tp
+import logging
+from pathlib import Path
+from concurrent.futures import Executor
+from .backend import SubprocessBackend, get_backend
+from .codec import dump_doc, load_doc
+from .converter import Converter
+from .labelstore import ANONYMOUS_SOURCE, LabelStore, attach, source_key
+from .pipeline import filter_ast, run_actions
+from .preamble import compile_preamble
+
+logger = logging.getLogger(__name__)
+
+# default limit of concurrent pandoc processes
+DEFAULT_MAX_PANDOC = os.cpu_count() or 1
+
+
+async def run_pandoc(
+    text: str, input_format: str, output_format: str, standalone: bool = True
+) -> str:
+    """Run pandoc in an asyncio subprocess, like :py:func:`panflute.convert_text`"""
+    pandoc = shutil.which("pandoc")
+    if pandoc is None:
+        raise OSError("Path to pandoc executable does not exists")
+    args = [f"--from={input_format}", f"--to={output_format}"]
+    if standalone:
+        args.append("--standalone")
+    proc = await asyncio.create_subprocess_exec(
+        pandoc,
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    out, err = await proc.communicate(text.encode("utf-8"))
+    if err:
+        logger.debug(err.decode("utf-8"))
+    if proc.returncode != 0:
+        raise IOError(err.decode("utf-8", errors="replace").strip())
+    return "\n".join(out.decode("utf-8").splitlines())
+
+
+def _filter(
+    ast: str,
+    engine: str,
+    writer: str,
+    label_store: tp.Optional[LabelStore] = None,
+    source: str = ANONYMOUS_SOURCE,
+) -> tp.Tuple[str, bool]:
+    """Run the filters on a JSON AST
+
+    With a label store, the labels are recorded under source and the
+    references to the other sources are resolved. Returns the markdown and
+    True if the native writer wrote the document, otherwise the filtered JSON
+    AST for pandoc and False.
+    """
+    if engine == "compact":
+        ast = filter_ast(ast, label_store=label_store, source=source).ast
+        if writer != "native":
+            return ast.decode("utf-8"), False
+        doc = load_doc(ast)
+    else:
+        doc = attach(load_doc(ast), label_store, source)
+        doc = run_actions(doc, engine=engine)
+    if writer == "native":
+        from .writer import unsupported_elements, write_markdown
+
+        unsupported = unsupported_elements(doc)
+        if not unsupported:
+            with io.StringIO() as stream:
+                write_markdown(doc, stream)
+                return stream.getvalue(), True
+        logger.info(
+            f"Native writer does not support {', '.join(sorted(unsupported))}, "
+            "using pandoc"
+        )
+    return dump_doc(doc).decode("utf-8"), False
+
+
+class AsyncConverter:
+    """Convert LaTeX to MyST markdown from coroutines
+
+    Arguments:
+        converter: configuration of the conversions, created from the keyword
+          arguments if None
+        max_pandoc: maximum number of pandoc processes running at once
+        executor: executor of the filters and cache accesses, default to the
+          default executor of the event loop
+        kwargs: arguments of :py:class:`latex_to_myst.converter.Converter`
+    """
+
+    def __init__(
+        self,
+        converter: Converter = None,
+        max_pandoc: int = DEFAULT_MAX_PANDOC,
+        executor: Executor = None,
+        **kwargs,
+    ):
+        self.converter = converter or Converter(**kwargs)
+        self.max_pandoc = max_pandoc
+        self.executor = executor
+        self._semaphores: tp.Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # semaphores are bound to the event loop they are used in
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores = {
+                other: semaphore
+                for other, semaphore in self._semaphores.items()
+                if not other.is_closed()
+            }
+            self._semaphores[loop] = asyncio.Semaphore(self.max_pandoc)
+        return self._semaphores[loop]
+
+    async def _run(self, func: tp.Callable, *args) -> tp.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def pandoc(self, text: str, input_format: str, output_format: str) -> str:
+        """Run a pandoc conversion, waiting for a free pandoc slot"""
+        backend = self.converter.backend or get_backend()
+        async with self._semaphore():
+            if isinstance(backend, SubprocessBackend):
+                return await run_pandoc(text, input_format, output_format)
+            return await self._run(backend.convert, text, input_format, output_format)
+
+    async def parse_json(self, text: str) -> str:
+        """Parse LaTeX source like :py:func:`latex_to_myst.pipeline.parse_json`"""
+        cache = self.converter.cache
+        macros = compile_preamble(self.converter.macros).for_document(text)
+        if cache is None:
+            return await self.pandoc(macros + text, "latex", "json")
+
+        key = cache.key(text, macros)
+        ast = await self._run(cache.get, key)
+        if ast is None:
+            ast = await self.pandoc(macros + text, "latex", "json")
+            await self._run(cache.put, key, ast)
+        else:
+            logger.info(f"Using cached AST {key}")
+        return ast
+
+    async def convert(self, text: str, source: str = ANONYMOUS_SOURCE) -> str:
+        """Convert LaTeX source to MyST markdown
+
+        The label store of the converter is used as in
+        :py:meth:`latex_to_myst.converter.Converter.convert`.
+        """
+        ast = await self.parse_json(text)
+        output, written = await self._run(
+            _filter,
+            ast,
+            self.converter.engine,
+            self.converter.writer,
+            self.converter.label_store,
+            source,
+        )
+        if written:
+            return output
+        return await self.pandoc(output, "json", "markdown")
+
+    async def convert_file(
+        self, source: tp.Union[str, Path], target: tp.Union[str, Path] = None
+    ) -> str:
+        """Convert a LaTeX file, writing the markdown to target if given"""
+        text = await self._run(Path(source).read_text)
+        markdown = await self.convert(text, source_key(source))
+        if target is not None:
+            await self._run(Path(target).write_text, markdown)
+        return markdown
+
+
+# converter of convert, created on first use
+_default: tp.Optional[AsyncConverter] = None
+
+
+async def convert(text: str) -> str:
+    """Convert LaTeX source to MyST markdown without blocking the event loop
+
+    All calls share a default :py:class:`AsyncConverter`, and so its limit of
+    concurrent pandoc processes. For another configuration, create an
+    :py:class:`AsyncConverter` and reuse it for all documents: every converter
+    has its own limit.
+    """
+    global _default
+    if _default is None:
+        # loading the macros reads files, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        converter = await loop.run_in_executor(None, AsyncConverter)
+        _default = _default or converter
+    return await _default.convert(text)
@@ -0,0 +1,267 @@
+"""Copy the images referenced by converted documents next to the markdown
+
+:py:func:`latex_to_myst.figures.create_image` records the URL of every image
+it converts, including the images of subfigures, in ``doc.image_urls``.
+:py:func:`resolve_assets` resolves those URLs against the directory of the
+LaTeX source (trying the usual graphics extensions for URLs without one, like
+``\\includegraphics``) and places them at the same relative path from the
+markdown, so that the URLs in the markdown stay valid.
+
+:py:func:`publish_assets` copies (or hardlinks) the assets into the output
+directory with a pool of threads. An :py:class:`AssetManifest` in the output
+directory records the size, modification time and content hash of the
+source of every asset:
+
+- assets whose source did not change since the last run are skipped without
+  reading them,
+- assets with the same content, e.g. the same logo used by several
+  documents, are copied from the first copy in the output directory, or
+  hardlinked to it with ``link``. Hardlinked assets share a single file,
+  editing one of them in place changes all of them.
+
+Images are copied as they are, converting PDF or EPS figures is left to the
+build.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import typing as tp
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".assets.json"
+# extensions tried for image URLs without one, in the order of pdflatex
+GRAPHICS_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".eps", ".svg")
+
+
+class Asset(tp.NamedTuple):
+    """Image of a document to place at target"""
+
+    url: str
+    source: Path
+    target: Path
+
+
+class AssetResult(tp.NamedTuple):
+    """Outcome of publishing an asset
+
+    ``action`` is one of ``copied``, ``linked`` (to an identical asset),
+    ``unchanged`` or ``failed``.
+    """
+
+    asset: Asset
+    action: str
+    sha256: str = ""
+    error: str = ""
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _find_source(path: Path) -> tp.Optional[Path]:
+    if path.suffix and path.is_file():
+        return path
+    for ext in GRAPHICS_EXTENSIONS:
+        candidate = path.with_name(path.name + ext)
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def resolve_assets(
+    urls: tp.Iterable[str],
+    source_dir: tp.Union[str, Path],
+    target_dir: tp.Union[str, Path],
+) -> tp.List[Asset]:
+    """Resolve image URLs of a document in source_dir to assets in target_dir
+
+    Remote and absolute URLs, URLs leading out of target_dir and images that
+    do not exist are logged and left out.
+    """
+    source_dir = Path(source_dir)
+    target_dir = Path(os.path.normpath(target_dir))
+    assets = []
+    for url in dict.fromkeys(urls):
+        if "://" in url or Path(url).is_absolute():
+            logger.warning(f"Image {url} is not relative to the document, not copied.")
+            continue
+        target = Path(os.path.normpath(target_dir / url))
+        if os.path.commonpath([target, target_dir]) != str(target_dir):
+            logger.warning(f"Image {url} is outside of the output, not copied.")
+            continue
+        source = _find_source(source_dir / url)
+        if source is None:
+            logger.warning(f"Image {url} not found in {source_dir}.")
+            continue
+        if source.suffix != Path(url).suffix:
+            target = target.with_name(target.name + source.suffix)
+        assets.append(Asset(url, source, target))
+    return assets
+
+
+class AssetManifest:
+    """Sources and content hashes of the assets of an output directory
+
+    Arguments:
+        path: file of the manifest, read if it exists
+    """
+
+    def __init__(self, path: tp.Union[str, Path]):
+        self.path = Path(path)
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _key(self, target: Path) -> str:
+        return os.path.relpath(target, self.path.parent)
+
+    def unchanged(self, asset: Asset, stat: os.stat_result) -> tp.Optional[str]:
+        """Content hash of the asset if it was published from the same source"""
+        entry = self.entries.get(self._key(asset.target))
+        if (
+            entry is not None
+            and entry["source"] == str(asset.source)
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and asset.target.exists()
+        ):
+            return entry["sha256"]
+        return None
+
+    def record(self, asset: Asset, stat: os.stat_result, sha256: str) -> None:
+        self.entries[self._key(asset.target)] = dict(
+            source=str(asset.source),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            sha256=sha256,
+        )
+
+    def copies(self) -> tp.Dict[str, Path]:
+        """Published file of every content hash"""
+        return {
+            entry["sha256"]: self.path.parent / key
+            for key, entry in self.entries.items()
+        }
+
+    def save(self) -> None:
+        """Write the manifest atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def _place(source: Path, target: Path, link: bool) -> str:
+    """Hardlink (if link) or copy source to target, return the action"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    if link:
+        try:
+            os.link(source, tmp)
+            os.replace(tmp, target)
+            return "linked"
+        except OSError:
+            pass  # e.g. on another file system
+    shutil.copy2(source, tmp)
+    os.replace(tmp, target)
+    return "copied"
+
+
+def publish_assets(
+    assets: tp.Iterable[Asset],
+    output_dir: tp.Union[str, Path],
+    jobs: int = None,
+    link: bool = False,
+) -> tp.List[AssetResult]:
+    """Copy the assets into output_dir with a pool of ``jobs`` threads
+
+    Assets are hashed and copied in parallel, skipping those whose source is
+    unchanged since the last run according to the manifest in output_dir.
+    Assets with the same content as one already published are copied from
+    it. With link, the sources are hardlinked rather than copied and the
+    duplicates hardlinked to the first of them.
+    """
+    manifest = AssetManifest(Path(output_dir) / MANIFEST_FILE)
+    # a target is written once, by the first asset placed there
+    unique = {}
+    for asset in assets:
+        unique.setdefault(asset.target, asset)
+    assets = list(unique.values())
+
+    def inspect(asset: Asset) -> tp.Tuple[os.stat_result, str, bool]:
+        stat = asset.source.stat()
+        sha256 = manifest.unchanged(asset, stat)
+        if sha256 is not None:
+            return stat, sha256, True
+        return stat, _file_digest(asset.source), False
+
+    results: tp.Dict[Path, AssetResult] = {}
+    plan = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        inspected = pool.map(_safe(inspect), assets)
+        copies = manifest.copies()
+        for asset, (outcome, error) in zip(assets, inspected):
+            if error:
+                results[asset.target] = AssetResult(asset, "failed", error=error)
+                continue
+            stat, sha256, unchanged = outcome
+            manifest.record(asset, stat, sha256)
+            if unchanged:
+                results[asset.target] = AssetResult(asset, "unchanged", sha256)
+                copies.setdefault(sha256, asset.target)
+                continue
+            copy = copies.setdefault(sha256, asset.target)
+            plan.append((asset, sha256, copy))
+
+        # identical assets are placed once their first copy is
+        def place(item):
+            asset, sha256, copy = item
+            if copy != asset.target:
+                return None
+            return _place(asset.source, asset.target, link)
+
+        def place_duplicate(item):
+            asset, sha256, copy = item
+            if copy == asset.target:
+                return None
+            return _place(copy if copy.exists() else asset.source, asset.target, link)
+
+        for step in (place, place_duplicate):
+            for item, (action, error) in zip(plan, pool.map(_safe(step), plan)):
+                asset, sha256, _ = item
+                if error:
+                    results[asset.target] = AssetResult(asset, "failed", error=error)
+                elif action is not None:
+                    results[asset.target] = AssetResult(asset, action, sha256)
+    for result in results.values():
+        if result.action == "failed":
+            manifest.entries.pop(manifest._key(result.asset.target), None)
+            logger.error(f"Failed to copy {result.asset.source}: {result.error}")
+    manifest.save()
+    return [results[asset.target] for asset in assets]
+
+
+def _safe(func: tp.Callable) -> tp.Callable:
+    """Return the outcome of func and the error it raised as a string"""
+
+    def wrapper(*args):
+        try:
+            return func(*args), ""
+        except OSError as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    return wrapper
@@ -0,0 +1,291 @@
+"""Backends running pandoc for the conversion pipeline
+
+Every document needs at least two pandoc conversions: the LaTeX reader in
+:py:func:`latex_to_myst.pipeline.parse_json` and the markdown writer in
+:py:func:`latex_to_myst.pipeline.write_output`. Both go through the backend
+returned by :py:func:`get_backend`:
+
+- :py:class:`SubprocessBackend` (the default) starts a new pandoc process for
+  every conversion, like :py:func:`panflute.convert_text`. For short documents
+  most of that time is the start-up of the pandoc runtime.
+- :py:class:`ServerBackend` sends the conversions over HTTP to a long-lived
+  ``pandoc server`` (pandoc >= 2.18) on localhost, which it starts itself
+  unless given the URL of a running one. All conversions, from all threads
+  and worker processes, reuse that server.
+
+pandoc has no mode to read several documents from a single process's stdin,
+so the server is the way to keep pandoc processes alive across conversions.
+The server runs the readers sandboxed: unlike with the subprocess backend,
+LaTeX ``\\input`` and ``\\include`` of other files are not resolved.
+
+Backends can be pickled to hand them to worker processes, a
+:py:class:`ServerBackend` unpickled in a worker talks to the server of the
+parent process.
+"""
+import os
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+import typing as tp
+import logging
+import panflute as pf
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("subprocess", "server")
+
+# seconds to wait for a started pandoc server to accept requests
+SERVER_START_TIMEOUT = 10.0
+# seconds a single conversion may take on the server (its default is 2)
+SERVER_CONVERSION_TIMEOUT = 600
+
+
+def normalize_output(text: str) -> str:
+    """Line endings of the pandoc output as in :py:func:`panflute.convert_text`"""
+    return "\n".join(text.splitlines())
+
+
+class PandocBackend:
+    """Run pandoc conversions of text between two formats"""
+
+    name = ""
+
+    def convert(
+        self, text: str, input_format: str, output_format: str, standalone: bool = True
+    ) -> str:
+        raise NotImplementedError
+
+    def convert_bytes(
+        self,
+        data: bytes,
+        input_format: str,
+        output_format: str,
+        standalone: bool = True,
+    ) -> bytes:
+        """Convert UTF-8 encoded text, without normalizing the line endings"""
+        text = self.convert(
+            data.decode("utf-8"), input_format, output_format, standalone
+        )
+        return text.encode("utf-8")
+
+    def close(self) -> None:
+        """Release the resources held by the backend"""
+
+
+class SubprocessBackend(PandocBackend):
+    """Run every conversion in a new pandoc process"""
+
+    name = "subprocess"
+
+    def convert(
+        self, text: str, input_format: str, output_format: str, standalone: bool = True
+    ) -> str:
+        return pf.convert_text(
+            text,
+            input_format=input_format,
+            output_format=output_format,
+            standalone=standalone,
+        )
+
+    def convert_bytes(
+        self,
+        data: bytes,
+        input_format: str,
+        output_format: str,
+        standalone: bool = True,
+    ) -> bytes:
+        # the bytes go to and come from the pipes of pandoc as they are
+        pandoc = shutil.which("pandoc")
+        if pandoc is None:
+            raise OSError("Path to pandoc executable does not exists")
+        args = [pandoc, f"--from={input_format}", f"--to={output_format}"]
+        if standalone:
+            args.append("--standalone")
+        proc = subprocess.run(
+            args, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if proc.stderr:
+            logger.debug(proc.stderr.decode("utf-8", errors="replace"))
+        if proc.returncode != 0:
+            raise IOError(proc.stderr.decode("utf-8", errors="replace").strip())
+        return proc.stdout
+
+
+def _free_port() -> int:
+    # the networking modules are only imported by the server backend
+    import socket
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerBackend(PandocBackend):
+    """Run the conversions on a long-lived ``pandoc server``
+
+    Arguments:
+        url: URL of a running pandoc server, a server is started on a free
+          port of localhost (and stopped by :py:meth:`close` or at exit) if
+          None
+        timeout: seconds to wait for the response to a conversion
+    """
+
+    name = "server"
+
+    def __init__(self, url: str = None, timeout: float = SERVER_CONVERSION_TIMEOUT):
+        self.timeout = timeout
+        self._process = None
+        self._tmpdir = None
+        self._local = threading.local()
+        if url is None:
+            url = self._start()
+        self.url = url
+
+    def __getstate__(self) -> tp.Dict[str, tp.Any]:
+        return dict(url=self.url, timeout=self.timeout)
+
+    def __setstate__(self, state: tp.Dict[str, tp.Any]) -> None:
+        self.__init__(**state)
+
+    def _command(self, port: int) -> tp.List[str]:
+        from .pipeline import pandoc_version
+
+        pandoc = shutil.which("pandoc")
+        if pandoc is None:
+            raise OSError("Path to pandoc executable does not exists")
+        version = pandoc_version()
+        options = [f"--port={port}", f"--timeout={SERVER_CONVERSION_TIMEOUT}"]
+        if version >= (3,):
+            return [pandoc, "server"] + options
+        if version < (2, 18):
+            raise RuntimeError("The pandoc server needs pandoc >= 2.18.")
+        # pandoc 2.x runs as a server when invoked under the name pandoc-server
+        self._tmpdir = tempfile.mkdtemp(prefix="latex_to_myst-")
+        link = os.path.join(self._tmpdir, "pandoc-server")
+        os.symlink(os.path.realpath(pandoc), link)
+        return [link] + options
+
+    def _start(self) -> str:
+        import http.client
+
+        port = _free_port()
+        url = f"http://127.0.0.1:{port}"
+        self._process = subprocess.Popen(
+            self._command(port),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        atexit.register(self.close)
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/version")
+                version = conn.getresponse().read().decode()
+                conn.close()
+                break
+            except OSError:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise RuntimeError(f"Failed to start pandoc server on {url}")
+                time.sleep(0.02)
+        logger.info(f"Started pandoc server {version} on {url}")
+        return url
+
+    def _connection(self) -> "http.client.HTTPConnection":
+        import http.client
+        import urllib.parse
+
+        # connections are per thread, and not inherited by forked processes
+        if getattr(self._local, "pid", None) != os.getpid():
+            parts = urllib.parse.urlsplit(self.url)
+            self._local.conn = http.client.HTTPConnection(
+                parts.hostname, parts.port, timeout=self.timeout
+            )
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _request(self, body: bytes) -> tp.Tuple[int, bytes]:
+        import http.client
+
+        conn = self._connection()
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        try:
+            conn.request("POST", "/", body, headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # the server closes idle connections, retry once on a new one
+            conn.close()
+            conn.request("POST", "/", body, headers)
+            response = conn.getresponse()
+        return response.status, response.read()
+
+    def convert(
+        self, text: str, input_format: str, output_format: str, standalone: bool = True
+    ) -> str:
+        body = json.dumps(
+            {
+                "text": text,
+                "from": input_format,
+                "to": output_format,
+                "standalone": standalone,
+            }
+        ).encode()
+        status, data = self._request(body)
+        if status != 200:
+            raise IOError(f"pandoc server: {data.decode(errors='replace').strip()}")
+        # same line endings as panflute.convert_text
+        return "\n".join(json.loads(data).splitlines())
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            del self._local.conn, self._local.pid
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+
+def create_backend(name: str = "subprocess", url: str = None) -> PandocBackend:
+    """Create a backend by name, see :py:data:`BACKENDS`
+
+    A server backend is created for a ``url`` of a running server whatever the
+    name. If the pandoc server cannot be started, the error is logged and a
+    subprocess backend is returned instead.
+    """
+    if url is not None:
+        return ServerBackend(url)
+    if name == "subprocess":
+        return SubprocessBackend()
+    if name != "server":
+        raise ValueError(f"Unknown pandoc backend '{name}', use one of {BACKENDS}.")
+    try:
+        return ServerBackend()
+    except (OSError, RuntimeError) as e:
+        logger.warning(f"Pandoc server unavailable ({e}), using subprocesses.")
+        return SubprocessBackend()
+
+
+_BACKEND: PandocBackend = SubprocessBackend()
+
+
+def get_backend() -> PandocBackend:
+    """Backend used by the pipeline of this process"""
+    return _BACKEND
+
+
+def set_backend(backend: PandocBackend) -> PandocBackend:
+    """Use the backend in the pipeline of this process, returns the previous one"""
+    global _BACKEND
+    previous, _BACKEND = _BACKEND, backend
+    return previous
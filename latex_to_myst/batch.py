@@ -0,0 +1,398 @@
+"""Convert many LaTeX files in one invocation
+
+The batch entry point is invoked in the command line as::
+
+    $ latex2myst-batch chapters/ appendix/*.tex -o build/md -j 8
+
+Every input can be a ``.tex`` file, a directory (searched recursively for
+``.tex`` files) or a glob pattern. The directory structure of the inputs is
+mirrored into the output directory. Conversions run in a pool of worker
+processes that are started once with panflute imported and the macro preamble
+loaded, so the per-document cost is only the pandoc round-trip and the
+filters.
+
+With ``--label-db``, the labels of all inputs are first gathered into the
+label database (see :py:mod:`latex_to_myst.labelstore`) so that references
+across documents resolve whatever order the documents are converted in.
+Use the AST cache so that the conversions reuse the parses of that phase.
+
+With ``--copy-assets``, the images of the documents are copied next to their
+markdown, see :py:mod:`latex_to_myst.assets`.
+"""
+import os
+import sys
+import glob
+import collections
+import time
+import typing as tp
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .backend import PandocBackend, get_backend, set_backend
+from .cache import ASTCache, format_stats
+from .codec import JSONCodec, get_codec, set_codec
+from .equations import (
+    EquationCache,
+    format_stats as format_equation_stats,
+    get_equation_cache,
+    set_equation_cache,
+)
+from .cli import (
+    EXIT_FAILURE,
+    EXIT_OK,
+    _validate_file,
+    add_common_arguments,
+    backend_from_args,
+    cache_from_args,
+    check_pandoc,
+    codec_from_args,
+    equation_cache_from_args,
+    label_store_from_args,
+    setup_logging,
+)
+from .assets import publish_assets, resolve_assets
+from .labelstore import LabelStore, attach, source_key
+from .pipeline import (
+    ast_to_markdown,
+    filter_ast,
+    load_macros,
+    parse,
+    parse_bytes,
+    run_actions,
+    to_markdown,
+)
+
+logger = logging.getLogger(__name__)
+
+# macro preamble, AST cache, filter engine, markdown writer and label store of
+# the worker process, set by :py:func:`_init_worker`
+_WORKER_MACROS = ""
+_WORKER_CACHE = None
+_WORKER_ENGINE = "legacy"
+_WORKER_WRITER = "pandoc"
+_WORKER_LABEL_STORE = None
+
+
+class BatchResult(tp.NamedTuple):
+    """Outcome of converting a single file"""
+
+    source: Path
+    target: Path
+    ok: bool
+    size: int
+    seconds: float
+    error: str = ""
+    cache_hit: bool = False
+    images: tp.Tuple[str, ...] = ()
+    equation_hits: int = 0
+    equation_misses: int = 0
+
+
+def _glob_root(pattern: str) -> Path:
+    """Longest leading part of a glob pattern without wildcards"""
+    parts = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def collect_inputs(inputs: tp.Iterable[str]) -> tp.List[tp.Tuple[Path, Path]]:
+    """Expand files, directories and globs into ``(source, relative path)`` pairs
+
+    The relative path is the location of the output file with respect to the
+    output directory (before changing the suffix to ``.md``).
+
+    Raises:
+        RuntimeError: if two sources would be written to the same output file
+    """
+    found = {}
+    for name in inputs:
+        path = Path(name)
+        if glob.has_magic(name):
+            root = _glob_root(name)
+            sources = [
+                Path(p)
+                for p in sorted(glob.glob(name, recursive=True))
+                if p.endswith(".tex")
+            ]
+        elif path.is_dir():
+            root = path
+            sources = sorted(path.rglob("*.tex"))
+        else:
+            root = path.parent
+            sources = [Path(_validate_file(name, ".tex"))]
+        for src in sources:
+            found.setdefault(src.resolve(), (src, src.relative_to(root)))
+    targets = {}
+    for src, rel in found.values():
+        other = targets.setdefault(rel.with_suffix(".md"), src)
+        if other is not src:
+            raise RuntimeError(
+                f"Files '{other}' and '{src}' would both be converted to "
+                f"'{rel.with_suffix('.md')}'."
+            )
+    return list(found.values())
+
+
+def _init_worker(
+    macros: str,
+    cache: tp.Optional[ASTCache],
+    engine: str,
+    writer: str,
+    log_level: int,
+    backend: PandocBackend,
+    label_store: tp.Optional[LabelStore] = None,
+    codec: JSONCodec = None,
+    equations: EquationCache = None,
+) -> None:
+    """Initialize a worker process with the shared macro preamble and cache
+
+    The equation cache of the worker is kept across the files it converts.
+    """
+    global _WORKER_MACROS, _WORKER_CACHE, _WORKER_ENGINE, _WORKER_WRITER
+    global _WORKER_LABEL_STORE
+    _WORKER_MACROS = macros
+    _WORKER_CACHE = cache
+    _WORKER_ENGINE = engine
+    _WORKER_WRITER = writer
+    _WORKER_LABEL_STORE = label_store
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=log_level)
+    set_backend(backend)
+    if codec is not None:
+        set_codec(codec)
+    if equations is not None:
+        set_equation_cache(equations)
+
+
+def _index_file(source: Path) -> tp.Optional[str]:
+    """Record the labels of one file in the label store, return the error"""
+    from .shard import parse_shard
+
+    try:
+        info = parse_shard(source.read_text(), _WORKER_MACROS, cache=_WORKER_CACHE)
+        _WORKER_LABEL_STORE.update(source_key(source), info.labels)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _convert_file(source: Path, target: Path) -> BatchResult:
+    """Convert one file inside a worker process"""
+    start = time.perf_counter()
+    hits = _WORKER_CACHE.hits if _WORKER_CACHE is not None else 0
+    equations = get_equation_cache()
+    equation_hits, equation_misses = equations.hits, equations.misses
+    try:
+        text = source.read_text()
+        if _WORKER_ENGINE == "compact":
+            ast = parse_bytes(text, _WORKER_MACROS, cache=_WORKER_CACHE)
+            result = filter_ast(
+                ast, label_store=_WORKER_LABEL_STORE, source=source_key(source)
+            )
+            images = result.image_urls
+            markdown = ast_to_markdown(result.ast, writer=_WORKER_WRITER)
+        else:
+            doc = parse(text, _WORKER_MACROS, cache=_WORKER_CACHE)
+            attach(doc, _WORKER_LABEL_STORE, source_key(source))
+            doc = run_actions(doc, engine=_WORKER_ENGINE)
+            images = getattr(doc, "image_urls", ())
+            markdown = to_markdown(doc, writer=_WORKER_WRITER)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(markdown)
+    except Exception as e:
+        return BatchResult(
+            source,
+            target,
+            False,
+            0,
+            time.perf_counter() - start,
+            f"{type(e).__name__}: {e}",
+        )
+    return BatchResult(
+        source,
+        target,
+        True,
+        len(text.encode()),
+        time.perf_counter() - start,
+        cache_hit=_WORKER_CACHE is not None and _WORKER_CACHE.hits > hits,
+        images=tuple(images),
+        equation_hits=equations.hits - equation_hits,
+        equation_misses=equations.misses - equation_misses,
+    )
+
+
+def convert_batch(
+    inputs: tp.Iterable[str],
+    output_dir: tp.Union[str, Path],
+    macros: str = "",
+    jobs: int = None,
+    cache: ASTCache = None,
+    engine: str = "legacy",
+    writer: str = "pandoc",
+    label_store: LabelStore = None,
+) -> tp.Iterator[BatchResult]:
+    """Convert all inputs into ``output_dir`` using a pool of worker processes
+
+    Results are yielded in the order the conversions finish. With a label
+    store, the labels of all inputs are recorded before the conversions.
+    """
+    output_dir = Path(output_dir)
+    sources = collect_inputs(inputs)
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(
+            macros,
+            cache,
+            engine,
+            writer,
+            logging.getLogger().level,
+            get_backend(),
+            label_store,
+            get_codec(),
+            get_equation_cache(),
+        ),
+    ) as pool:
+        if label_store is not None:
+            paths = [src for src, _ in sources]
+            for src, error in zip(paths, pool.map(_index_file, paths)):
+                if error is not None:
+                    logger.warning(f"Failed to gather the labels of {src}: {error}")
+        futures = [
+            pool.submit(_convert_file, src, output_dir / rel.with_suffix(".md"))
+            for src, rel in sources
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    """Batch CLI Entry Point to Latex-to-Myst
+
+    This entry point is invoked in the command line as a console
+    script and can be invoked like::
+
+        $ latex2myst-batch chapters/ -o markdown/
+
+    You can see the complete set of options by typing::
+
+        $ latex2myst-batch -h
+    """
+    parser = argparse.ArgumentParser(description="Convert many LaTeX files to MyST")
+    parser.add_argument(
+        "inputs",
+        metavar="input",
+        type=str,
+        nargs="+",
+        help="Input LaTeX files, directories or glob patterns",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        required=True,
+        type=str,
+        help="Directory into which the input tree is mirrored",
+    )
+    parser.add_argument(
+        "-m",
+        "--macros",
+        dest="macro_files",
+        default=[],
+        type=str,
+        nargs="*",
+        help="Names of files of macros that you'd like to use",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=os.cpu_count(),
+        type=int,
+        help="Number of worker processes, default to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--copy-assets",
+        action="store_true",
+        help="Copy the images of the documents next to their markdown.",
+    )
+    parser.add_argument(
+        "--link-assets",
+        action="store_true",
+        help="Hardlink the images instead of copying them, implies --copy-assets.",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log)
+
+    check_pandoc(args)
+    backend_from_args(args)
+    codec_from_args(args)
+    equation_cache_from_args(args)
+    try:
+        macro_paths = [_validate_file(fname, ".tex") for fname in args.macro_files]
+        collect_inputs(args.inputs)
+    except RuntimeError as e:
+        parser.error(str(e))
+    macros = load_macros(macro_paths, default_macros=args.default_macros)
+    cache = cache_from_args(args)
+    label_store = label_store_from_args(args)
+
+    start = time.perf_counter()
+    n_ok = n_failed = n_assets_failed = total_size = 0
+    assets = []
+    equations = get_equation_cache()
+    for res in convert_batch(
+        args.inputs,
+        args.output_dir,
+        macros,
+        jobs=args.jobs,
+        cache=cache,
+        engine=args.engine,
+        writer=args.writer,
+        label_store=label_store,
+    ):
+        if cache is not None and res.ok:
+            # workers have their own copy of the cache counters
+            cache.hits += res.cache_hit
+            cache.misses += not res.cache_hit
+        equations.hits += res.equation_hits
+        equations.misses += res.equation_misses
+        if res.ok:
+            n_ok += 1
+            total_size += res.size
+            cached = " [cached]" if res.cache_hit else ""
+            print(f"[ok] {res.source} -> {res.target} ({res.seconds:.2f}s){cached}")
+            if args.copy_assets or args.link_assets:
+                assets += resolve_assets(
+                    res.images, res.source.parent, res.target.parent
+                )
+        else:
+            n_failed += 1
+            print(f"[failed] {res.source}: {res.error}")
+    elapsed = time.perf_counter() - start
+
+    if args.copy_assets or args.link_assets:
+        actions = collections.Counter(
+            res.action
+            for res in publish_assets(assets, args.output_dir, link=args.link_assets)
+        )
+        n_assets_failed = actions["failed"]
+        print(
+            f"Assets: {actions['copied']} copied, {actions['linked']} linked, "
+            f"{actions['unchanged']} unchanged, {actions['failed']} failed"
+        )
+    print(
+        f"Converted {n_ok}/{n_ok + n_failed} documents in {elapsed:.2f}s "
+        f"({n_ok / elapsed:.2f} docs/s, {total_size / 1e6 / elapsed:.2f} MB/s)"
+    )
+    if args.cache_stats and cache is not None:
+        print(format_stats(cache.stats()))
+    if args.cache_stats:
+        print(format_equation_stats(equations.stats()))
+    sys.exit(EXIT_FAILURE if n_failed or n_assets_failed else EXIT_OK)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""On-disk cache of the pandoc LaTeX reader output
+
+Parsing LaTeX with pandoc is the most expensive step of a conversion. The
+:py:class:`ASTCache` stores the pandoc JSON AST of a document, gzip-compressed,
+under a key derived from everything that affects the parse:
+
+- the LaTeX source of the document,
+- the macro preamble prepended to it,
+- the version of pandoc,
+- the version of this package.
+
+Entries are evicted least-recently-used first once the cache grows beyond
+``max_size`` bytes. The modification time of an entry is its last use.
+"""
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+import typing as tp
+from pathlib import Path
+from latex_to_myst import __version__
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 512 * 2**20  # bytes
+
+
+def default_cache_dir() -> Path:
+    """Cache directory following the XDG base directory specification"""
+    root = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(root) / "latex_to_myst"
+
+
+class ASTCache:
+    """Content-addressed cache of pandoc JSON ASTs
+
+    Arguments:
+        cache_dir: directory of the cache, created if it does not exist.
+          Defaults to :py:func:`default_cache_dir`.
+        max_size: maximum total size of the cache entries in bytes
+        pandoc_version: version of pandoc that produces the entries
+    """
+
+    suffix = ".json.gz"
+
+    def __init__(
+        self,
+        cache_dir: tp.Union[str, Path] = None,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        pandoc_version: tp.Tuple[int, ...] = (),
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_size = max_size
+        self.pandoc_version = tuple(pandoc_version)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text: str, macros: str = "") -> str:
+        """Hash of the document, the macros and the versions of the tools"""
+        h = hashlib.sha256()
+        for part in (
+            __version__,
+            ".".join(map(str, self.pandoc_version)),
+            macros,
+            text,
+        ):
+            data = part.encode()
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> tp.Optional[str]:
+        """Return the cached JSON AST or None"""
+        ast = self.get_bytes(key)
+        return None if ast is None else ast.decode("utf-8")
+
+    def get_bytes(self, key: str) -> tp.Optional[bytes]:
+        """Return the cached JSON AST encoded in UTF-8 or None"""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                ast = f.read()
+            os.utime(path)
+        except (OSError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ast
+
+    def put(self, key: str, ast: str) -> None:
+        """Store the JSON AST and evict old entries if the cache is too large
+
+        Failing to write to the cache is logged but never raised.
+        """
+        self.put_bytes(key, ast.encode("utf-8"))
+
+    def put_bytes(self, key: str, ast: bytes) -> None:
+        """Store the JSON AST encoded in UTF-8, see :py:meth:`put`"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(ast))
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+        self.evict()
+
+    def _entries(self) -> tp.List[tp.Tuple[float, int, Path]]:
+        entries = []
+        if not self.cache_dir.is_dir():
+            return entries
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the size limit is met"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        for _, _, path in self._entries():
+            path.unlink()
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        """Usage counters of this instance and the current cache contents"""
+        entries = self._entries()
+        return dict(
+            cache_dir=str(self.cache_dir),
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            entries=len(entries),
+            size=sum(size for _, size, _ in entries),
+            max_size=self.max_size,
+        )
+
+
+def format_stats(stats: tp.Dict[str, tp.Any]) -> str:
+    """Human readable one-line summary of :py:meth:`ASTCache.stats`"""
+    return (
+        f"Cache {stats['cache_dir']}: {stats['hits']} hits, "
+        f"{stats['misses']} misses, {stats['evictions']} evictions, "
+        f"{stats['entries']} entries, {stats['size'] / 2**20:.1f}/"
+        f"{stats['max_size'] / 2**20:.1f} MB"
+    )
@@ -0,0 +1,139 @@
+"""Snapshots of the document between the stages of a conversion
+
+Tuning one filter on a large document means re-running the pandoc parse and
+every filter before it on each attempt. A :py:class:`CheckpointStore` keeps the
+document after every stage of :py:func:`latex_to_myst.pipeline.run_actions`:
+
+- ``parse``, the output of the pandoc LaTeX reader,
+- every action of :py:data:`latex_to_myst.main.ACTIONS` by name, e.g. ``Math``,
+  once it ran successfully.
+
+A later conversion of the same input can resume after any of them and only
+run the remaining stages.
+
+The snapshots are pickled :py:class:`panflute.Doc` instances rather than JSON
+ASTs: the state ``prepare`` attaches to the document (the label index, the
+levels of the directives, ...) is keyed by the elements themselves and only
+survives a round-trip that preserves their identity. Pickles execute code when
+loaded, only resume from checkpoints you wrote yourself.
+
+Checkpoints live in a directory per input, named by the hash of the source,
+the macros and the versions of pandoc and of this package.
+"""
+import os
+import pickle
+import shutil
+import hashlib
+import logging
+import tempfile
+import typing as tp
+from pathlib import Path
+import panflute as pf
+from latex_to_myst import __version__
+from .cache import default_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# stage of the document parsed by pandoc, before any filter
+PARSE_STAGE = "parse"
+
+
+def stage_names() -> tp.Tuple[str, ...]:
+    """Stages a conversion can resume after, in order"""
+    from .main import ACTIONS
+
+    return (PARSE_STAGE,) + tuple(name for name, _ in ACTIONS)
+
+
+class CheckpointStore:
+    """Directory of document snapshots per input and stage
+
+    Arguments:
+        directory: directory of the checkpoints, created if it does not exist.
+          Defaults to ``checkpoints`` in
+          :py:func:`latex_to_myst.cache.default_cache_dir`.
+        pandoc_version: version of pandoc that parses the inputs
+    """
+
+    suffix = ".pickle"
+
+    def __init__(
+        self,
+        directory: tp.Union[str, Path] = None,
+        pandoc_version: tp.Tuple[int, ...] = (),
+    ):
+        self.directory = (
+            Path(directory) if directory else default_cache_dir() / "checkpoints"
+        )
+        self.pandoc_version = tuple(pandoc_version)
+
+    def key(self, text: str, macros: str = "") -> str:
+        """Hash of the document, the macros and the versions of the tools"""
+        h = hashlib.sha256()
+        for part in (
+            __version__,
+            ".".join(map(str, self.pandoc_version)),
+            macros,
+            text,
+        ):
+            data = part.encode()
+            h.update(len(data).to_bytes(8, "little"))
+            h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key: str, stage: str) -> Path:
+        return self.directory / key / f"{stage}{self.suffix}"
+
+    def save(self, key: str, stage: str, doc: pf.Doc) -> None:
+        """Store the document after stage
+
+        The checkpoints of the later stages are removed, they no longer follow
+        from this one. Failing to write the checkpoint is logged but never
+        raised.
+        """
+        path = self._path(key, stage)
+        names = stage_names()
+        for later in names[names.index(stage) + 1 :] if stage in names else ():
+            try:
+                self._path(key, later).unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            data = pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError, RecursionError) as e:
+            logger.warning(f"Failed to write checkpoint {stage} of {key}: {e}")
+            return
+        logger.info(f"Saved checkpoint {stage} to {path}")
+
+    def load(self, key: str, stage: str) -> pf.Doc:
+        """Return the document after stage
+
+        Raises:
+            FileNotFoundError: if there is no checkpoint of stage for the input
+        """
+        path = self._path(key, stage)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No checkpoint of stage '{stage}' for this input in "
+                f"{self.directory}, convert it with --checkpoint first."
+            ) from None
+        logger.info(f"Resuming from checkpoint {stage} in {path}")
+        return pickle.loads(data)
+
+    def stages(self, key: str) -> tp.List[str]:
+        """Stages with a checkpoint for the input, in order"""
+        return [stage for stage in stage_names() if self._path(key, stage).exists()]
+
+    def clear(self, key: str = None) -> None:
+        """Remove the checkpoints of the input, or all checkpoints"""
+        shutil.rmtree(
+            self.directory if key is None else self.directory / key,
+            ignore_errors=True,
+        )
@@ -1,9 +1,38 @@
 import io
+import sys
+import time
+import functools
+import contextlib
 import argparse
 import logging
-import panflute as pf
+import typing as tp
 from pathlib import Path
-from .main import ACTIONS, prepare, finalize
+from .cache import ASTCache, DEFAULT_CACHE_SIZE, format_stats
+from .profiling import stage
+from .pipeline import (
+    ENGINES,
+    WRITERS,
+    ast_to_markdown,
+    check_pandoc_version,
+    filter_ast,
+    load_macros,
+    pandoc_version,
+    parse,
+    parse_bytes,
+    run_actions,
+    write_output,
+)
+
+# file name reading from stdin or writing to stdout
+STDIO = "-"
+
+EXIT_OK = 0
+# the conversion failed
+EXIT_FAILURE = 1
+# invalid arguments or files, like argparse
+EXIT_USAGE = 2
+# pandoc is missing or too old
+EXIT_PANDOC = 3
 
 
 def _validate_file(path: str, file_ext: str, check_exist: bool = True) -> str:
@@ -19,6 +48,264 @@ def _validate_file(path: str, file_ext: str, check_exist: bool = True) -> str:
     return path
 
 
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options shared by all command line entry points"""
+    # the modules of the options are imported by the *_from_args helpers
+    from .backend import BACKENDS
+    from .codec import CODECS
+    from .equations import DEFAULT_EQUATION_CACHE_SIZE
+
+    parser.add_argument(
+        "-l",
+        "--log",
+        default="CRITICAL",
+        type=str,
+        help="Logging level, default to None which turns off logging.",
+    )
+    parser.add_argument(
+        "-dm",
+        "--default_macros",
+        type=bool,
+        default=True,
+        help="Whether to use default macro.",
+    )
+    parser.add_argument(
+        "--engine",
+        default="legacy",
+        choices=ENGINES,
+        help=(
+            "Run the filters as one pass each (legacy), in a single traversal "
+            "(fused) or on the JSON AST (compact)."
+        ),
+    )
+    parser.add_argument(
+        "--writer",
+        default="pandoc",
+        choices=WRITERS,
+        help="Write the markdown with pandoc or natively without a pandoc process.",
+    )
+    parser.add_argument(
+        "--pandoc-backend",
+        default="subprocess",
+        choices=BACKENDS,
+        help="Run pandoc as a subprocess per conversion or as a long-lived server.",
+    )
+    parser.add_argument(
+        "--pandoc-server",
+        default=None,
+        type=str,
+        help="URL of a running pandoc server to use, e.g. http://localhost:3030.",
+    )
+    parser.add_argument(
+        "--json-codec",
+        default="auto",
+        choices=CODECS,
+        help="JSON library of the pandoc AST, auto uses orjson if installed.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        type=str,
+        help="Directory of the parsed AST cache, default to ~/.cache/latex_to_myst.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default=DEFAULT_CACHE_SIZE // 2**20,
+        type=int,
+        help="Maximum size of the parsed AST cache in MB.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run the pandoc LaTeX reader instead of using the cache.",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Report cache usage at the end of the conversion.",
+    )
+    parser.add_argument(
+        "--equation-cache-size",
+        default=DEFAULT_EQUATION_CACHE_SIZE,
+        type=int,
+        help="Number of distinct display equations whose label and content are "
+        "memoised across the documents of a process, 0 disables it.",
+    )
+    parser.add_argument(
+        "--label-db",
+        default=None,
+        type=str,
+        help="SQLite database of the labels of all documents of a book, to "
+        "resolve references across documents.",
+    )
+    parser.add_argument(
+        "--startup-profile",
+        action="store_true",
+        help="Report where the startup time goes (imports and pandoc probe).",
+    )
+
+
+def cache_from_args(args: argparse.Namespace) -> tp.Optional[ASTCache]:
+    """Create the parsed AST cache configured on the command line"""
+    if args.no_cache:
+        return None
+    return ASTCache(
+        args.cache_dir,
+        max_size=args.cache_size * 2**20,
+        pandoc_version=pandoc_version(),
+    )
+
+
+def label_store_from_args(args: argparse.Namespace) -> tp.Optional["LabelStore"]:
+    """Open the label database configured on the command line"""
+    if args.label_db is None:
+        return None
+    from .labelstore import LabelStore
+
+    return LabelStore(args.label_db)
+
+
+def backend_from_args(args: argparse.Namespace) -> None:
+    """Use the pandoc backend configured on the command line"""
+    from .backend import create_backend, set_backend
+
+    set_backend(create_backend(args.pandoc_backend, url=args.pandoc_server))
+
+
+def codec_from_args(args: argparse.Namespace) -> None:
+    """Use the JSON codec configured on the command line"""
+    from .codec import create_codec, set_codec
+
+    try:
+        set_codec(create_codec(args.json_codec))
+    except ModuleNotFoundError as e:
+        logging.warning(f"{e} Using the json module.")
+        set_codec(create_codec("json"))
+
+
+def equation_cache_from_args(args: argparse.Namespace) -> None:
+    """Use the equation cache configured on the command line"""
+    from .equations import EquationCache, set_equation_cache
+
+    set_equation_cache(EquationCache(args.equation_cache_size))
+
+
+def checkpoints_from_args(
+    args: argparse.Namespace, parser: argparse.ArgumentParser
+) -> tp.Optional["CheckpointStore"]:
+    """Open the checkpoints of ``--checkpoint`` and ``--resume-from``"""
+    if not args.checkpoint and args.resume_from is None:
+        return None
+    from .checkpoint import PARSE_STAGE, CheckpointStore, stage_names
+
+    if args.watch or args.jobs > 1:
+        parser.error("--checkpoint and --resume-from need a serial conversion.")
+    if args.resume_from not in (None,) + stage_names():
+        parser.error(f"--resume-from must be one of {stage_names()}.")
+    if args.resume_from not in (None, PARSE_STAGE) and args.engine != "legacy":
+        parser.error("--resume-from a filter needs the legacy engine.")
+    return CheckpointStore(args.checkpoint_dir, pandoc_version())
+
+
+def check_pandoc(args: argparse.Namespace) -> None:
+    """Check the pandoc version and report the startup profile if requested"""
+    start = time.perf_counter()
+    try:
+        check_pandoc_version()
+    except (OSError, ModuleNotFoundError) as e:
+        logging.critical(f"Pandoc is not available: {e}")
+        sys.exit(EXIT_PANDOC)
+    if args.startup_profile:
+        from .startup import startup_report
+
+        report = startup_report({"Pandoc version": time.perf_counter() - start})
+        print(report, file=sys.stderr)
+
+
+def setup_logging(level: str) -> None:
+    """Configure logging for the command line entry points"""
+    logging.basicConfig(
+        format="[%(levelname)s] %(message)s", level=getattr(logging, level.upper())
+    )
+
+
+def _convert(
+    args: argparse.Namespace,
+    text: str,
+    macros: str,
+    cache: tp.Optional[ASTCache],
+    label_store: "LabelStore" = None,
+    source: str = STDIO,
+    checkpoints: "CheckpointStore" = None,
+) -> str:
+    """Convert the input as configured on the command line
+
+    With checkpoints, the document is saved after every stage with
+    ``--checkpoint`` and loaded from the stage of ``--resume-from``.
+    """
+    if args.jobs > 1:
+        from .shard import convert_sharded
+
+        return convert_sharded(
+            text,
+            macros,
+            jobs=args.jobs,
+            cache=cache,
+            engine=args.engine,
+            writer=args.writer,
+            label_store=label_store,
+            source=source,
+        )
+
+    from .checkpoint import PARSE_STAGE
+    from .labelstore import attach
+
+    profiler = None
+    if args.profile:
+        from .profiling import Profiler
+
+        profiler = Profiler(args.profile_stats)
+    save = None
+    if checkpoints is not None:
+        key = checkpoints.key(text, macros)
+        if args.checkpoint:
+            save = functools.partial(checkpoints.save, key)
+    with profiler or contextlib.nullcontext():
+        if args.engine == "compact" and args.resume_from is None and save is None:
+            # the JSON AST is filtered without a panflute document
+            with stage(profiler, "parse"):
+                ast = parse_bytes(text, macros, cache=cache)
+            result = filter_ast(
+                ast, profiler=profiler, label_store=label_store, source=source
+            )
+            with stage(profiler, "write"):
+                markdown = ast_to_markdown(result.ast, writer=args.writer)
+        else:
+            with stage(profiler, "parse"):
+                if args.resume_from is None:
+                    doc = parse(text, macros, cache=cache)
+                    if save is not None:
+                        save(PARSE_STAGE, doc)
+                else:
+                    doc = checkpoints.load(key, args.resume_from)
+                if args.resume_from in (None, PARSE_STAGE):
+                    doc = attach(doc, label_store, source)
+            doc = run_actions(
+                doc,
+                engine=args.engine,
+                profiler=profiler,
+                checkpoint=save if args.engine == "legacy" else None,
+                resume_from=args.resume_from,
+            )
+            with stage(profiler, "write"):
+                with io.StringIO() as stream:
+                    write_output(doc, stream, writer=args.writer)
+                    markdown = stream.getvalue()
+    if profiler is not None:
+        profiler.write(args.profile)
+    return markdown
+
+
 def main():
     """Main CLI Entry Point to Latex-to-Myst
 
@@ -27,6 +314,16 @@ def main():
 
         $ latex2myst my_latex_file.tex my_new_markdown.md
 
+    Use ``-`` as input or output to read from stdin or write to stdout, e.g.
+    in a shell pipeline::
+
+        $ cat my_latex_file.tex | latex2myst - - > my_new_markdown.md
+
+    Logs are written to stderr. The exit code is :py:data:`EXIT_OK` on
+    success, :py:data:`EXIT_FAILURE` if the conversion failed,
+    :py:data:`EXIT_USAGE` for invalid arguments and :py:data:`EXIT_PANDOC` if
+    pandoc is missing or too old.
+
     You can see the complete set of options by typing::
 
         $ latex2myst -h
@@ -40,78 +337,134 @@ def main():
         nargs="*",
         help="Names of files of macros that you'd like to use",
     )
-    parser.add_argument("file_in", metavar="input", type=str, help="Input LaTeX file")
     parser.add_argument(
-        "file_out", metavar="output", type=str, help="Output Markdown file"
+        "file_in", metavar="input", type=str, help="Input LaTeX file, - for stdin"
     )
     parser.add_argument(
-        "-l",
-        "--log",
-        default="CRITICAL",
+        "file_out",
+        metavar="output",
         type=str,
-        help="Logging level, default to None which turns off logging.",
+        help="Output Markdown file, - for stdout",
     )
     parser.add_argument(
-        "-dm",
-        "--default_macros",
-        type=bool,
-        default=True,
-        help="Whether to use default macro.",
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Convert top-level chapters or sections in parallel processes.",
     )
-    args = parser.parse_args()
-    logging.basicConfig(
-        format="[%(levelname)s] %(message)s", level=getattr(logging, args.log.upper())
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Rebuild the output whenever the input or a file it includes changes.",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        type=str,
+        help="Write the time and calls of every conversion stage to this JSON file.",
+    )
+    parser.add_argument(
+        "--profile-stats",
+        default=None,
+        type=str,
+        help="Directory to write a cProfile dump of every stage to, with --profile.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Save the document after the pandoc parse and after every filter.",
+    )
+    parser.add_argument(
+        "--resume-from",
+        default=None,
+        type=str,
+        metavar="STAGE",
+        help="Load the document saved after this stage (parse or a filter name) "
+        "with --checkpoint and run only the remaining filters.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=None,
+        type=str,
+        help="Directory of the checkpoints, default to "
+        "~/.cache/latex_to_myst/checkpoints.",
     )
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args.log)
 
-    if pf.tools.PandocVersion().version < (2, 11):
-        raise ModuleNotFoundError("Pandoc >= 2.11 required.")
+    check_pandoc(args)
+    backend_from_args(args)
+    codec_from_args(args)
+    equation_cache_from_args(args)
 
-    with open(Path(__file__).parent / "macros.tex", "r") as f:
-        default_macros = f.read()
-    macros = default_macros if args.default_macros else ""
-    if args.macro_files is not None:
+    try:
         macro_paths = []
-        if isinstance(args.macro_files, str):
-            macro_paths = [args.macro_files]
-        else:
-            macro_paths = args.macro_files
-
-        for fname in macro_paths:
-            fname = _validate_file(fname, ".tex")
-            with open(Path(fname), "r") as f:
-                macros += f.read()
-
-    fi = Path(_validate_file(args.file_in, ".tex"))
-    fo = Path(_validate_file(args.file_out, ".md", check_exist=False))
+        if args.macro_files is not None:
+            if isinstance(args.macro_files, str):
+                macro_paths = [args.macro_files]
+            else:
+                macro_paths = args.macro_files
+            macro_paths = [_validate_file(fname, ".tex") for fname in macro_paths]
+        fi = args.file_in
+        if fi != STDIO:
+            fi = Path(_validate_file(fi, ".tex"))
+        fo = args.file_out
+        if fo != STDIO:
+            fo = Path(_validate_file(fo, ".md", check_exist=False))
+    except RuntimeError as e:
+        parser.error(str(e))
+    if args.watch and STDIO in (fi, fo):
+        parser.error("--watch needs an input and an output file.")
+    checkpoints = checkpoints_from_args(args, parser)
+    macros = load_macros(macro_paths, default_macros=args.default_macros)
+    cache = cache_from_args(args)
+    label_store = label_store_from_args(args)
 
     logging.info(f"Parsing Input File {fi}")
     logging.info(f"Additional Macros Provided: {macro_paths}")
     logging.info(f"Using Default Macros: {args.default_macros}")
     logging.debug(f"Macros Used\n{macros} \n")
-    with open(fi, "r") as input_stream, open(fo, "w") as output_stream:
-        doc = pf.convert_text(
-            macros + input_stream.read(),
-            input_format="latex",
-            output_format="panflute",
-            standalone=True,
-        )
-        for n, (_name, _action) in enumerate(ACTIONS):
-            logging.info(f"Running {n+1}/{len(ACTIONS)} Filter: {_name}")
-            try:
-                doc = pf.run_filter(
-                    _action,
-                    doc=doc,
-                    prepare=prepare if n == 0 else None,
-                    finalize=finalize if n == len(ACTIONS) - 1 else None,
-                )
-            except Exception as e:
-                logging.error("Parsing failed")
-
-        output_stream.write(
-            pf.convert_text(
-                doc, input_format="panflute", output_format="markdown", standalone=True
-            )
+    if args.profile and (args.watch or args.jobs > 1):
+        logging.warning("--profile is only supported for serial conversions.")
+    if args.watch and label_store is not None:
+        logging.warning("--label-db is not supported with --watch.")
+    if args.watch:
+        from .watch import Watcher
+
+        watcher = Watcher(
+            fi, fo, macros, cache=cache, engine=args.engine, writer=args.writer
         )
+        watcher.watch()
+        sys.exit(EXIT_OK)
+
+    if fi == STDIO:
+        text = sys.stdin.read()
+    else:
+        text = fi.read_text()
+    from .labelstore import source_key
+
+    try:
+        source = STDIO if fi == STDIO else source_key(fi)
+        markdown = _convert(args, text, macros, cache, label_store, source, checkpoints)
+    except Exception as e:
+        logging.critical(f"Conversion failed: {type(e).__name__}: {e}")
+        sys.exit(EXIT_FAILURE)
+    if fo == STDIO:
+        sys.stdout.write(markdown)
+        sys.stdout.flush()
+    else:
+        fo.write_text(markdown)
+
+    if args.cache_stats and cache is not None:
+        print(format_stats(cache.stats()), file=sys.stderr)
+    if args.cache_stats:
+        from .equations import format_stats as format_equation_stats
+        from .equations import get_equation_cache
+
+        print(format_equation_stats(get_equation_cache().stats()), file=sys.stderr)
+    sys.exit(EXIT_OK)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,312 @@
+"""Compact tree of a pandoc JSON AST
+
+A :py:class:`panflute.Doc` costs several Python objects per node (the element,
+the list containers of its children, the dictionary of its attributes) and
+``prepare`` walks it three times to index its images, levels and labels. The
+passes that only read the document, like gathering the labels and images of
+the shards in :py:mod:`latex_to_myst.shard`, use a :py:class:`Node` tree
+instead: one slotted object per element, decoded straight from the JSON, with
+the number of images below every node counted while decoding.
+
+The nodes keep the JSON content of the elements, so a tree the filters of
+:py:mod:`latex_to_myst.compact_engine` rewrote is encoded back to JSON by
+:py:func:`dumps`.
+"""
+import sys
+import json
+import typing as tp
+import logging
+from latex_to_myst.equations import prepare_equation
+from latex_to_myst.helpers import SUPPORTED_AMSTHM_BLOCKS
+from latex_to_myst.labels import UNLABELLED_EQUATION, LabelIndex, resolve
+
+logger = logging.getLogger(__name__)
+
+# index of the attributes in the content of the elements that have them
+_ATTR_INDEX = {
+    "Header": 1,
+    "Div": 0,
+    "Span": 0,
+    "Image": 0,
+    "Link": 0,
+    "Code": 0,
+    "CodeBlock": 0,
+    "Table": 0,
+    "Figure": 0,
+}
+# elements whose content is a list of an attribute or format and a text
+_TEXT = frozenset(["Code", "CodeBlock", "RawInline", "RawBlock"])
+# tagged JSON objects that are values rather than elements
+_VALUES = frozenset(
+    [
+        "DisplayMath",
+        "InlineMath",
+        "SingleQuote",
+        "DoubleQuote",
+        "AlignLeft",
+        "AlignRight",
+        "AlignCenter",
+        "AlignDefault",
+        "ColWidth",
+        "ColWidthDefault",
+        "AuthorInText",
+        "SuppressAuthor",
+        "NormalCitation",
+        "DefaultStyle",
+        "Example",
+        "Decimal",
+        "LowerRoman",
+        "UpperRoman",
+        "LowerAlpha",
+        "UpperAlpha",
+        "DefaultDelim",
+        "Period",
+        "OneParen",
+        "TwoParens",
+    ]
+)
+# elements whose content is the list of their children
+_INLINES = frozenset(
+    [
+        "Para",
+        "Plain",
+        "Emph",
+        "Underline",
+        "Strong",
+        "Strikeout",
+        "Superscript",
+        "Subscript",
+        "SmallCaps",
+        "BlockQuote",
+        "Note",
+    ]
+)
+_MATH = frozenset(["DisplayMath", "InlineMath"])
+_AMSTHM = frozenset(SUPPORTED_AMSTHM_BLOCKS)
+_EMPTY = ()
+_SEPARATORS = (",", ":")
+
+Attr = tp.Tuple[str, tp.Tuple[str, ...], tp.Tuple[tp.Tuple[str, str], ...]]
+
+
+class Node:
+    """Element of a compact tree
+
+    Arguments:
+        tag: pandoc type of the element, e.g. ``Para``, ``DisplayMath`` or
+          ``InlineMath`` for math
+        content: content of the element in the JSON, with its elements decoded
+          as nodes, the text for math and None for elements without content
+    """
+
+    __slots__ = ("tag", "content", "images")
+
+    def __init__(self, tag: str, content: tp.Any = None):
+        self.tag = tag
+        self.content = content
+        # number of images in the element, itself included, when decoded
+        images = tag == "Image"
+        for child in self.children:
+            images += child.images
+        self.images = images
+
+    @property
+    def children(self) -> tp.Sequence["Node"]:
+        """Child elements in the order of the JSON"""
+        content = self.content
+        if not isinstance(content, list):
+            return _EMPTY
+        if self.tag in _INLINES:
+            return content
+        children = []
+        _children(content, children)
+        return children
+
+    @property
+    def attr(self) -> tp.Optional[Attr]:
+        """Identifier, classes and key-value attributes, None if it has none"""
+        i = _ATTR_INDEX.get(self.tag)
+        return None if i is None else _attr(self.content[i])
+
+    @property
+    def identifier(self) -> str:
+        i = _ATTR_INDEX.get(self.tag)
+        return "" if i is None else self.content[i][0]
+
+    @property
+    def classes(self) -> tp.Tuple[str, ...]:
+        i = _ATTR_INDEX.get(self.tag)
+        return _EMPTY if i is None else tuple(self.content[i][1])
+
+    @property
+    def attributes(self) -> tp.Tuple[tp.Tuple[str, str], ...]:
+        i = _ATTR_INDEX.get(self.tag)
+        return _EMPTY if i is None else tuple(map(tuple, self.content[i][2]))
+
+    @property
+    def text(self) -> str:
+        """Text of ``Str``, math, code and raw elements"""
+        if isinstance(self.content, str):
+            return self.content
+        if self.tag in _TEXT:
+            return self.content[1]
+        return ""
+
+    def __repr__(self) -> str:
+        return f"Node({self.tag}, {len(self.children)} children)"
+
+
+def _children(value: tp.Any, out: tp.List[Node]) -> None:
+    """Gather the nodes in a decoded JSON value into out, in order"""
+    for item in value.values() if isinstance(value, dict) else value:
+        if isinstance(item, Node):
+            out.append(item)
+        elif isinstance(item, (list, dict)):
+            _children(item, out)
+
+
+def _attr(value: tp.List[tp.Any]) -> tp.Optional[Attr]:
+    identifier, classes, attributes = value
+    if not (identifier or classes or attributes):
+        return None
+    return identifier, tuple(classes), tuple(map(tuple, attributes))
+
+
+def _hook(obj: tp.Dict[str, tp.Any]) -> tp.Any:
+    """Decode a JSON object into a node, its elements are decoded already"""
+    tag = obj.get("t")
+    if tag is None or tag in _VALUES or "blocks" in obj:
+        # the document, a citation or a value like an alignment
+        return obj
+    content = obj.get("c")
+    if tag == "Math":
+        return Node(sys.intern(content[0]["t"]), content[1])
+    return Node(sys.intern(tag), content)
+
+
+def _encode(node: Node) -> tp.Dict[str, tp.Any]:
+    """Encode a node into a JSON object, see :py:func:`dumps`"""
+    if node.tag in _MATH:
+        return {"t": "Math", "c": [{"t": node.tag}, node.content]}
+    if node.content is None:
+        return {"t": node.tag}
+    return {"t": node.tag, "c": node.content}
+
+
+def loads(ast: tp.Union[str, bytes]) -> tp.Dict[str, tp.Any]:
+    """Decode a pandoc JSON AST, with its elements decoded as nodes"""
+    return json.loads(ast, object_hook=_hook)
+
+
+def dumps(doc: tp.Dict[str, tp.Any]) -> bytes:
+    """Encode a document decoded by :py:func:`loads` into a JSON AST
+
+    The nodes may be mixed with JSON objects of elements, like those of
+    :py:meth:`panflute.Element.to_json`.
+    """
+    return json.dumps(
+        doc, default=_encode, separators=_SEPARATORS, ensure_ascii=False
+    ).encode()
+
+
+def load(ast: tp.Union[str, bytes]) -> Node:
+    """Decode a pandoc JSON AST into a ``Pandoc`` node
+
+    The children of the node are the elements of the metadata followed by the
+    blocks.
+    """
+    return root(loads(ast))
+
+
+def root(doc: tp.Dict[str, tp.Any]) -> Node:
+    """``Pandoc`` node of a document decoded by :py:func:`loads`"""
+    children = []
+    _children(doc.get("meta", {}), children)
+    _children(doc["blocks"], children)
+    return Node("Pandoc", children)
+
+
+def walk(node: Node) -> tp.Iterator[Node]:
+    """Yield the node and its descendants, children first"""
+    stack = [(node, False)]
+    while stack:
+        n, expanded = stack.pop()
+        children = _EMPTY if expanded else n.children
+        if not children:
+            yield n
+            continue
+        stack.append((n, True))
+        stack.extend((c, False) for c in reversed(children))
+
+
+def get_element_type(node: Node) -> tp.Optional[str]:
+    """Element type, see :py:func:`latex_to_myst.helpers.get_element_type`"""
+    tag = node.tag
+    if tag == "Image":
+        return "figure"
+    if tag == "Para" and node.images > 1:
+        return "subfigures"
+    if tag == "DisplayMath":
+        return "displaymath"
+    if tag == "Div" and not _AMSTHM.isdisjoint(node.classes):
+        return "amsthm"
+    if tag == "Header":
+        return "header"
+    return None
+
+
+def build_label_index(root: Node) -> LabelIndex:
+    """Index the labels of a compact tree
+
+    The same as :py:func:`latex_to_myst.labels.build_label_index`, with the
+    compact nodes as the labelled elements.
+    """
+    index = LabelIndex()
+    for node in walk(root):
+        if node.tag == "Link":
+            index.references.update(
+                value for key, value in node.attributes if key == "reference"
+            )
+        if node.identifier:
+            label = node.identifier
+            element_type = get_element_type(node)
+        elif node.tag == "DisplayMath":
+            label = prepare_equation(node.text).label or UNLABELLED_EQUATION
+            element_type = "displaymath"
+        else:
+            continue
+        if label in index.elements and label != UNLABELLED_EQUATION:
+            index.duplicates.add(label)
+        index.elements[label] = node
+        index.labels[label] = resolve(element_type)
+    if index.duplicates:
+        logger.warning(f"Labels defined more than once: {sorted(index.duplicates)}")
+    return index
+
+
+def count_substitutions(root: Node) -> int:
+    """Number of images the figure filter numbers as subfigure substitutions
+
+    Like :py:mod:`latex_to_myst.figures`, a ``Para`` with several images
+    substitutes its direct child images and a ``Table`` with several images
+    all the images left in it, the innermost subplots first. Both leave no
+    image behind for their ancestors.
+    """
+    total = 0
+    # images of the visited nodes that are not substituted yet
+    left = {}
+    for node in walk(root):
+        images = (node.tag == "Image") + sum(left.pop(c, 0) for c in node.children)
+        if images > 1 and node.tag == "Para":
+            total += sum(c.tag == "Image" for c in node.children)
+            images = 0
+        elif images > 1 and node.tag == "Table":
+            total += images
+            images = 0
+        left[node] = images
+    return total
+
+
+def count(root: Node) -> int:
+    """Number of nodes in the tree"""
+    return sum(1 for _ in walk(root))
@@ -0,0 +1,337 @@
+"""Filters on the compact tree of :py:mod:`latex_to_myst.compact`
+
+The ``compact`` engine runs the filters of :py:data:`latex_to_myst.main.ACTIONS`
+on a JSON AST decoded by :py:func:`latex_to_myst.compact.loads`, and encodes
+the result back to JSON, without building a :py:class:`panflute.Doc` of the
+whole document:
+
+- the elements the filters rewrite as a whole, the divs with classes and the
+  blocks with images, are converted to panflute one at a time and run through
+  the filters by :py:class:`latex_to_myst.engine.FusedEngine`,
+- display math, links and the rules of :py:mod:`latex_to_myst.basic` that
+  depend on the siblings of an element (isolated labels, headers, words
+  before references) are rewritten on the nodes directly,
+- the metadata is a panflute document on its own, which also holds the state
+  of the filters, e.g. the label index built from the compact tree.
+
+The output is the same as the one of the legacy engine. Documents the engine
+does not support (e.g. a header with images) are converted by the legacy
+engine instead.
+"""
+import json
+import typing as tp
+import logging
+import panflute as pf
+from panflute.elements import from_json
+from . import compact
+from .basic import is_isolated_label
+from .codec import dump_doc, load_doc
+from .engine import FusedEngine
+from .equations import prepare_equation
+from .helpers import count_images, directive_levels
+from .hyperlink import reference
+from .labelstore import ANONYMOUS_SOURCE, LabelStore, attach
+from .main import ACTIONS, insert_section_labels, prepare
+
+logger = logging.getLogger(__name__)
+
+# blocks made of blocks, whose images are converted with the blocks holding them
+_CONTAINERS = frozenset(["BlockQuote", "BulletList", "OrderedList", "Div"])
+# blocks without content, see basic.is_isolated_label
+_NO_CONTENT = frozenset(["CodeBlock", "RawBlock", "HorizontalRule", "Null"])
+
+
+class Unsupported(Exception):
+    """The document cannot be converted by the compact engine"""
+
+
+class CompactResult(tp.NamedTuple):
+    """Document filtered by :py:class:`CompactEngine`
+
+    Arguments:
+        ast: the pandoc JSON AST, encoded in UTF-8
+        image_urls: urls of the images, like ``doc.image_urls``
+    """
+
+    ast: bytes
+    image_urls: tp.List[str]
+
+
+class CompactEngine:
+    """Run the filters on the compact tree of a JSON AST
+
+    Arguments:
+        actions: the filters, default to :py:data:`latex_to_myst.main.ACTIONS`,
+          e.g. wrapped by a profiler. The actions are looked up by name.
+    """
+
+    def __init__(self, actions: tp.Sequence[tp.Tuple[str, tp.Callable]] = None):
+        actions = ACTIONS if actions is None else tuple(actions)
+        if [name for name, _ in actions] != [name for name, _ in ACTIONS]:
+            raise ValueError("The compact engine only runs the filters of ACTIONS.")
+        self.actions = actions
+
+    def run(
+        self,
+        ast: tp.Union[str, bytes],
+        label_store: LabelStore = None,
+        source: str = ANONYMOUS_SOURCE,
+        external_labels: tp.Dict[str, tp.Optional[str]] = None,
+        substitutions_offset: int = 0,
+    ) -> CompactResult:
+        """Filter a JSON AST
+
+        The label store, external labels and substitution offset are the ones
+        of :py:func:`latex_to_myst.labelstore.attach` and
+        :py:mod:`latex_to_myst.shard`.
+        """
+        state = dict(
+            external_labels=external_labels, substitutions_offset=substitutions_offset
+        )
+        try:
+            doc, tree = _load(ast, label_store, source, **state)
+            return _Conversion(self.actions, doc).run(tree)
+        except Unsupported as e:
+            logger.info(f"Using the legacy engine: {e}")
+        except Exception as e:
+            logger.warning(
+                f"Compact engine failed, using the legacy engine: "
+                f"{type(e).__name__}: {e}"
+            )
+        # the filters are imported by the pipeline
+        from .pipeline import run_actions
+
+        doc = attach(load_doc(ast), label_store, source)
+        _set_state(doc, **state)
+        doc = run_actions(doc, actions=self.actions)
+        return CompactResult(dump_doc(doc), getattr(doc, "image_urls", []))
+
+
+def _set_state(
+    doc: pf.Doc,
+    external_labels: tp.Dict[str, tp.Optional[str]] = None,
+    substitutions_offset: int = 0,
+) -> None:
+    if external_labels is not None:
+        doc.external_labels = external_labels
+    if substitutions_offset:
+        doc.substitutions_offset = substitutions_offset
+
+
+def _load(
+    ast: tp.Union[str, bytes], label_store: LabelStore, source: str, **state
+) -> tp.Tuple[pf.Doc, tp.Dict[str, tp.Any]]:
+    """Decode the compact tree, and a document of its metadata"""
+    tree = compact.loads(ast)
+    meta = {"pandoc-api-version": tree["pandoc-api-version"], "meta": tree["meta"]}
+    doc = attach(load_doc(compact.dumps({**meta, "blocks": []})), label_store, source)
+    _set_state(doc, **state)
+    prepare(doc, compact.build_label_index(compact.root(tree)))
+    return doc, tree
+
+
+def _element(node: compact.Node) -> pf.Element:
+    """Convert a node to panflute"""
+    return json.loads(compact.dumps(node), object_hook=from_json)
+
+
+def _lists(value: tp.Any, out: tp.List[list]) -> None:
+    """Gather the lists of elements in the content of a node"""
+    if isinstance(value, dict):
+        # a citation
+        value = value.values()
+    elif not isinstance(value, list):
+        return
+    elif value and isinstance(value[0], (compact.Node, pf.Element)):
+        out.append(value)
+        return
+    for item in value:
+        if isinstance(item, (list, dict)):
+            _lists(item, out)
+
+
+def _is_link(item: tp.Any) -> bool:
+    if isinstance(item, compact.Node):
+        return item.tag == "Link"
+    return isinstance(item, pf.Link)
+
+
+def _raw_block(text: str) -> compact.Node:
+    return compact.Node("RawBlock", ["markdown", text])
+
+
+def _raw_inline(text: str) -> compact.Node:
+    return compact.Node("RawInline", ["markdown", text])
+
+
+def _display_math(node: compact.Node) -> compact.Node:
+    """The span of :py:func:`latex_to_myst.math.create_displaymath`
+
+    Math has no children, so its directive is at level 1.
+    """
+    equation = prepare_equation(node.content)
+    label = f":label: {equation.label}\n" if equation.label is not None else ""
+    content = [
+        compact.Node("Str", "\n"),
+        compact.Node("SoftBreak"),
+        _raw_inline("```{math} \n"),
+        compact.Node("SoftBreak"),
+        _raw_inline(label),
+        compact.Node("SoftBreak"),
+        _raw_inline(equation.content),
+        _raw_inline("\n```\n"),
+    ]
+    return compact.Node("Span", [["", [], []], content])
+
+
+class _Conversion:
+    """Filters applied to one compact tree
+
+    The elements converted to panflute run through all the filters but
+    ``Basic`` in :py:meth:`first`, and through ``Basic`` in :py:meth:`basic`,
+    which sees the siblings of the elements as left by the other filters, as
+    in the legacy engine.
+    """
+
+    def __init__(self, actions: tp.Sequence[tp.Tuple[str, tp.Callable]], doc: pf.Doc):
+        *self.first_actions, (_, self.basic_action) = actions
+        self.first_engine = FusedEngine(self.first_actions)
+        self.basic_engine = FusedEngine(actions[-1:])
+        self.doc = doc
+        self.labels = doc.section_labels_to_insert
+        self.inserted = 0
+
+    def run(self, tree: tp.Dict[str, tp.Any]) -> CompactResult:
+        doc = self.doc
+        blocks = tree["blocks"]
+        logger.info("Running the filters on the compact tree")
+        # the metadata goes first, as in every pass of the legacy engine
+        for _, action in self.first_actions:
+            doc = pf.run_filter(action, doc=doc)
+        self.first(blocks)
+        self.basic(blocks)
+        doc = pf.run_filter(self.basic_action, doc=doc)
+        self.inserted += insert_section_labels(doc, self.labels)
+        if self.inserted < len(self.labels):
+            n_missing = len(self.labels) - self.inserted
+            logger.warning(f"{n_missing} section labels not inserted.")
+
+        tree["meta"] = doc.metadata.content.to_json()
+        return CompactResult(compact.dumps(tree), doc.image_urls)
+
+    def is_converted(self, node: compact.Node) -> bool:
+        """Whether the filters run on the node converted to panflute"""
+        tag = node.tag
+        if tag == "Div" and node.content[0][1]:
+            return True
+        if node.images:
+            if tag == "Image" or tag == "Header":
+                raise Unsupported(f"{tag} with images")
+            return tag not in _CONTAINERS
+        return False
+
+    def first(self, items: list) -> None:
+        """Run the filters but Basic on a list of elements, in place"""
+        out = []
+        for item in items:
+            if not self.is_converted(item):
+                nested = []
+                _lists(item.content, nested)
+                for value in nested:
+                    self.first(value)
+                out.append(self.first_node(item))
+                continue
+            elem = _element(item)
+            count_images(elem, self.doc.image_counts)
+            self.doc.element_levels.update(directive_levels(elem, self.doc))
+            out.extend(self.filter(self.first_engine, elem).content)
+        items[:] = out
+
+    def first_node(self, node: compact.Node) -> tp.Any:
+        """The filters but Basic on a node, see :py:mod:`latex_to_myst.math` and
+        :py:mod:`latex_to_myst.hyperlink`
+        """
+        if node.tag == "DisplayMath":
+            return _display_math(node)
+        if node.tag != "Link":
+            return node
+        attr, _, target = node.content
+        attributes = dict(attr[2])
+        if not attributes:
+            if "http" in target[0]:
+                target[0] = "".join(target[0].split(" "))
+            return node
+        if "reference" not in attributes:
+            return node
+        target[0] = str(attributes["reference"])
+        attr[2] = []
+        markdown = reference(target[0], self.doc)
+        return node if markdown is None else _raw_inline(markdown)
+
+    def basic(self, items: list) -> None:
+        """Run Basic on a list of elements left by :py:meth:`first`, in place"""
+        out = []
+        for i, item in enumerate(items):
+            if isinstance(item, compact.Node):
+                nested = []
+                _lists(item.content, nested)
+                for value in nested:
+                    self.basic(value)
+                out.extend(self.basic_node(item, items[i + 1 : i + 3]))
+                continue
+            holder = self.filter(self.basic_engine, item)
+            self.inserted += insert_section_labels(holder, self.labels)
+            out.extend(elem.to_json() for elem in holder.content)
+        items[:] = out
+
+    def filter(self, engine: FusedEngine, elem: pf.Element) -> pf.Element:
+        """Run the filters of the engine on an element, in a holder element"""
+        holder = pf.Plain(elem) if isinstance(elem, pf.Inline) else pf.Div(elem)
+        # the filters find the document through the parents, e.g. in
+        # panflute.Element.replace_keyword
+        holder.parent = self.doc
+        engine.run_items(holder, "content", self.doc)
+        return holder
+
+    def basic_node(self, node: compact.Node, following: list) -> list:
+        """:py:func:`latex_to_myst.basic.action` on a node"""
+        tag = node.tag
+        if tag == "Para" and self.isolated_label(node):
+            return []
+        if tag == "Str":
+            # remove section and figure before references.
+            if any(_is_link(item) for item in following):
+                if node.content.lower() in ["section", "figure", "fig"]:
+                    return []
+            return [node]
+        if tag == "Header":
+            label = self.isolated_label(following[0] if following else None)
+            if not label:
+                label = node.identifier
+            attr = node.content[1]
+            attr[0] = ""
+            attr[1] = []
+            return [_raw_block(f"({label.strip()})="), node]
+        if tag == "CodeBlock":
+            node.content[0][2] = []
+        return [node]
+
+    def isolated_label(self, item: tp.Any) -> tp.Union[str, bool]:
+        """:py:func:`latex_to_myst.basic.is_isolated_label` on a node"""
+        if not isinstance(item, compact.Node):
+            return is_isolated_label(item)
+        if item.tag in _NO_CONTENT:
+            raise AttributeError(f"'{item.tag}' object has no attribute 'content'")
+        if item.tag == "Header":
+            content = item.content[2]
+        elif item.tag in ("Para", "Plain"):
+            content = item.content
+        else:
+            return False
+        if len(content) != 1 or not isinstance(content[0], compact.Node):
+            return False
+        span = content[0]
+        if span.tag != "Span" or all(k != "label" for k, _ in span.content[0][2]):
+            return False
+        # the text of the span is compared by panflute
+        return is_isolated_label(_element(item))
@@ -0,0 +1,124 @@
+"""In-process library API
+
+A :py:class:`Converter` does the setup of a conversion once (loading the
+macro preamble, importing the filters and configuring pandoc) and then
+converts any number of documents::
+
+    from latex_to_myst import Converter
+
+    converter = Converter(macro_files=["macros.tex"])
+    markdown = converter.convert(r"\\section{Intro} See Theorem \\ref{thm}.")
+    converter.convert_file("chapter.tex", "chapter.md")
+
+Converting a document never changes the converter: every conversion parses
+a new :py:class:`panflute.Doc`, and all state the filters share (the labels,
+levels and image counts set up by :py:func:`latex_to_myst.main.prepare`, the
+section labels inserted by :py:func:`latex_to_myst.main.finalize`) lives on
+that document. A converter can therefore be called repeatedly and from
+several threads at once.
+"""
+import typing as tp
+from pathlib import Path
+import panflute as pf
+from .backend import PandocBackend
+from .cache import ASTCache
+from .labelstore import ANONYMOUS_SOURCE, LabelStore, attach, source_key
+from .preamble import compile_preamble
+from .pipeline import (
+    ENGINES,
+    WRITERS,
+    ast_to_markdown,
+    filter_ast,
+    load_macros,
+    parse,
+    parse_bytes,
+    run_actions,
+    to_markdown,
+)
+
+
+class Converter:
+    """Convert LaTeX to MyST markdown with a fixed configuration
+
+    Arguments:
+        macro_files: files of macros added to the preamble
+        default_macros: whether to start the preamble with the default macros
+        macros: macro preamble used instead of loading ``macro_files`` and the
+          default macros
+        cache: parsed AST cache, see :py:class:`latex_to_myst.cache.ASTCache`
+        engine: filter engine, see :py:data:`latex_to_myst.pipeline.ENGINES`
+        writer: markdown writer, see :py:data:`latex_to_myst.pipeline.WRITERS`
+        backend: pandoc backend, default to the one of the process at the
+          time of each conversion, see :py:func:`latex_to_myst.backend.get_backend`
+        label_store: labels of the other documents of a book, see
+          :py:mod:`latex_to_myst.labelstore`
+    """
+
+    def __init__(
+        self,
+        macro_files: tp.Iterable[tp.Union[str, Path]] = (),
+        default_macros: bool = True,
+        macros: str = None,
+        cache: ASTCache = None,
+        engine: str = "legacy",
+        writer: str = "pandoc",
+        backend: PandocBackend = None,
+        label_store: LabelStore = None,
+    ):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', use one of {ENGINES}.")
+        if writer not in WRITERS:
+            raise ValueError(f"Unknown writer '{writer}', use one of {WRITERS}.")
+        # import the filters now rather than on the first document
+        from .main import ACTIONS
+        from .engine import FusedEngine  # noqa: F401
+        from .compact_engine import CompactEngine  # noqa: F401
+
+        if macros is None:
+            macros = load_macros(macro_files, default_macros=default_macros)
+        self.macros = macros
+        self.cache = cache
+        self.engine = engine
+        self.writer = writer
+        self.backend = backend
+        self.label_store = label_store
+        self.actions = ACTIONS
+        # index the preamble now rather than on the first document
+        compile_preamble(macros)
+
+    def parse(self, text: str) -> pf.Doc:
+        """Parse LaTeX source into a panflute document"""
+        return parse(text, self.macros, cache=self.cache, backend=self.backend)
+
+    def run_actions(self, doc: pf.Doc) -> pf.Doc:
+        """Run the filters on a parsed document"""
+        return run_actions(doc, engine=self.engine, actions=self.actions)
+
+    def to_markdown(self, doc: pf.Doc) -> str:
+        """Serialize a filtered document to markdown"""
+        return to_markdown(doc, writer=self.writer, backend=self.backend)
+
+    def convert(self, text: str, source: str = ANONYMOUS_SOURCE) -> str:
+        """Convert LaTeX source to MyST markdown
+
+        With a label store, the labels are recorded under source and the
+        references to the other sources are resolved. Documents converted
+        without a source share :py:data:`latex_to_myst.labelstore.ANONYMOUS_SOURCE`.
+        """
+        if self.engine == "compact":
+            ast = parse_bytes(text, self.macros, cache=self.cache, backend=self.backend)
+            ast = filter_ast(
+                ast, self.actions, label_store=self.label_store, source=source
+            ).ast
+            return ast_to_markdown(ast, writer=self.writer, backend=self.backend)
+        doc = attach(self.parse(text), self.label_store, source)
+        return self.to_markdown(self.run_actions(doc))
+
+    def convert_file(
+        self, source: tp.Union[str, Path], target: tp.Union[str, Path] = None
+    ) -> str:
+        """Convert a LaTeX file, writing the markdown to target if given"""
+        markdown = self.convert(Path(source).read_text(), source_key(source))
+        if target is not None:
+            Path(target).write_text(markdown)
+        return markdown
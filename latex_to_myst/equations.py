@@ -0,0 +1,126 @@
+"""Memoised preparation of display equations
+
+Books repeat many display equations verbatim (notation blocks, boilerplate
+definitions, ...). Both :py:func:`latex_to_myst.labels.build_label_index` in
+``prepare`` and :py:func:`latex_to_myst.math.create_displaymath` extract the
+``\\label`` of every display equation, the latter also strips it from the TeX.
+:py:func:`prepare_equation` does both once per distinct equation text, through
+a bounded least-recently-used :py:class:`EquationCache`.
+
+The cache is process-wide, so it is shared by the documents converted in the
+same process: every document of a serial conversion, and the documents a
+worker of :py:mod:`latex_to_myst.batch` converts. The cached values are
+strings, the filters still build new elements for every equation.
+"""
+import re
+import threading
+import typing as tp
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EQUATION_CACHE_SIZE = 4096  # equations
+
+# \label of a display equation
+LABEL_PATTERN = re.compile(r"\\label\{([^\}]+)\}")
+
+
+class Equation(tp.NamedTuple):
+    """Display equation split into its label and its content"""
+
+    # first \label of the equation, None if it has none
+    label: tp.Optional[str]
+    # TeX of the equation without the \label
+    content: str
+
+
+def split_equation(text: str) -> Equation:
+    """Extract the first ``\\label`` of the TeX of a display equation"""
+    match = LABEL_PATTERN.search(text)
+    if match is None:
+        return Equation(None, text)
+    return Equation(match.group(1), text.replace(match.group(0), ""))
+
+
+class EquationCache:
+    """Least-recently-used cache of :py:func:`split_equation` by equation text
+
+    Arguments:
+        maxsize: maximum number of equations, 0 disables the cache
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_EQUATION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: tp.Dict[str, Equation] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # worker processes start with an empty cache of the same size
+        return (type(self), (self.maxsize,))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, text: str) -> Equation:
+        """Return the prepared equation, computing it on a miss"""
+        with self._lock:
+            equation = self._entries.get(text)
+            if equation is not None:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                return equation
+            self.misses += 1
+        equation = split_equation(text)
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[text] = equation
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return equation
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> tp.Dict[str, int]:
+        """Usage counters and size of the cache"""
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(self._entries),
+            maxsize=self.maxsize,
+        )
+
+
+_cache = EquationCache()
+
+
+def get_equation_cache() -> EquationCache:
+    """Equation cache of this process"""
+    return _cache
+
+
+def set_equation_cache(cache: EquationCache) -> None:
+    """Use cache for the equations in this process"""
+    global _cache
+    _cache = cache
+
+
+def prepare_equation(text: str) -> Equation:
+    """Label and content of a display equation, through the equation cache"""
+    return _cache.get(text)
+
+
+def format_stats(stats: tp.Dict[str, int]) -> str:
+    """Human readable one-line summary of :py:meth:`EquationCache.stats`"""
+    total = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / total if total else 0.0
+    return (
+        f"Equations: {stats['hits']} hits, {stats['misses']} misses "
+        f"({rate:.0%} hits)"
+    )
@@ -4,41 +4,45 @@ import re
 import logging
 import typing as tp
 import panflute as pf
-from latex_to_myst.helpers import create_directive_block, elem_has_multiple_figures
+from latex_to_myst.helpers import (
+    add_metadata,
+    create_directive_block,
+    elem_has_multiple_figures,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def image_in_subplot(elem: pf.Image):
+def image_in_subplot(elem: pf.Image, doc: pf.Doc = None):
     """Check if an image node is in subplot"""
     if isinstance(elem.parent, pf.Para):
-        return elem_has_multiple_figures(elem.parent)
+        return elem_has_multiple_figures(elem.parent, doc)
     if isinstance(elem.ancestor(1), pf.TableCell):
         table = elem.ancestor(4)
-        return elem_has_multiple_figures(table)
+        return elem_has_multiple_figures(table, doc)
     if isinstance(elem.ancestor(2), pf.TableCell):
         table = elem.ancestor(5)
-        return elem_has_multiple_figures(table)
+        return elem_has_multiple_figures(table, doc)
     return False
 
 
 def break_long_string(string: str, max_len: int = 70, indent: int = 0) -> str:
     """Break long string into shorter strings of max_len (with indent added)"""
-    import numpy as np
-
     string = " ".join(
         string.split(" ")
     )  # convert multiple consecutive white spaces to single
     content = string.split(" ")
-    str_len = [len(c) + 1 for c in content]  # +1 for whitespace
-    cum_len = np.cumsum(str_len)
-    block_idx = np.floor(cum_len / max_len).astype(int)
-    N_blocks = max(block_idx) + 1
-    content = np.array(content, dtype=str)
+    blocks = [[]]
+    cum_len = 0
+    for c in content:
+        cum_len += len(c) + 1  # +1 for whitespace
+        block_idx = cum_len // max_len
+        while len(blocks) <= block_idx:
+            blocks.append([])
+        blocks[block_idx].append(c)
     output = ""
-    for b in range(N_blocks):
-        (idx,) = np.where(block_idx == b)
-        new_line = " " * indent + " ".join(content[idx].tolist()) + "\n"
+    for block in blocks:
+        new_line = " " * indent + " ".join(block) + "\n"
         output += new_line
     output.rstrip("\n")  # remove last newline
     return output
@@ -49,6 +53,9 @@ def create_image(elem: pf.Image, doc: pf.Doc = None) -> pf.Span:
     if not isinstance(elem, pf.Image):
         return
     url = elem.url  # f"../{elem.url}"
+    # images to copy next to the markdown, see latex_to_myst.assets
+    if hasattr(doc, "image_urls"):
+        doc.image_urls.append(url)
     label = elem.identifier
     attr = elem.attributes
     attr_str = ""
@@ -83,6 +90,16 @@ def create_image(elem: pf.Image, doc: pf.Doc = None) -> pf.Span:
     return create_directive_block(elem, doc, content, "figure", pf.Span, label=url)
 
 
+def _substitution_number(doc: pf.Doc) -> int:
+    """Number of the next substitution
+
+    Shards of a document converted separately start at the offset set by
+    :py:mod:`latex_to_myst.shard` so that the numbers stay unique.
+    """
+    offset = getattr(doc, "substitutions_offset", 0)
+    return offset + len(doc.metadata["substitutions"].content)
+
+
 def _create_subplots_from_para(elem: pf.Para, doc):
     """Create Subplot using list-table and return table and substitutions to put in header"""
     image_ids = []
@@ -92,7 +109,7 @@ def _create_subplots_from_para(elem: pf.Para, doc):
         if isinstance(e, pf.LineBreak):
             start_new_row = True
         if isinstance(e, pf.Image):
-            image_id = f"figure-{len(doc.metadata['substitutions'].content)}"
+            image_id = f"figure-{_substitution_number(doc)}"
             if e.identifier:
                 image_id += f":{e.identifier}"
             image_ids.append(image_id)
@@ -100,7 +117,8 @@ def _create_subplots_from_para(elem: pf.Para, doc):
                 logger.error(f"Image ID {image_id} already exists, skipping.")
                 continue
             img = create_image(e, doc)
-            doc.metadata["substitutions"].content[image_id] = pf.MetaInlines(img)
+            substitutions = doc.metadata["substitutions"].content
+            add_metadata(doc, substitutions, image_id, pf.MetaInlines(img))
             if start_new_row:
                 image_content.append(
                     pf.RawInline("* - {{%s}}\n" % image_id, format="markdown")
@@ -125,12 +143,13 @@ def _create_subplots_from_table(elem: pf.Table, doc):
             start_new_row = True
             return
         if isinstance(e, pf.Image):
-            image_id = f"figure-{len(doc.metadata['substitutions'].content)}"
+            image_id = f"figure-{_substitution_number(doc)}"
             if e.identifier:
                 image_id += f":{e.identifier}"
             assert image_id not in doc.metadata["substitutions"].content
             img = create_image(e, doc)
-            doc.metadata["substitutions"].content[image_id] = pf.MetaInlines(img)
+            substitutions = doc.metadata["substitutions"].content
+            add_metadata(doc, substitutions, image_id, pf.MetaInlines(img))
             if start_new_row:
                 image_content.append(
                     pf.RawInline("* - {{%s}}\n" % image_id, format="markdown")
@@ -151,7 +170,7 @@ def create_subplots(
 ) -> tp.Tuple[pf.Para, tp.Iterable[tp.Any]]:
     """Create Subplot using list-table and return table and substitutions to put in header"""
     if not "substitutions" in doc.metadata:
-        doc.metadata["substitutions"] = {}
+        add_metadata(doc, doc.metadata.content, "substitutions", pf.MetaMap())
 
     if isinstance(elem, pf.Para):
         image_content = _create_subplots_from_para(elem, doc)
@@ -182,19 +201,19 @@ def create_subplots(
 def action(elem: pf.Element, doc: pf.Doc = None):
     """Figure Actions"""
     if isinstance(elem, pf.Para):
-        if elem_has_multiple_figures(elem):
+        if elem_has_multiple_figures(elem, doc):
             logger.debug("Creating subfigure from Para.")
             return create_subplots(elem, doc)
         return elem
 
     if isinstance(elem, pf.Table):
-        if elem_has_multiple_figures(elem):
+        if elem_has_multiple_figures(elem, doc):
             logger.debug("Creating subfigure from Table.")
             return create_subplots(elem, doc)
         return elem
 
     if isinstance(elem, pf.Image):
-        if image_in_subplot(elem):
+        if image_in_subplot(elem, doc):
             return elem
         logger.debug(f"Creating Figure: {elem.url}")
         return create_image(elem, doc)
@@ -13,6 +13,7 @@ the form of::
 """
 import typing as tp
 import logging
+import functools
 import panflute as pf
 
 logger = logging.getLogger(__name__)
@@ -35,25 +36,102 @@ SUPPORTED_AMSTHM_BLOCKS = [
 ]
 
 
-def elem_has_multiple_figures(elem: pf.Element):
+def count_images(elem: pf.Element, counts: tp.Dict[pf.Element, int]) -> int:
+    """Record the number of images in the element and each of its descendants
+
+    The count of an element includes the element itself. Elements that are
+    already in ``counts`` are not visited again, so filling the index of a
+    whole document is a single bottom-up pass.
+    """
+    stack = [(elem, None)]
+    while stack:
+        e, children = stack.pop()
+        if e in counts:
+            continue
+        if children is None:
+            children = child_elements(e)
+            stack.append((e, children))
+            stack.extend((c, None) for c in children if c not in counts)
+            continue
+        counts[e] = isinstance(e, pf.Image) + sum(counts[c] for c in children)
+    return counts[elem]
+
+
+def image_count(elem: pf.Element, doc: pf.Doc = None) -> int:
+    """Number of images in an element
+
+    Looked up in the index ``doc.image_counts`` built by
+    :py:func:`latex_to_myst.main.prepare`, elements created later are counted
+    once and added to the index. Without an index the subtree is walked.
+    """
+    counts = getattr(doc, "image_counts", None)
+    if counts is None:
+        return count_images(elem, {})
+    return count_images(elem, counts)
+
+
+def elem_has_multiple_figures(elem: pf.Element, doc: pf.Doc = None):
     """Check if an element is a subplot (subfigures)"""
-    img_count = 0
+    return image_count(elem, doc) > 1
+
 
-    def is_figure(e, doc):
-        nonlocal img_count
-        if isinstance(e, pf.Image):
-            img_count += 1
+def track_image_counts(action: tp.Callable) -> tp.Callable:
+    """Keep ``doc.image_counts`` up to date with the changes of an action
+
+    When the action replaces or deletes the element, or changes its direct
+    children, the difference in images is added to the counts of all
+    ancestors. Actions must not add or remove images deeper in the subtree
+    without returning a replacement.
+    """
+
+    @functools.wraps(action)
+    def tracked(elem: pf.Element, doc: pf.Doc = None):
+        counts = getattr(doc, "image_counts", None)
+        if counts is None:
+            return action(elem, doc)
+        before = count_images(elem, counts)
+        altered = action(elem, doc)
+        if altered is None or altered is elem:
+            after = isinstance(elem, pf.Image) + sum(
+                count_images(c, counts) for c in child_elements(elem)
+            )
+            counts[elem] = after
+        else:
+            if not isinstance(altered, list):
+                altered = [altered]
+            after = sum(count_images(e, counts) for e in altered)
+        if after != before:
+            parent = elem.parent
+            while parent is not None:
+                if parent in counts:
+                    counts[parent] += after - before
+                parent = parent.parent
+        return altered
+
+    return tracked
+
+
+def add_metadata(
+    doc: pf.Doc, mapping: pf.DictContainer, key: str, value: pf.MetaValue
+) -> None:
+    """Add a metadata value created by a filter to mapping
 
-    elem.walk(is_figure)
-    return img_count > 1
+    The value is recorded in ``doc.created_metadata`` when it exists, for
+    :py:class:`latex_to_myst.engine.FusedEngine` to run the following filters
+    on it as the following passes of the legacy path do.
+    """
+    mapping[key] = value
+    created = getattr(doc, "created_metadata", None)
+    if created is not None:
+        created.append((mapping, key))
 
 
-def get_element_type(elem: pf.Element) -> str:
+def get_element_type(elem: pf.Element, doc: pf.Doc = None) -> str:
     """Get Element Type"""
     if isinstance(elem, pf.Image):
         return "figure"
     if isinstance(elem, pf.Para):
-        if elem_has_multiple_figures(elem):
+        if elem_has_multiple_figures(elem, doc):
             return "subfigures"
     if isinstance(elem, pf.Math):
         if elem.format == "DisplayMath":
@@ -84,49 +162,58 @@ HorizontalSpaces = (pf.Space, pf.LineBreak, pf.SoftBreak)
 VerticalSpaces = (pf.Para,)
 
 
-def stringify_until_match(
+def _post_order(
     elem: pf.Element,
-    doc: pf.Doc,
-    current_substring: tp.List[str],
-    node_list: tp.List[pf.Element],
-    match_substring: str,
-) -> None:
+) -> tp.Iterator[tp.Tuple[pf.Element, tp.Optional[int], tp.Optional[int]]]:
+    """Yield the element and its descendants in the order of panflute's walk
+
+    Every element comes with its index in, and the length of, the list
+    container holding it (None if it is not in a list container).
+    """
+    stack = [(elem, None, None, False)]
+    while stack:
+        e, index, size, expanded = stack.pop()
+        if expanded:
+            yield e, index, size
+            continue
+        stack.append((e, index, size, True))
+        children = []
+        for child in e._children:
+            obj = getattr(e, child)
+            if isinstance(obj, pf.Element):
+                children.append((obj, None, None))
+            elif isinstance(obj, pf.ListContainer):
+                items = list(obj)
+                children.extend((item, n, len(items)) for n, item in enumerate(items))
+            elif isinstance(obj, pf.DictContainer):
+                children.extend((v, None, None) for v in obj.values())
+        stack.extend((c, n, size, False) for c, n, size in reversed(children))
+
+
+def stringify_until_match(
+    elem: pf.Element, match_substring: str
+) -> tp.Optional[tp.List[pf.Element]]:
     """Stringify element until the desired substring is matched
 
+    The element is walked in the order of :py:func:`panflute.Element.walk`
+    and the text of the nodes is accumulated until, stripped, it equals the
+    stripped ``match_substring``. The walk stops as soon as the accumulated
+    text can no longer become the desired substring.
+
     Arguments:
-        elem: panflute element that is being walked right now
-        doc: document (not used, added for call signature of
-          :py:func:`panflute.Element.walk`)
-        current_substring: a list of current substrings corresponding to all
-          previously walked nodes
-        node_list: a list of nodes that have been walked
+        elem: panflute element to walk
         match_substring: the desired substring to match
 
-    Raises:
-        StopIteration: raised when the desired substring is matched
+    Returns:
+        the list of walked nodes if the substring was matched, otherwise None
 
     Example:
 
-        >>> current_substring = []
-        >>> node_list = []
-        >>> desired_substring = "I want this string"
-        >>> get_substring = partial(
-                stringify_until_match,
-                current_substring=current_substring,
-                node_list=node_list,
-                match_substring = match_substring
-            )
-        >>> try:
-                starting_element.walk(get_substring)
-            except (StopIteration, RuntimeError):
-                def remove_node(e, doc):
-                    if e in node_list:
-                        return []
-                elem.walk(remove_node)
-            except Exception as e:
-                raise RuntimeError("Unknown Error in finding substring") from e
-            else:
+        >>> node_list = stringify_until_match(starting_element, desired_substring)
+        >>> if node_list is None:
                 logger.error(f"{desired_substring} not found.")
+            else:
+                remove_nodes(starting_element, node_list)
 
     .. note::
 
@@ -134,28 +221,53 @@ def stringify_until_match(
 
     .. `panflute.stringify`: https://github.com/sergiocorreia/panflute/blob/281ddeaebd2c2c94f457f3da785037cadf69389e/panflute/tools.py#L215
     """
-    if hasattr(elem, "text"):
-        ans = elem.text
-    elif isinstance(elem, HorizontalSpaces):
-        ans = " "
-    elif isinstance(elem, VerticalSpaces):
-        ans = "\n\n"
-    elif isinstance(elem, pf.Citation):
-        ans = ""
-    else:
-        ans = ""
+    target = match_substring.strip()
+    # the accumulated text, left-stripped, is target[:matched] + trailing
+    matched = 0
+    trailing = ""
+    node_list = []
+    for e, index, size in _post_order(elem):
+        if hasattr(e, "text"):
+            ans = e.text
+        elif isinstance(e, HorizontalSpaces):
+            ans = " "
+        elif isinstance(e, VerticalSpaces):
+            ans = "\n\n"
+        else:
+            ans = ""
+
+        # Add quotes around the contents of Quoted()
+        if index is not None and isinstance(e.parent, pf.Quoted):
+            if index == 0:
+                ans = '"' + ans
+            if index == size - 1:
+                ans += '"'
+
+        node_list.append(e)
+        text = trailing + ans if matched or trailing else ans.lstrip()
+        core = text.rstrip()
+        if core:
+            if not target.startswith(core, matched):
+                return None
+            matched += len(core)
+            trailing = text[len(core) :]
+        else:
+            trailing = text
+        if matched == len(target):
+            return node_list
+    return None
+
 
-    # Add quotes around the contents of Quoted()
-    if isinstance(elem.parent, pf.Quoted):
-        if elem.index == 0:
-            ans = '"' + ans
-        if elem.index == len(elem.container) - 1:
-            ans += '"'
+def remove_nodes(elem: pf.Element, node_list: tp.Iterable[pf.Element]) -> None:
+    """Remove the given nodes (compared by identity) from the element"""
+    ids = set(id(e) for e in node_list)
 
-    current_substring.append(ans)
-    node_list.append(elem)
-    if "".join(current_substring).strip() == match_substring.strip():
-        raise StopIteration
+    def remove_node(e, doc):
+        if id(e) in ids:
+            return []
+        return e
+
+    elem.walk(remove_node)
 
 
 def create_generic_div_block(elem: pf.Element, doc: pf.Doc):
@@ -192,23 +304,18 @@ def create_directive_block(
     label: str = "",
 ) -> tp.Union[pf.Para, pf.Span]:
     """Create a directive block as literal"""
-    if not is_directive_block(elem):
+    if not is_directive_block(elem, doc):
         return elem
 
-    # get level of block
-    try:
-        all_levels = doc.element_levels
-        level = all_levels[elem]
-    except KeyError:
-        logger.error("Element level not found")
-        level = directive_level(elem, doc)
-        doc.element_levels[elem] = level
-    except AttributeError:
-        logger.error("element_levels not initialized for Doc. Recomputing...")
-        level = directive_level(elem, doc)
-        doc.element_levels = {elem: level}
-    except Exception as e:
-        raise RuntimeError("Unknown error when creating directive block") from e
+    # levels of the directives are computed by prepare, a filter run on its own
+    # computes them on demand
+    levels = getattr(doc, "element_levels", None)
+    if levels is None:
+        levels = doc.element_levels = {}
+    if elem not in levels:
+        logger.debug("Element level not found, computing it")
+        levels.update(directive_levels(elem, doc))
+    level = levels[elem]
 
     # create block
     if create_using == pf.Div:
@@ -233,42 +340,65 @@ def create_directive_block(
     return create_using(*block_content)
 
 
-def is_directive_block(elem: pf.Element) -> bool:
-    """Check if an given element is a directive block"""
+def _is_directive_block(elem: pf.Element, n_images: int) -> bool:
     return (
         (isinstance(elem, pf.Math) and elem.format == "DisplayMath")
         or isinstance(elem, pf.Div)
         or isinstance(elem, pf.Image)
-        or (isinstance(elem, pf.Para) and elem_has_multiple_figures(elem))
-        or (isinstance(elem, pf.Table) and elem_has_multiple_figures(elem))
+        or (isinstance(elem, (pf.Para, pf.Table)) and n_images > 1)
     )
 
 
-def directive_level(elem: pf.Element, doc: pf.Doc, starting_level: int = 0) -> int:
-    """Check the nested level of a directive block"""
-    if is_directive_block(elem):
-        starting_level += 1
+def is_directive_block(elem: pf.Element, doc: pf.Doc = None) -> bool:
+    """Check if an given element is a directive block"""
+    n_images = 0
+    if isinstance(elem, (pf.Para, pf.Table)):
+        n_images = image_count(elem, doc)
+    return _is_directive_block(elem, n_images)
+
+
+def child_elements(elem: pf.Element) -> tp.List[pf.Element]:
+    """Direct children of an element across all of its child attributes"""
+    children = []
     for child in elem._children:
         obj = getattr(elem, child)
         if isinstance(obj, pf.Element):
-            return directive_level(obj, doc, starting_level)
+            children.append(obj)
         elif isinstance(obj, pf.ListContainer):
-            if len(obj):
-                return max([directive_level(item, doc, starting_level) for item in obj])
-            else:
-                return starting_level
+            children.extend(obj)
         elif isinstance(obj, pf.DictContainer):
-            if len(obj):
-                return max(
-                    [
-                        directive_level(item, doc, starting_level)
-                        for item in obj.values()
-                    ]
-                )
-            else:
-                return starting_level
-        elif obj is None:
-            return starting_level
-        else:
+            children.extend(obj.values())
+        elif obj is not None:
             raise TypeError(type(obj))
-    return starting_level
+    return children
+
+
+def directive_levels(elem: pf.Element, doc: pf.Doc = None) -> tp.Dict[pf.Element, int]:
+    """Nested level of the element and of all its descendants
+
+    The level of an element is the largest number of directive blocks on a
+    path from the element down to a leaf, the element included. All levels are
+    computed in a single bottom-up pass over the tree.
+    """
+    counts = getattr(doc, "image_counts", None)
+    if counts is None:
+        counts = {}
+    count_images(elem, counts)
+    levels = {}
+    stack = [(elem, None)]
+    while stack:
+        e, children = stack.pop()
+        if children is None:
+            children = child_elements(e)
+            stack.append((e, children))
+            stack.extend((c, None) for c in children)
+            continue
+        levels[e] = _is_directive_block(e, counts[e]) + max(
+            (levels[c] for c in children), default=0
+        )
+    return levels
+
+
+def directive_level(elem: pf.Element, doc: pf.Doc, starting_level: int = 0) -> int:
+    """Check the nested level of a directive block"""
+    return starting_level + directive_levels(elem, doc)[elem]
@@ -1,10 +1,29 @@
+import typing as tp
 import panflute as pf
 import logging
-from latex_to_myst.helpers import get_element_type
+from latex_to_myst.labels import resolve
 
 logger = logging.getLogger(__name__)
 
 
+def reference(target: str, doc: pf.Doc) -> tp.Optional[str]:
+    """Markdown of a reference to a label, None if the link stays a link"""
+    label = doc.label_index.get(target)
+    if label is None:
+        # labelled in another shard, see latex_to_myst.shard
+        external_labels = getattr(doc, "external_labels", {})
+        if target not in external_labels:
+            logger.error(f"Link to target {target} not found.")
+            return None
+        label = resolve(external_labels[target])
+    if not label.type:
+        return None
+    if label.role is None:
+        logger.error(f"Link to target type {label.type} not understood.")
+        return None
+    return f"{{{label.role}}}`{target}`"
+
+
 def action(elem: pf.Element, doc: pf.Doc = None):
     if isinstance(elem, pf.Link):
         if not elem.attributes:
@@ -17,22 +36,10 @@ def action(elem: pf.Element, doc: pf.Doc = None):
             elem.attributes = {}
             elem.url = target
 
-            if target in doc.element_labels:
-                target_elem = doc.element_labels[target]
-                target_type = get_element_type(target_elem)
-                if not target_type:
-                    return elem
-                if target_type in ["figure"]:
-                    return pf.RawInline("{numref}`%s`" % target, format="markdown")
-                if target_type in ["subfigures", "dislaymath", "header"]:
-                    return pf.RawInline("{ref}`%s`" % target, format="markdown")
-                if target_type in ["amsthm"]:
-                    return pf.RawInline("{prf:ref}`%s`" % target, format="markdown")
-                if target_type in ["displaymath"]:
-                    return pf.RawInline("{eq}`%s`" % target, format="markdown")
-                logger.error(f"Link to target type {target_type} not understood.")
-            else:
-                logger.error(f"Link to target {target} not found.")
+            markdown = reference(target, doc)
+            if markdown is None:
+                return elem
+            return pf.RawInline(markdown, format="markdown")
 
 
 def main(doc: pf.Doc):
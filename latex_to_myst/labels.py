@@ -0,0 +1,108 @@
+"""Index of the labels of a document
+
+:py:func:`build_label_index` walks the document once (in
+:py:func:`latex_to_myst.main.prepare`) and resolves every label to the type of
+the labelled element (see :py:func:`latex_to_myst.helpers.get_element_type`)
+and to the MyST role that references it. Rewriting a ``\\ref`` in
+:py:mod:`latex_to_myst.hyperlink` is then a dictionary lookup. The same walk
+gathers the referenced labels, so that the index reports both labels defined
+more than once and references to labels that are not defined.
+"""
+import typing as tp
+import logging
+import panflute as pf
+from latex_to_myst.equations import prepare_equation
+from latex_to_myst.helpers import get_element_type
+
+logger = logging.getLogger(__name__)
+
+# MyST role referencing each element type
+ROLES = {
+    "figure": "numref",
+    "subfigures": "ref",
+    "header": "ref",
+    "amsthm": "prf:ref",
+    "displaymath": "eq",
+}
+# label of the display equations without a \label
+UNLABELLED_EQUATION = "eqn"
+
+
+class Label(tp.NamedTuple):
+    """Resolved label"""
+
+    type: tp.Optional[str]
+    role: tp.Optional[str]
+
+
+def resolve(element_type: tp.Optional[str]) -> Label:
+    """Label of an element of the given type"""
+    return Label(element_type, ROLES.get(element_type))
+
+
+class LabelIndex:
+    """Labels of a document with the elements they label
+
+    Arguments:
+        labels: resolved label of every label
+        elements: labelled element of every label
+        references: labels referenced by the links of the document
+        duplicates: labels defined more than once, the last definition wins
+    """
+
+    def __init__(
+        self,
+        labels: tp.Dict[str, Label] = None,
+        elements: tp.Dict[str, pf.Element] = None,
+        references: tp.Set[str] = None,
+        duplicates: tp.Set[str] = None,
+    ):
+        self.labels = {} if labels is None else labels
+        self.elements = {} if elements is None else elements
+        self.references = set() if references is None else references
+        self.duplicates = set() if duplicates is None else duplicates
+
+    def __contains__(self, label: str) -> bool:
+        return label in self.labels
+
+    def get(self, label: str) -> tp.Optional[Label]:
+        return self.labels.get(label)
+
+    def types(self) -> tp.Dict[str, tp.Optional[str]]:
+        """Element type of every label"""
+        return {label: info.type for label, info in self.labels.items()}
+
+    def dangling(self, external: tp.Iterable[str] = ()) -> tp.Set[str]:
+        """References to labels defined neither here nor in external"""
+        return self.references - self.labels.keys() - set(external)
+
+
+def build_label_index(doc: pf.Doc) -> LabelIndex:
+    """Index the labels and references of the document in a single walk
+
+    Elements are labelled by their identifier, display equations by the
+    ``\\label`` in their TeX (or :py:data:`UNLABELLED_EQUATION`), see
+    :py:func:`latex_to_myst.equations.prepare_equation`.
+    """
+    index = LabelIndex()
+
+    def add(label: str, elem: pf.Element, element_type: tp.Optional[str]) -> None:
+        if label in index.elements and label != UNLABELLED_EQUATION:
+            index.duplicates.add(label)
+        index.elements[label] = elem
+        index.labels[label] = resolve(element_type)
+
+    def gather(e, doc):
+        if hasattr(e, "identifier"):
+            if e.identifier:
+                add(e.identifier, e, get_element_type(e, doc))
+            if isinstance(e, pf.Link) and "reference" in e.attributes:
+                index.references.add(str(e.attributes["reference"]))
+        elif isinstance(e, pf.Math) and e.format == "DisplayMath":
+            label = prepare_equation(e.text).label
+            add(label or UNLABELLED_EQUATION, e, "displaymath")
+
+    doc.walk(gather)
+    if index.duplicates:
+        logger.warning(f"Labels defined more than once: {sorted(index.duplicates)}")
+    return index
@@ -0,0 +1,171 @@
+"""On-disk store of the labels of the documents of a book
+
+A book converted chapter by chapter references labels defined in other
+chapters, which the labels of a single document (see
+:py:mod:`latex_to_myst.labels`) do not cover. A :py:class:`LabelStore` is a
+SQLite database of the labels of every converted document, keyed by label
+and source file, with the type of the labelled element.
+
+When a document is attached to a store (see :py:func:`attach`),
+:py:func:`latex_to_myst.main.prepare` replaces the labels of its source in
+the store with the ones it defines, and resolves the labels it references
+but does not define from the other sources into ``doc.external_labels``,
+used by :py:mod:`latex_to_myst.hyperlink`. Reconverting a chapter only
+rewrites the rows of that chapter.
+
+A reference into a chapter that has not been converted yet is only resolved
+once the chapter is in the store, ``latex2myst-batch --label-db`` therefore
+gathers the labels of all its inputs before converting them.
+
+Stores can be pickled to hand them to worker processes, every process and
+thread opens its own connection to the database.
+"""
+import os
+import threading
+import typing as tp
+import logging
+from pathlib import Path
+import panflute as pf
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for another process to release the database
+DEFAULT_TIMEOUT = 30.0
+# maximum number of parameters of a single query
+_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    label TEXT NOT NULL,
+    source TEXT NOT NULL,
+    type TEXT,
+    PRIMARY KEY (label, source)
+);
+CREATE INDEX IF NOT EXISTS labels_source ON labels (source);
+"""
+
+# source of the documents converted without one, e.g. from a string
+ANONYMOUS_SOURCE = ""
+
+
+def source_key(path: tp.Union[str, Path]) -> str:
+    """Source of a document in the store, its absolute path"""
+    return str(Path(path).resolve())
+
+
+class LabelStore:
+    """SQLite database of the labels of many documents
+
+    Arguments:
+        path: file of the database, created if it does not exist
+        timeout: seconds to wait for another process to release the database
+    """
+
+    def __init__(self, path: tp.Union[str, Path], timeout: float = DEFAULT_TIMEOUT):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def __getstate__(self) -> tp.Dict[str, tp.Any]:
+        return dict(path=self.path, timeout=self.timeout)
+
+    def __setstate__(self, state: tp.Dict[str, tp.Any]) -> None:
+        self.__init__(**state)
+
+    def _connection(self) -> "sqlite3.Connection":
+        # sqlite3 is only imported once a store is used
+        import sqlite3
+
+        # connections can neither be shared between threads nor forked
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def close(self) -> None:
+        """Close the connection of the calling thread"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            del self._local.conn, self._local.pid
+
+    def update(self, source: str, labels: tp.Dict[str, tp.Optional[str]]) -> None:
+        """Replace the labels of source by labels, a map of label to type"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM labels WHERE source = ?", (source,))
+            conn.executemany(
+                "INSERT INTO labels (label, source, type) VALUES (?, ?, ?)",
+                [(label, source, _type) for label, _type in labels.items()],
+            )
+
+    def remove(self, source: str) -> None:
+        """Remove the labels of source"""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM labels WHERE source = ?", (source,))
+
+    def sources(self) -> tp.List[str]:
+        """Sources that have labels in the store"""
+        rows = self._connection().execute(
+            "SELECT DISTINCT source FROM labels ORDER BY source"
+        )
+        return [source for (source,) in rows]
+
+    def labels(self, source: str) -> tp.Dict[str, tp.Optional[str]]:
+        """Labels of source with their type"""
+        rows = self._connection().execute(
+            "SELECT label, type FROM labels WHERE source = ?", (source,)
+        )
+        return dict(rows)
+
+    def resolve(
+        self, labels: tp.Iterable[str], source: str = None
+    ) -> tp.Dict[str, tp.Optional[str]]:
+        """Type of the labels defined in the store outside of source
+
+        Labels defined in several sources take the type of the first source
+        in sorted order. Labels that are not in the store are left out.
+        """
+        labels = sorted(set(labels))
+        resolved = {}
+        conn = self._connection()
+        for i in range(0, len(labels), _BATCH):
+            batch = labels[i : i + _BATCH]
+            rows = conn.execute(
+                f"SELECT label, type FROM labels "
+                f"WHERE label IN ({', '.join('?' * len(batch))}) AND source != ? "
+                f"ORDER BY source DESC",
+                (*batch, source or ""),
+            )
+            resolved.update(rows)
+        return resolved
+
+
+def attach(doc: pf.Doc, store: tp.Optional[LabelStore], source: str) -> pf.Doc:
+    """Resolve the labels of the document through the store in ``prepare``"""
+    if store is not None:
+        doc.label_store = store
+        doc.label_source = source
+    return doc
+
+
+def sync(doc: pf.Doc) -> None:
+    """Record the labels of an attached document and resolve the missing ones
+
+    Called by :py:func:`latex_to_myst.main.prepare` once ``doc.label_index`` is
+    built. Labels in ``doc.external_labels`` take precedence over the store.
+    """
+    store = getattr(doc, "label_store", None)
+    if store is None:
+        return
+    index = doc.label_index
+    external = getattr(doc, "external_labels", {})
+    store.update(doc.label_source, index.types())
+    resolved = store.resolve(index.dangling(external), doc.label_source)
+    if resolved:
+        logger.info(f"Resolved {len(resolved)} labels from {store.path}")
+        doc.external_labels = {**resolved, **external}
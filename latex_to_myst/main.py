@@ -1,8 +1,15 @@
 #!/usr/bin/env python
-import re
 import logging
+import typing as tp
 import panflute as pf
-from latex_to_myst.helpers import get_element_type, is_directive_block, directive_level
+from latex_to_myst.helpers import (
+    directive_levels,
+    count_images,
+    elem_has_multiple_figures,
+    track_image_counts,
+)
+from latex_to_myst.labels import LabelIndex, build_label_index
+from latex_to_myst.labelstore import sync as sync_label_store
 from latex_to_myst.figures import action as figure_action
 from latex_to_myst.math import action as math_action
 from latex_to_myst.hyperlink import action as link_action
@@ -10,54 +17,107 @@ from latex_to_myst.basic import action as basic_action
 
 logger = logging.getLogger(__name__)
 ACTIONS = (
-    ("Math", math_action),
-    ("Link", link_action),
-    ("Figure", figure_action),
-    ("Basic", basic_action),
+    ("Math", track_image_counts(math_action)),
+    ("Link", track_image_counts(link_action)),
+    ("Figure", track_image_counts(figure_action)),
+    ("Basic", track_image_counts(basic_action)),
 )
 
 
-def finalize(doc: pf.Doc):
-    # add in title labels
-    for n, (elem, label) in enumerate(doc.section_labels_to_insert.items()):
-        idx = doc.content.index(elem)
-        doc.content.insert(idx, pf.RawBlock(f"({label.strip()})=", format="markdown"))
+class ActionSpec(tp.NamedTuple):
+    """Element types an action in :py:data:`ACTIONS` reacts to
 
+    The action must return None for every other element type. ``reads_subtree``
+    flags the elements for which the action inspects the descendants as left
+    by the previous actions, which the fused engine in
+    :py:mod:`latex_to_myst.engine` runs through the actions one at a time.
+    """
+
+    types: tp.Tuple[tp.Type[pf.Element], ...]
+    reads_subtree: tp.Callable[[pf.Element, pf.Doc], bool] = None
+
+
+ACTION_SPECS = {
+    "Math": ActionSpec(
+        (pf.Div, pf.Math),
+        lambda e, doc: isinstance(e, pf.Div) and bool(e.classes),
+    ),
+    "Link": ActionSpec((pf.Link,)),
+    "Figure": ActionSpec(
+        (pf.Para, pf.Table, pf.Image),
+        lambda e, doc: isinstance(e, (pf.Para, pf.Table))
+        and elem_has_multiple_figures(e, doc),
+    ),
+    "Basic": ActionSpec((pf.Para, pf.Str, pf.Header, pf.CodeBlock, pf.Div)),
+}
 
-def prepare(doc: pf.Doc):
-    # determine level of blocks
-    block_levels = {}
 
-    def get_level(e, d):
-        if is_directive_block(e):
-            level = directive_level(e, doc)
-            block_levels[e] = level
+def insert_section_labels(elem: pf.Element, labels: tp.Dict[pf.Header, str]) -> int:
+    """Insert the labels of the headers below the element, return their number
 
-    doc.walk(get_level)
-    doc.element_levels = block_levels
+    Every block list that holds a header is rebuilt once (headers can be nested
+    in divs at any depth).
+    """
+    inserted = 0
+    stack = [elem] if labels else []
+    while stack:
+        elem = stack.pop()
+        for child in elem._children:
+            obj = getattr(elem, child)
+            if isinstance(obj, pf.Element):
+                stack.append(obj)
+            elif isinstance(obj, pf.ListContainer):
+                items = list(obj)
+                if any(item in labels for item in items):
+                    blocks = []
+                    for item in items:
+                        if item in labels:
+                            label = labels[item].strip()
+                            blocks.append(pf.RawBlock(f"({label})=", format="markdown"))
+                            inserted += 1
+                        blocks.append(item)
+                    obj[:] = blocks
+                stack.extend(items)
+    return inserted
 
-    # determine labels of blocks for hyperlinks
-    block_labels = {}
 
-    def gather_labels(e, doc):
-        if hasattr(e, "identifier"):
-            if e.identifier:
-                block_labels[e.identifier] = e
-        elif get_element_type(e) == "displaymath":
-            label = "eqn"
-            if "\label" in pf.stringify(e):
-                label = re.findall(r"\\label\{([^\}]+)\}", e.text)[0]
-            block_labels[label] = e
+def finalize(doc: pf.Doc):
+    # add in title labels
+    labels = doc.section_labels_to_insert
+    inserted = insert_section_labels(doc, labels)
+    if inserted < len(labels):
+        logger.warning(f"{len(labels) - inserted} section labels not inserted.")
+
+
+def prepare(doc: pf.Doc, label_index: LabelIndex = None):
+    """Index the document for the filters
+
+    ``label_index`` is the index of the labels of the document, built from
+    the document if not given.
+    """
+    # count images below every element
+    doc.image_counts = {}
+    count_images(doc, doc.image_counts)
+
+    # determine level of blocks
+    doc.element_levels = directive_levels(doc, doc)
 
-    doc.walk(gather_labels)
-    doc.element_labels = block_labels
+    # resolve the labels of blocks for hyperlinks
+    doc.label_index = build_label_index(doc) if label_index is None else label_index
+    doc.element_labels = doc.label_index.elements
+    # labels of the other documents of a book, see latex_to_myst.labelstore
+    sync_label_store(doc)
+    dangling = doc.label_index.dangling(getattr(doc, "external_labels", {}))
+    if dangling:
+        logger.warning(f"References to undefined labels: {sorted(dangling)}")
 
     doc.section_labels_to_insert = {}
+    doc.image_urls = []
 
 
 def main(doc: pf.Doc = None):
     return pf.run_filters(
-        [math_action, link_action, figure_action, basic_action],
+        [action for _, action in ACTIONS],
         doc=doc,
         finalize=finalize,
         prepare=prepare,
@@ -6,12 +6,13 @@ that are compatible with MyST syntax.
 import re
 import typing as tp
 import logging
-from functools import partial
 import panflute as pf
+from latex_to_myst.equations import prepare_equation
 from latex_to_myst.helpers import (
     create_directive_block,
     create_generic_div_block,
     remove_emph,
+    remove_nodes,
     stringify_until_match,
     SUPPORTED_AMSTHM_BLOCKS,
 )
@@ -87,7 +88,7 @@ def create_amsthm_blocks(elem: pf.Div, doc: pf.Doc = None) -> pf.Para:
     if block_type == "proof":
         elem.replace_keyword("Proof.", pf.Str(""), 1)
     else:
-        pattern = fr"({block_type.capitalize()}\ [0-9|\.\ ]*)"
+        pattern = rf"({block_type.capitalize()}\ [0-9|\.\ ]*)"
         pattern_with_title = pattern + r"\(([^\)]*)\)\.?"
 
         if not re.findall(pattern, pf.stringify(elem.content[0])):
@@ -113,29 +114,11 @@ def create_amsthm_blocks(elem: pf.Div, doc: pf.Doc = None) -> pf.Para:
 
             # remove the label from the content of the block
             if pat_to_remove is not None:
-                current_substring = []
-                node_list = []
-
-                get_substring = partial(
-                    stringify_until_match,
-                    current_substring=current_substring,
-                    node_list=node_list,
-                    match_substring=pat_to_remove,
-                )
-                try:
-                    elem.walk(get_substring)
-                except (StopIteration, RuntimeError):
-
-                    def remove_node(e, doc):
-                        if e in node_list:
-                            return []
-                        return e
-
-                    elem.walk(remove_node)
-                except Exception as e:
-                    raise RuntimeError("Unknown Error in finding substring") from e
-                else:
+                node_list = stringify_until_match(elem, pat_to_remove)
+                if node_list is None:
                     logger.error(f"{pat_to_remove} not found.")
+                else:
+                    remove_nodes(elem, node_list)
 
     # create content of the Div
     content = []
@@ -166,23 +149,22 @@ def create_displaymath(elem: pf.Math, doc: pf.Doc = None) -> pf.Span:
 
         a = \int_1^2 u(t) dt
         ```
+
+    The label and the content are looked up in the equation cache, see
+    :py:mod:`latex_to_myst.equations`.
     """
     if not (isinstance(elem, pf.Math) and elem.format == "DisplayMath"):
         return elem
 
-    content = elem.text
-    identifier = None
-    if "\label" in pf.stringify(elem):
-        identifier = re.findall(r"\\label\{([^\}]+)\}", elem.text)[0]
-        content = content.replace("\label{%s}" % identifier, "")
+    equation = prepare_equation(elem.text)
     content = [
         pf.SoftBreak,
         pf.RawInline(
-            f":label: {identifier}\n" if identifier is not None else "",
+            f":label: {equation.label}\n" if equation.label is not None else "",
             format="markdown",
         ),
         pf.SoftBreak,
-        pf.RawInline(content, format="markdown"),
+        pf.RawInline(equation.content, format="markdown"),
     ]
     block = create_directive_block(elem, doc, content, "math", pf.Span)
     return pf.Span(pf.Str("\n"), *block.content)
@@ -0,0 +1,355 @@
+"""Conversion pipeline shared by the command line entry points
+
+The conversion of a LaTeX document to MyST happens in three steps:
+
+1. :py:func:`parse` the LaTeX source (with the used part of the macro
+   preamble prepended) into a :py:class:`panflute.Doc` using pandoc's LaTeX
+   reader,
+2. :py:func:`run_actions` applies the filters in
+   :py:data:`latex_to_myst.main.ACTIONS` to the document,
+3. :py:func:`to_markdown` serializes the document using pandoc's markdown
+   writer, or the native writer of :py:mod:`latex_to_myst.writer`.
+
+pandoc runs through the backend of :py:mod:`latex_to_myst.backend`.
+"""
+import io
+import os
+import json
+import shutil
+import tempfile
+import typing as tp
+import logging
+import functools
+from pathlib import Path
+import panflute as pf
+from .backend import PandocBackend, get_backend, normalize_output
+from .cache import ASTCache, default_cache_dir
+from .codec import dump_doc, load_doc
+from .labelstore import ANONYMOUS_SOURCE, LabelStore, attach
+from .preamble import compile_preamble
+from .profiling import Profiler, stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MACROS_PATH = Path(__file__).parent / "macros.tex"
+PANDOC_VERSION_FILE = "pandoc-version.json"
+
+
+def _probe_pandoc_version() -> tp.Tuple[int, ...]:
+    return tuple(pf.tools.PandocVersion().version)
+
+
+@functools.lru_cache(maxsize=None)
+def pandoc_version() -> tp.Tuple[int, ...]:
+    """Version of the pandoc found on the path
+
+    Reading the version spawns pandoc, so the result is remembered in
+    :py:data:`PANDOC_VERSION_FILE` in the cache directory, keyed by the path
+    and modification time of the pandoc binary.
+    """
+    path = shutil.which("pandoc")
+    if path is None:
+        return _probe_pandoc_version()
+    path = os.path.realpath(path)
+    record_path = default_cache_dir() / PANDOC_VERSION_FILE
+    mtime = None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        record = json.loads(record_path.read_text())
+    except (OSError, ValueError):
+        record = {}
+    entry = record.get(path)
+    if isinstance(entry, dict) and entry.get("mtime") == mtime:
+        return tuple(entry["version"])
+
+    version = _probe_pandoc_version()
+    record[path] = dict(mtime=mtime, version=list(version))
+    try:
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=record_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp, record_path)
+    except OSError as e:
+        logger.warning(f"Failed to record pandoc version: {e}")
+    return version
+
+
+def check_pandoc_version() -> None:
+    """Raise if the pandoc found on the path is too old"""
+    if pandoc_version() < (2, 11):
+        raise ModuleNotFoundError("Pandoc >= 2.11 required.")
+
+
+def load_macros(
+    macro_files: tp.Iterable[tp.Union[str, Path]] = (), default_macros: bool = True
+) -> str:
+    """Concatenate the default macros and the macro files into a preamble"""
+    macros = DEFAULT_MACROS_PATH.read_text() if default_macros else ""
+    for fname in macro_files:
+        with open(Path(fname), "r") as f:
+            macros += f.read()
+    return macros
+
+
+def parse_bytes(
+    text: str,
+    macros: str = "",
+    cache: ASTCache = None,
+    backend: PandocBackend = None,
+) -> bytes:
+    """Parse LaTeX source into the pandoc JSON AST, encoded in UTF-8
+
+    Only the definitions of the macro preamble that the document uses are
+    handed to pandoc, see :py:mod:`latex_to_myst.preamble`. If a cache is
+    given, the pandoc JSON AST is looked up in (and otherwise stored to) the
+    cache so that unchanged documents skip pandoc entirely. pandoc runs
+    through the backend, default to :py:func:`latex_to_myst.backend.get_backend`.
+    """
+    backend = backend or get_backend()
+    macros = compile_preamble(macros).for_document(text)
+    if cache is None:
+        return backend.convert_bytes((macros + text).encode("utf-8"), "latex", "json")
+
+    key = cache.key(text, macros)
+    ast = cache.get_bytes(key)
+    if ast is None:
+        ast = backend.convert_bytes((macros + text).encode("utf-8"), "latex", "json")
+        cache.put_bytes(key, ast)
+    else:
+        logger.info(f"Using cached AST {key}")
+    return ast
+
+
+def parse_json(
+    text: str,
+    macros: str = "",
+    cache: ASTCache = None,
+    backend: PandocBackend = None,
+) -> str:
+    """Parse LaTeX source into the pandoc JSON AST, see :py:func:`parse_bytes`"""
+    return parse_bytes(text, macros, cache=cache, backend=backend).decode("utf-8")
+
+
+def parse(
+    text: str,
+    macros: str = "",
+    cache: ASTCache = None,
+    backend: PandocBackend = None,
+) -> pf.Doc:
+    """Parse LaTeX source into a panflute document, see :py:func:`parse_bytes`
+
+    The AST is decoded by the codec of :py:mod:`latex_to_myst.codec`.
+    """
+    return load_doc(parse_bytes(text, macros, cache=cache, backend=backend))
+
+
+ENGINES = ("legacy", "fused", "compact")
+
+
+def filter_ast(
+    ast: tp.Union[str, bytes],
+    actions: tp.Sequence[tp.Tuple[str, tp.Callable]] = None,
+    profiler: Profiler = None,
+    label_store: LabelStore = None,
+    source: str = ANONYMOUS_SOURCE,
+    external_labels: tp.Dict[str, tp.Optional[str]] = None,
+    substitutions_offset: int = 0,
+) -> "CompactResult":
+    """Run the filters on a JSON AST with the ``compact`` engine
+
+    The AST is filtered without decoding it into a panflute document, see
+    :py:class:`latex_to_myst.compact_engine.CompactEngine`. ``actions`` and
+    ``profiler`` are the ones of :py:func:`run_actions`.
+    """
+    from .main import ACTIONS
+    from .compact_engine import CompactEngine
+
+    actions = ACTIONS if actions is None else tuple(actions)
+    if profiler is not None:
+        actions = tuple(
+            (name, profiler.wrap_action(f"action:{name}", action))
+            for name, action in actions
+        )
+    with stage(profiler, "filters"):
+        return CompactEngine(actions).run(
+            ast, label_store, source, external_labels, substitutions_offset
+        )
+
+
+def run_actions(
+    doc: pf.Doc,
+    engine: str = "legacy",
+    profiler: Profiler = None,
+    actions: tp.Sequence[tp.Tuple[str, tp.Callable]] = None,
+    checkpoint: tp.Callable[[str, pf.Doc], None] = None,
+    resume_from: str = None,
+) -> pf.Doc:
+    """Run all filters in :py:data:`ACTIONS` on the document
+
+    With the ``legacy`` engine every filter is a separate
+    :py:func:`panflute.run_filter` pass, with the ``fused`` engine all filters
+    are applied in a single traversal by
+    :py:class:`latex_to_myst.engine.FusedEngine`. The ``compact`` engine runs
+    them on the JSON AST of the document, see :py:func:`filter_ast`, it is
+    faster when the AST is at hand rather than a document. All give the same
+    output.
+
+    A filter that fails is logged and skipped, the document is returned in
+    whatever state the remaining filters left it.
+
+    If a :py:class:`latex_to_myst.profiling.Profiler` is given, ``prepare``,
+    ``finalize`` and every filter are recorded as stages of it.
+
+    ``actions`` replaces :py:data:`ACTIONS`, with the fused engine every
+    action needs an entry in :py:data:`latex_to_myst.main.ACTION_SPECS`.
+
+    With the ``legacy`` engine, ``checkpoint`` is called with the name and the
+    document after every filter that succeeds, see
+    :py:mod:`latex_to_myst.checkpoint`. If ``resume_from`` names a filter, the
+    document is its checkpoint: ``prepare`` and the filters up to and including
+    it are skipped.
+    """
+    # the filters are only imported once a document is converted
+    from .main import ACTIONS, prepare, finalize
+    from .engine import FusedEngine
+    from .checkpoint import PARSE_STAGE
+
+    actions = ACTIONS if actions is None else tuple(actions)
+    names = [name for name, _ in actions]
+    start = 0
+    if resume_from not in (None, PARSE_STAGE):
+        if resume_from not in names:
+            raise ValueError(f"Unknown stage '{resume_from}', use one of {names}.")
+        if engine != "legacy":
+            raise ValueError("Only the legacy engine can resume after a filter.")
+        start = names.index(resume_from) + 1
+
+    if engine == "compact":
+        result = filter_ast(
+            dump_doc(doc),
+            actions,
+            profiler,
+            getattr(doc, "label_store", None),
+            getattr(doc, "label_source", ANONYMOUS_SOURCE),
+            getattr(doc, "external_labels", None),
+            getattr(doc, "substitutions_offset", 0),
+        )
+        doc = load_doc(result.ast)
+        doc.image_urls = result.image_urls
+        return doc
+
+    if profiler is not None:
+        actions = tuple(
+            (name, profiler.wrap_action(f"action:{name}", action))
+            for name, action in actions
+        )
+        prepare = profiler.wrap("prepare", prepare)
+        finalize = profiler.wrap("finalize", finalize)
+
+    if engine == "fused":
+        logger.info(f"Running {len(actions)} Filters in a single traversal")
+        try:
+            with stage(profiler, "filters"):
+                prepare(doc)
+                doc = FusedEngine(actions).run(doc)
+                finalize(doc)
+        except Exception as e:
+            logger.error(f"Parsing failed: {type(e).__name__}: {e}")
+        return doc
+    if engine != "legacy":
+        raise ValueError(f"Unknown engine '{engine}', use one of {ENGINES}.")
+
+    for n, (_name, _action) in enumerate(actions[start:], start):
+        logger.info(f"Running {n+1}/{len(actions)} Filter: {_name}")
+        try:
+            with stage(profiler, f"action:{_name}"):
+                doc = pf.run_filter(
+                    _action,
+                    doc=doc,
+                    prepare=prepare if n == 0 else None,
+                    finalize=finalize if n == len(actions) - 1 else None,
+                )
+        except Exception as e:
+            logger.error(f"Parsing failed in filter {_name}: {type(e).__name__}: {e}")
+            continue
+        if checkpoint is not None:
+            checkpoint(_name, doc)
+    return doc
+
+
+WRITERS = ("pandoc", "native")
+
+
+def write_output(
+    doc: pf.Doc,
+    stream: tp.TextIO,
+    writer: str = "pandoc",
+    backend: PandocBackend = None,
+) -> None:
+    """Write the filtered document as markdown to the stream
+
+    The ``native`` writer streams the markdown without a pandoc round-trip.
+    Documents it cannot write (e.g. with tables or notes) are logged and
+    serialized by pandoc instead, the output is the same either way.
+    """
+    if writer == "native":
+        from .writer import unsupported_elements, write_markdown
+
+        unsupported = unsupported_elements(doc)
+        if not unsupported:
+            write_markdown(doc, stream)
+            return
+        logger.info(
+            f"Native writer does not support {', '.join(sorted(unsupported))}, "
+            "using pandoc"
+        )
+    elif writer != "pandoc":
+        raise ValueError(f"Unknown writer '{writer}', use one of {WRITERS}.")
+    stream.write(ast_to_markdown(dump_doc(doc), backend=backend))
+
+
+def to_markdown(
+    doc: pf.Doc, writer: str = "pandoc", backend: PandocBackend = None
+) -> str:
+    """Serialize the filtered document to markdown"""
+    with io.StringIO() as stream:
+        write_output(doc, stream, writer=writer, backend=backend)
+        return stream.getvalue()
+
+
+def ast_to_markdown(
+    ast: tp.Union[str, bytes], writer: str = "pandoc", backend: PandocBackend = None
+) -> str:
+    """Serialize a filtered JSON AST to markdown, see :py:func:`write_output`"""
+    if writer != "pandoc":
+        return to_markdown(load_doc(ast), writer=writer, backend=backend)
+    if isinstance(ast, str):
+        ast = ast.encode("utf-8")
+    markdown = (backend or get_backend()).convert_bytes(ast, "json", "markdown")
+    return normalize_output(markdown.decode("utf-8"))
+
+
+def convert(
+    text: str,
+    macros: str = "",
+    cache: ASTCache = None,
+    engine: str = "legacy",
+    writer: str = "pandoc",
+    backend: PandocBackend = None,
+    label_store: LabelStore = None,
+    source: str = ANONYMOUS_SOURCE,
+) -> str:
+    """Convert LaTeX source to MyST markdown
+
+    With a label store, the labels of the document are recorded under source
+    and references to labels of other sources are resolved, see
+    :py:mod:`latex_to_myst.labelstore`.
+    """
+    if engine == "compact":
+        ast = parse_bytes(text, macros, cache=cache, backend=backend)
+        ast = filter_ast(ast, label_store=label_store, source=source).ast
+        return ast_to_markdown(ast, writer=writer, backend=backend)
+    doc = parse(text, macros, cache=cache, backend=backend)
+    doc = run_actions(attach(doc, label_store, source), engine=engine)
+    return to_markdown(doc, writer=writer, backend=backend)
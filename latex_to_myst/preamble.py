@@ -0,0 +1,227 @@
+"""Precompiled macro preamble
+
+The macro files (including the bundled ``macros.tex``) are prepended to every
+document before it is handed to pandoc. Rather than having pandoc re-read every
+definition for every document, the preamble is parsed once into a table of
+definitions by :py:func:`compile_preamble` and :py:meth:`Preamble.for_document`
+emits only the definitions that a document (transitively) uses.
+
+Anything in the macro files that is not a recognized definition (e.g.
+``\\makeatletter`` or ``\\setcounter``) is always kept, and documents that
+build control sequences dynamically with ``\\csname`` get the full preamble.
+"""
+import re
+import typing as tp
+import logging
+import functools
+
+logger = logging.getLogger(__name__)
+
+# commands that define a control sequence from its first argument
+_COMMAND_DEFINITIONS = {
+    "newcommand",
+    "renewcommand",
+    "providecommand",
+    "DeclareRobustCommand",
+    "DeclareMathOperator",
+}
+# commands that define an environment from its first argument
+_ENVIRONMENT_DEFINITIONS = {"newenvironment", "renewenvironment", "newtheorem"}
+# primitives that define the control sequence following them
+_PRIMITIVE_DEFINITIONS = {"def", "gdef", "edef", "xdef", "let"}
+
+_CONTROL_WORD = re.compile(r"\\([A-Za-z@]+)")
+_ENVIRONMENT = re.compile(r"\\(?:begin|end)\s*\{([^}]*)\}")
+_DEFINITION = re.compile(r"\\([A-Za-z]+)\*?")
+_SPACE_OR_COMMENT = re.compile(r"(?:\s|(?<!\\)%[^\n]*)*")
+
+
+class Definition(tp.NamedTuple):
+    """A chunk of the preamble
+
+    ``defines`` holds the control sequences (as ``\\name``) and environments
+    (as ``name``) defined by the chunk, chunks that define nothing are always
+    emitted. ``uses`` holds everything referenced by the chunk.
+    """
+
+    source: str
+    defines: tp.FrozenSet[str]
+    uses: tp.FrozenSet[str]
+
+
+def _references(text: str) -> tp.Set[str]:
+    """Control sequences and environments referenced in LaTeX source"""
+    refs = {"\\" + name for name in _CONTROL_WORD.findall(text)}
+    refs.update(name.strip() for name in _ENVIRONMENT.findall(text))
+    return refs
+
+
+def _skip_group(text: str, pos: int) -> int:
+    """Return position after the balanced ``{...}`` group starting at pos"""
+    depth = 0
+    n = pos
+    while n < len(text):
+        c = text[n]
+        if c == "\\":
+            n += 1
+        elif c == "%":
+            n = text.find("\n", n)
+            if n < 0:
+                break
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return n + 1
+        n += 1
+    raise ValueError("Unbalanced braces in macro definition")
+
+
+def _skip_optional(text: str, pos: int) -> int:
+    """Return position after the ``[...]`` argument at pos, if any"""
+    pos = _SPACE_OR_COMMENT.match(text, pos).end()
+    if pos < len(text) and text[pos] == "[":
+        end = text.find("]", pos)
+        if end < 0:
+            raise ValueError("Unterminated optional argument in macro definition")
+        return end + 1
+    return pos
+
+
+def _read_argument(text: str, pos: int) -> tp.Tuple[str, int]:
+    """Return the mandatory argument at pos (braced or a single control word)"""
+    pos = _SPACE_OR_COMMENT.match(text, pos).end()
+    if pos < len(text) and text[pos] == "{":
+        end = _skip_group(text, pos)
+        return text[pos + 1 : end - 1].strip(), end
+    match = _CONTROL_WORD.match(text, pos)
+    if match is None:
+        raise ValueError("Missing argument in macro definition")
+    return match.group(0), match.end()
+
+
+def _parse_definition(text: str, pos: int) -> tp.Tuple[str, tp.Set[str], int]:
+    """Parse the definition starting at pos
+
+    Returns the name defined, names referenced only through arguments (e.g. the
+    shared counter of a theorem) and the end of the definition. Raises
+    ValueError if pos does not start a recognized definition.
+    """
+    match = _DEFINITION.match(text, pos)
+    if match is None:
+        raise ValueError("Not a definition")
+    command = match.group(1)
+    pos = match.end()
+    uses = set()
+    if command in _COMMAND_DEFINITIONS:
+        name, pos = _read_argument(text, pos)
+        if command != "DeclareMathOperator":
+            pos = _skip_optional(text, pos)
+            pos = _skip_optional(text, pos)
+        _, pos = _read_argument(text, pos)
+    elif command == "newtheorem":
+        name, pos = _read_argument(text, pos)
+        counter = _skip_optional(text, pos)
+        if counter != _SPACE_OR_COMMENT.match(text, pos).end():
+            uses.add(text[text.index("[", pos) + 1 : counter - 1].strip())
+        _, pos = _read_argument(text, counter)
+        pos = _skip_optional(text, pos)
+    elif command in _ENVIRONMENT_DEFINITIONS:
+        name, pos = _read_argument(text, pos)
+        pos = _skip_optional(text, pos)
+        pos = _skip_optional(text, pos)
+        _, pos = _read_argument(text, pos)
+        _, pos = _read_argument(text, pos)
+    elif command in _PRIMITIVE_DEFINITIONS:
+        name, pos = _read_argument(text, pos)
+        if command == "let":
+            pos = _SPACE_OR_COMMENT.match(text, pos).end()
+            if text.startswith("=", pos):
+                pos += 1
+            _, pos = _read_argument(text, pos)
+        else:
+            start = text.find("{", pos)
+            if start < 0:
+                raise ValueError("Missing body in macro definition")
+            pos = _skip_group(text, start)
+    else:
+        raise ValueError("Not a definition")
+    if not name.startswith("\\") and command not in _ENVIRONMENT_DEFINITIONS:
+        name = "\\" + name
+    return name, uses, pos
+
+
+class Preamble:
+    """Table of definitions parsed from a macro preamble"""
+
+    def __init__(self, macros: str):
+        self.macros = macros
+        self.definitions = self._split(macros)
+        self._by_name = {}
+        for n, definition in enumerate(self.definitions):
+            for name in definition.defines:
+                self._by_name.setdefault(name, []).append(n)
+        self._always = [n for n, d in enumerate(self.definitions) if not d.defines]
+
+    @staticmethod
+    def _split(macros: str) -> tp.List[Definition]:
+        """Split the preamble into definitions
+
+        Every chunk spans from the start of a definition to the start of the
+        next one so that concatenating all chunks gives back the preamble.
+        """
+        starts = []
+        defines = []
+        pos = 0
+        while True:
+            pos = _SPACE_OR_COMMENT.match(macros, pos).end()
+            if pos >= len(macros):
+                break
+            starts.append(pos)
+            try:
+                name, uses, pos = _parse_definition(macros, pos)
+                names = frozenset([name])
+            except ValueError:
+                # keep anything that is not a definition, up to the end of line
+                names, uses = frozenset(), set()
+                end = macros.find("\n", pos)
+                pos = len(macros) if end < 0 else end + 1
+            defines.append((names, uses))
+        if starts:
+            starts[0] = 0
+        ends = starts[1:] + [len(macros)]
+        return [
+            Definition(macros[s:e], names, frozenset(_references(macros[s:e]) | uses))
+            for s, e, (names, uses) in zip(starts, ends, defines)
+        ]
+
+    def for_document(self, text: str) -> str:
+        """Preamble with only the definitions the document depends on"""
+        needed = _references(text)
+        if "\\csname" in needed:
+            return self.macros
+        selected = set(self._always)
+        pending = set(needed)
+        for n in self._always:
+            pending.update(self.definitions[n].uses)
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            for n in self._by_name.get(name, ()):
+                if n not in selected:
+                    selected.add(n)
+                    pending.update(self.definitions[n].uses)
+        if "\\csname" in seen:
+            return self.macros
+        return "".join(self.definitions[n].source for n in sorted(selected))
+
+
+@functools.lru_cache(maxsize=16)
+def compile_preamble(macros: str) -> Preamble:
+    """Parse the macro preamble once, cached by the preamble text"""
+    logger.debug(f"Compiling macro preamble of {len(macros)} characters")
+    return Preamble(macros)
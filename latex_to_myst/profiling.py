@@ -0,0 +1,264 @@
+"""Per-stage profile of a conversion
+
+A :py:class:`Profiler` splits the conversion into named stages (the pandoc
+parse, ``prepare``, every action of :py:data:`latex_to_myst.main.ACTIONS`,
+``finalize`` and the markdown writer) and records for each:
+
+- the wall time spent in the stage itself, i.e. without the stages nested in
+  it (``prepare`` runs within the first action's :py:func:`panflute.run_filter`
+  call, for instance),
+- the number of elements an action was called on and the number of elements
+  it replaced or deleted,
+- the number of calls to the costly helpers in :py:data:`HOT_FUNCTIONS`,
+- optionally a :py:mod:`cProfile` dump of the stage, readable with
+  :py:mod:`pstats`.
+
+The helpers are counted by temporarily replacing them in every module of
+panflute and of this package that refers to them, which happens while the
+profiler is entered as a context manager.
+
+With the fused engine the actions run interleaved in a single traversal, so
+their time is only known as a whole (the ``filters`` stage) and the action
+stages only hold the element counts.
+
+Counting the helpers patches them for the whole process, so only one profiler
+can be active at a time and it profiles a single conversion: do not profile
+while a :py:class:`latex_to_myst.Converter` or
+:py:class:`latex_to_myst.aio.AsyncConverter` converts other documents in other
+threads, their helper calls would be counted in the stages of the profile.
+Entering a second profiler raises :py:class:`RuntimeError`.
+
+The report also holds the time spent decoding and encoding the pandoc AST
+during the profile, see :py:mod:`latex_to_myst.codec`, and the hits and misses
+of :py:mod:`latex_to_myst.equations`.
+"""
+import json
+import time
+import sys
+import functools
+import threading
+import contextlib
+import typing as tp
+import logging
+from collections import Counter
+from pathlib import Path
+from . import codec, equations
+
+logger = logging.getLogger(__name__)
+
+# costly helpers whose calls are counted, as (module, name)
+HOT_FUNCTIONS = (
+    ("panflute.tools", "stringify"),
+    ("latex_to_myst.helpers", "directive_level"),
+    ("latex_to_myst.helpers", "directive_levels"),
+    ("latex_to_myst.helpers", "elem_has_multiple_figures"),
+    ("latex_to_myst.helpers", "get_element_type"),
+    ("latex_to_myst.helpers", "stringify_until_match"),
+    ("latex_to_myst.helpers", "count_images"),
+)
+# modules in which references to the hot functions are replaced
+INSTRUMENTED_PACKAGES = ("panflute", "latex_to_myst")
+
+# held by the active profiler, the patched helpers are process-wide
+_active = threading.Lock()
+
+
+class StageStats:
+    """Measurements of a stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall: tp.Optional[float] = None
+        self.entered = 0
+        self.visited = 0
+        self.replaced = 0
+        self.calls = Counter()
+        self.profile: tp.Optional["cProfile.Profile"] = None
+
+    def to_dict(self) -> tp.Dict[str, tp.Any]:
+        return dict(
+            name=self.name,
+            wall=self.wall,
+            entered=self.entered,
+            visited=self.visited,
+            replaced=self.replaced,
+            calls=dict(sorted(self.calls.items())),
+        )
+
+
+class Profiler:
+    """Record per-stage measurements of a conversion
+
+    Arguments:
+        stats_dir: directory to which a ``<stage>.pstats`` file is written
+          for every stage, no cProfile dumps if None
+    """
+
+    def __init__(self, stats_dir: tp.Union[str, Path] = None):
+        self.stats_dir = None if stats_dir is None else Path(stats_dir)
+        self.stages: tp.Dict[str, StageStats] = {}
+        self._stack: tp.List[StageStats] = []
+        self._patched: tp.List[tp.Tuple[tp.Any, str, tp.Callable]] = []
+        self._codec_stats = codec.stats.to_dict()
+        self._equation_stats = equations.get_equation_cache().stats()
+
+    def _get(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> tp.Iterator[StageStats]:
+        """Attribute the time and helper calls of the block to a stage
+
+        Entering a stage pauses the enclosing one, a stage entered several
+        times accumulates its measurements.
+        """
+        stats = self._get(name)
+        stats.entered += 1
+        parent = self._stack[-1] if self._stack else None
+        if parent is not None and parent.profile is not None:
+            parent.profile.disable()
+        if self.stats_dir is not None:
+            if stats.profile is None:
+                import cProfile
+
+                stats.profile = cProfile.Profile()
+            stats.profile.enable()
+        self._stack.append(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            if stats.profile is not None:
+                stats.profile.disable()
+            stats.wall = (stats.wall or 0.0) + elapsed
+            if parent is not None:
+                parent.wall = (parent.wall or 0.0) - elapsed
+                if parent.profile is not None:
+                    parent.profile.enable()
+
+    def wrap(self, name: str, func: tp.Callable) -> tp.Callable:
+        """Run every call of func as the stage name"""
+
+        @functools.wraps(func)
+        def staged(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return staged
+
+    def wrap_action(self, name: str, action: tp.Callable) -> tp.Callable:
+        """Count the elements the action visits and replaces in stage name"""
+        stats = self._get(name)
+
+        @functools.wraps(action)
+        def counted(elem, doc=None):
+            stats.visited += 1
+            altered = action(elem, doc)
+            if altered is not None and altered is not elem:
+                stats.replaced += 1
+            return altered
+
+        return counted
+
+    def _count(self, name: str, func: tp.Callable) -> tp.Callable:
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            stats = self._stack[-1] if self._stack else self._get("other")
+            stats.calls[name] += 1
+            return func(*args, **kwargs)
+
+        return counted
+
+    def _patch(self) -> None:
+        """Replace the hot functions by counting wrappers in all modules"""
+        modules = [
+            m
+            for n, m in list(sys.modules.items())
+            if m is not None and n.split(".")[0] in INSTRUMENTED_PACKAGES
+        ]
+        for module_name, name in HOT_FUNCTIONS:
+            module = sys.modules.get(module_name)
+            if module is None:
+                __import__(module_name)
+                module = sys.modules[module_name]
+            original = getattr(module, name)
+            counted = self._count(name, original)
+            for m in modules + [module]:
+                for attr, value in list(vars(m).items()):
+                    if value is original:
+                        setattr(m, attr, counted)
+                        self._patched.append((m, attr, original))
+
+    def _restore(self) -> None:
+        """Put the original functions back"""
+        for module, attr, original in reversed(self._patched):
+            setattr(module, attr, original)
+        self._patched = []
+
+    def __enter__(self) -> "Profiler":
+        if not _active.acquire(blocking=False):
+            raise RuntimeError(
+                "Another profiler is active, profile one conversion at a time."
+            )
+        try:
+            self._patch()
+        except BaseException:
+            self._restore()
+            _active.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._restore()
+        _active.release()
+
+    def report(self) -> tp.Dict[str, tp.Any]:
+        """Measurements of all stages, in the order they were created"""
+        stages = [s.to_dict() for s in self.stages.values()]
+        return dict(
+            stages=stages,
+            total_wall=sum(s["wall"] or 0.0 for s in stages),
+            calls=dict(
+                sum((s.calls for s in self.stages.values()), Counter()).most_common()
+            ),
+            codec=dict(
+                name=codec.get_codec().name, **codec.stats.since(self._codec_stats)
+            ),
+            equations={
+                name: equations.get_equation_cache().stats()[name]
+                - self._equation_stats[name]
+                for name in ("hits", "misses")
+            },
+        )
+
+    def dump_stats(self) -> tp.List[Path]:
+        """Write the cProfile dump of every stage to the stats directory"""
+        if self.stats_dir is None:
+            return []
+        self.stats_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for stats in self.stages.values():
+            if stats.profile is None:
+                continue
+            path = self.stats_dir / f"{stats.name.replace(':', '-')}.pstats"
+            stats.profile.dump_stats(str(path))
+            paths.append(path)
+        return paths
+
+    def write(self, path: tp.Union[str, Path]) -> None:
+        """Write the report as JSON, and the cProfile dumps if requested"""
+        report = self.report()
+        report["pstats"] = [str(p) for p in self.dump_stats()]
+        Path(path).write_text(json.dumps(report, indent=2))
+        logger.info(f"Wrote profile to {path}")
+
+
+def stage(profiler: tp.Optional[Profiler], name: str) -> tp.ContextManager:
+    """Stage of the profiler, or a no-op if profiler is None"""
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name)
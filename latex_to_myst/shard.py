@@ -0,0 +1,288 @@
+"""Convert a single large document in parallel section shards
+
+The source is split at the top-level ``\\chapter`` (or, if there are none,
+``\\section``) commands into shards that are converted in a pool of worker
+processes, see :py:func:`convert_sharded`. The conversion runs in two parallel
+phases so that the state shared across the document stays correct:
+
+1. every shard is parsed by pandoc and gathers the labels it defines (with the
+   type of the labelled element) and the number of subfigure substitutions it
+   will create,
+2. every shard runs the filters knowing the labels of all shards
+   (``doc.external_labels``, used by :py:mod:`latex_to_myst.hyperlink`) and
+   with its subfigure substitutions numbered after the ones of the preceding
+   shards (``doc.substitutions_offset``, used by
+   :py:mod:`latex_to_myst.figures`), and writes its markdown. The numbers
+   are the same as in a serial conversion.
+
+The metadata of the shards is merged into a single front matter followed by
+the markdown of the shards in order. Section labels are inserted by every
+shard since a heading and its label never end up in different shards.
+"""
+import io
+import os
+import re
+import json
+import typing as tp
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import panflute as pf
+from . import compact
+from .backend import PandocBackend, get_backend, set_backend
+from .cache import ASTCache
+from .codec import JSONCodec, get_codec, load_doc, set_codec
+from .equations import EquationCache, get_equation_cache, set_equation_cache
+from .labelstore import ANONYMOUS_SOURCE, LabelStore
+from .pipeline import convert, parse_json, run_actions, to_markdown
+
+logger = logging.getLogger(__name__)
+
+_BEGIN_DOCUMENT = re.compile(r"\\begin\s*\{document\}")
+_END_DOCUMENT = re.compile(r"\\end\s*\{document\}")
+# environments, comments and sectioning commands that can start a shard
+_TOKENS = re.compile(
+    r"(?<!\\)%[^\n]*"
+    r"|\\begin\s*\{[^}]*\}"
+    r"|\\end\s*\{[^}]*\}"
+    r"|\\(chapter|section)\b\*?"
+)
+
+# macro preamble, AST cache, filter engine and markdown writer of the worker
+# process, set by :py:func:`_init_worker`
+_WORKER_MACROS = ""
+_WORKER_CACHE = None
+_WORKER_ENGINE = "legacy"
+_WORKER_WRITER = "pandoc"
+
+
+class ShardInfo(tp.NamedTuple):
+    """Outcome of the first phase for a shard"""
+
+    ast: str
+    labels: tp.Dict[str, tp.Optional[str]]
+    n_substitutions: int
+    references: tp.FrozenSet[str] = frozenset()
+
+
+class ShardOutput(tp.NamedTuple):
+    """Outcome of the second phase for a shard"""
+
+    markdown: str
+    meta: tp.Dict[str, tp.Any]
+    api_version: tp.Tuple[int, ...]
+
+
+def _boundaries(body: str) -> tp.List[int]:
+    """Positions of the top-level sectioning commands that can start a shard"""
+    depth = 0
+    found = {"chapter": [], "section": []}
+    for match in _TOKENS.finditer(body):
+        token = match.group(0)
+        if token.startswith("%"):
+            continue
+        if token.startswith("\\begin"):
+            depth += 1
+        elif token.startswith("\\end"):
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            found[match.group(1)].append(match.start())
+    return found["chapter"] or found["section"]
+
+
+def split_document(text: str, n_shards: int) -> tp.List[str]:
+    """Split LaTeX source into at most n_shards self-contained documents
+
+    The shards are cut at top-level chapters (or sections) and hold a similar
+    amount of source. The preamble before ``\\begin{document}``, if any, is
+    repeated in every shard.
+    """
+    begin = _BEGIN_DOCUMENT.search(text)
+    prologue, epilogue = "", ""
+    body = text
+    if begin is not None:
+        prologue = text[: begin.end()]
+        body = text[begin.end() :]
+        end = _END_DOCUMENT.search(body)
+        if end is not None:
+            epilogue = body[end.start() :]
+            body = body[: end.start()]
+        else:
+            epilogue = "\\end{document}\n"
+
+    starts = [s for s in _boundaries(body) if s > 0]
+    pieces = [body[s:e] for s, e in zip([0] + starts, starts + [len(body)])]
+    target = len(body) / max(n_shards, 1)
+    shards = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) / 2 > target:
+            shards.append(current)
+            current = ""
+        current += piece
+    shards.append(current)
+    return [prologue + shard + epilogue for shard in shards]
+
+
+def _init_worker(
+    macros: str,
+    cache: tp.Optional[ASTCache],
+    engine: str,
+    writer: str,
+    log_level: int,
+    backend: PandocBackend,
+    codec: JSONCodec = None,
+    equations: EquationCache = None,
+) -> None:
+    """Initialize a worker process with the shared macro preamble and cache"""
+    global _WORKER_MACROS, _WORKER_CACHE, _WORKER_ENGINE, _WORKER_WRITER
+    _WORKER_MACROS = macros
+    _WORKER_CACHE = cache
+    _WORKER_ENGINE = engine
+    _WORKER_WRITER = writer
+    logging.basicConfig(format="[%(levelname)s] %(message)s", level=log_level)
+    set_backend(backend)
+    if codec is not None:
+        set_codec(codec)
+    if equations is not None:
+        set_equation_cache(equations)
+
+
+def parse_shard(text: str, macros: str = "", cache: ASTCache = None) -> ShardInfo:
+    """First phase: parse the shard and gather its labels and substitutions
+
+    The labels and substitutions are counted on a compact tree, see
+    :py:mod:`latex_to_myst.compact`, rather than a panflute document.
+    """
+    ast = parse_json(text, macros, cache=cache)
+    root = compact.load(ast)
+    index = compact.build_label_index(root)
+    return ShardInfo(
+        ast,
+        index.types(),
+        compact.count_substitutions(root),
+        frozenset(index.references),
+    )
+
+
+def convert_shard(
+    ast: str,
+    external_labels: tp.Dict[str, tp.Optional[str]],
+    offset: int,
+    engine: str = "legacy",
+    writer: str = "pandoc",
+) -> ShardOutput:
+    """Second phase: filter the shard and write its markdown without metadata"""
+    doc = load_doc(ast)
+    doc.external_labels = external_labels
+    doc.substitutions_offset = offset
+    doc = run_actions(doc, engine=engine)
+    meta = doc.to_json()["meta"]
+    doc.metadata = {}
+    markdown = to_markdown(doc, writer=writer)
+    return ShardOutput(markdown, meta, doc.api_version)
+
+
+def _parse_shard(text: str) -> ShardInfo:
+    return parse_shard(text, _WORKER_MACROS, cache=_WORKER_CACHE)
+
+
+def _convert_shard(
+    ast: str, external_labels: tp.Dict[str, tp.Optional[str]], offset: int
+) -> ShardOutput:
+    return convert_shard(
+        ast, external_labels, offset, engine=_WORKER_ENGINE, writer=_WORKER_WRITER
+    )
+
+
+def merge_shards(outputs: tp.Sequence[ShardOutput], writer: str = "pandoc") -> str:
+    """Join the markdown of the shards under the merged front matter
+
+    The metadata is the one of the first shard, with the substitutions of all
+    shards.
+    """
+    meta = dict(outputs[0].meta)
+    substitutions = {}
+    for out in outputs:
+        substitutions.update(out.meta.get("substitutions", {}).get("c", {}))
+    if substitutions:
+        meta["substitutions"] = {"t": "MetaMap", "c": substitutions}
+    parts = []
+    if meta:
+        ast = {"pandoc-api-version": outputs[0].api_version, "meta": meta, "blocks": []}
+        doc = pf.load(io.StringIO(json.dumps(ast)))
+        parts.append(to_markdown(doc, writer=writer).rstrip("\n"))
+    parts.extend(out.markdown for out in outputs if out.markdown)
+    return "\n\n".join(parts)
+
+
+def convert_sharded(
+    text: str,
+    macros: str = "",
+    jobs: int = None,
+    cache: ASTCache = None,
+    engine: str = "legacy",
+    writer: str = "pandoc",
+    n_shards: int = None,
+    label_store: LabelStore = None,
+    source: str = ANONYMOUS_SOURCE,
+) -> str:
+    """Convert LaTeX source to MyST markdown in parallel section shards
+
+    The document is split into ``n_shards`` shards (default to the number of
+    jobs) converted by ``jobs`` worker processes. Documents without sections
+    to split at are converted as a whole. The labels of all shards are
+    recorded in the label store under source, see
+    :py:mod:`latex_to_myst.labelstore`.
+    """
+    jobs = jobs or os.cpu_count()
+    shards = split_document(text, n_shards or jobs)
+    if len(shards) == 1:
+        return convert(
+            text,
+            macros,
+            cache=cache,
+            engine=engine,
+            writer=writer,
+            label_store=label_store,
+            source=source,
+        )
+    logger.info(f"Converting {len(shards)} shards with {jobs} processes")
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(
+            macros,
+            cache,
+            engine,
+            writer,
+            logging.getLogger().level,
+            get_backend(),
+            get_codec(),
+            get_equation_cache(),
+        ),
+    ) as pool:
+        infos = list(pool.map(_parse_shard, shards))
+        # the labels of a shard itself take precedence in the hyperlink filter
+        labels = {}
+        duplicates = set()
+        for info in infos:
+            duplicates |= labels.keys() & info.labels.keys()
+            labels.update(info.labels)
+        if duplicates:
+            logger.info(f"Labels defined in several shards: {sorted(duplicates)}")
+        if label_store is not None:
+            label_store.update(source, labels)
+            references = set().union(*(info.references for info in infos))
+            labels = {
+                **label_store.resolve(references - labels.keys(), source),
+                **labels,
+            }
+
+        futures = []
+        offset = 0
+        for info in infos:
+            futures.append(pool.submit(_convert_shard, info.ast, labels, offset))
+            offset += info.n_substitutions
+        outputs = [future.result() for future in futures]
+    return merge_shards(outputs, writer)
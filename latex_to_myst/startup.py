@@ -0,0 +1,90 @@
+"""Startup profile of the command line entry points
+
+For short documents most of the wall time of ``latex2myst`` is spent before
+the conversion starts: importing panflute and the filters and asking pandoc
+for its version. With ``--startup-profile`` the entry points report where that
+time goes. Import times are measured in a fresh interpreter with
+``python -X importtime`` so that modules already imported by the current
+process are accounted for as well.
+"""
+import sys
+import subprocess
+import typing as tp
+
+# modules imported when converting a document, the command line entry points
+# import all but the first one lazily
+CONVERSION_MODULES = (
+    "latex_to_myst.cli",
+    "latex_to_myst.backend",
+    "latex_to_myst.codec",
+    "latex_to_myst.labelstore",
+    "latex_to_myst.equations",
+    "latex_to_myst.main",
+    "latex_to_myst.engine",
+)
+# modules the command line entry points only import for the options that use
+# them, e.g. the HTTP client of ``--pandoc-backend server``
+OPTIONAL_MODULES = (
+    "http.client",
+    "sqlite3",
+    "cProfile",
+    "latex_to_myst.checkpoint",
+    "latex_to_myst.watch",
+    "latex_to_myst.compact_engine",
+)
+
+
+class ImportTime(tp.NamedTuple):
+    """Import time of a module as reported by ``python -X importtime``"""
+
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def import_times(modules: tp.Iterable[str] = CONVERSION_MODULES) -> tp.List[ImportTime]:
+    """Measure the import time of the modules in a fresh interpreter"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        times.append(ImportTime(module.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def startup_report(
+    stages: tp.Dict[str, float] = None,
+    modules: tp.Iterable[str] = CONVERSION_MODULES,
+    top: int = 10,
+) -> str:
+    """Human readable summary of the import times and the startup stages
+
+    Arguments:
+        stages: seconds spent in other startup stages, e.g. the pandoc version
+          probe
+        modules: modules whose imports are measured
+        top: number of top-level packages to list
+    """
+    times = import_times(modules)
+    packages = {}
+    for t in times:
+        name = t.module.split(".")[0]
+        packages[name] = packages.get(name, 0) + t.self_us
+    total = sum(packages.values())
+
+    lines = [f"Imports: {total / 1e3:.1f} ms"]
+    for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"  {name:<24} {us / 1e3:8.1f} ms {100 * us / total:5.1f}%")
+    for name, seconds in (stages or {}).items():
+        lines.append(f"{name}: {seconds * 1e3:.1f} ms")
+    return "\n".join(lines)
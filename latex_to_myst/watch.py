@@ -0,0 +1,290 @@
+"""Rebuild a multi-file LaTeX project incrementally when its files change
+
+The files of a project are found by following the ``\\input`` and
+``\\include`` commands of the main file (see :py:func:`expand`). The inclusions
+that stand on their own line outside of any environment split the document
+into segments, e.g. one per chapter, every other inclusion is inlined into the
+segment it appears in. Every segment is converted like a shard of
+:py:mod:`latex_to_myst.shard`, and the :py:class:`Watcher` keeps the results of
+both phases so that a rebuild only parses the segments whose source changed
+and only filters the segments whose source, substitution offset or
+referenced labels changed.
+
+Changes are detected by polling the modification time of the files, which
+works on every platform and file system (including network drives, where
+inotify does not).
+"""
+import re
+import sys
+import time
+import hashlib
+import typing as tp
+import logging
+from pathlib import Path
+from .cache import ASTCache
+from .shard import (
+    ShardInfo,
+    ShardOutput,
+    convert_shard,
+    merge_shards,
+    parse_shard,
+)
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.25
+
+_BEGIN_DOCUMENT = re.compile(r"\\begin\s*\{document\}")
+_END_DOCUMENT = re.compile(r"\\end\s*\{document\}")
+# comments, environments and inclusions, in the order they appear
+_TOKENS = re.compile(
+    r"(?<!\\)%[^\n]*"
+    r"|\\begin\s*\{[^}]*\}"
+    r"|\\end\s*\{[^}]*\}"
+    r"|\\(?:input|include)\s*\{([^}]*)\}"
+)
+_COMMENT = re.compile(r"(?<!\\)%[^\n]*")
+
+
+class Segment(tp.NamedTuple):
+    """Part of the expanded document converted on its own"""
+
+    text: str
+    files: tp.FrozenSet[Path]
+
+
+def _resolve(name: str, directory: Path) -> Path:
+    path = directory / name.strip()
+    if not path.suffix:
+        path = path.with_suffix(".tex")
+    return path
+
+
+def _standalone(text: str, start: int, end: int) -> bool:
+    """Whether text[start:end] is alone on its line"""
+    line_start = text.rfind("\n", 0, start) + 1
+    line_end = text.find("\n", end)
+    line_end = len(text) if line_end < 0 else line_end
+    return not text[line_start:start].strip() and not text[end:line_end].strip()
+
+
+def _expand(
+    text: str,
+    directory: Path,
+    stack: tp.Tuple[Path, ...],
+    split: bool,
+    segments: tp.List[Segment],
+    files: tp.Set[Path],
+) -> str:
+    """Inline the inclusions of text, splitting segments off if split
+
+    Returns the text following the last segment split off, with the files it
+    was read from added to files.
+    """
+    depth = 0
+    current = []
+    pos = 0
+    for match in _TOKENS.finditer(text):
+        token = match.group(0)
+        if token.startswith("%"):
+            continue
+        if token.startswith("\\begin"):
+            depth += 1
+            continue
+        if token.startswith("\\end"):
+            depth = max(depth - 1, 0)
+            continue
+
+        path = _resolve(match.group(1), directory)
+        current.append(text[pos : match.start()])
+        pos = match.end()
+        if path in stack:
+            logger.error(f"Circular inclusion of {path}")
+            continue
+        try:
+            source = path.read_text()
+        except OSError as e:
+            logger.error(f"Failed to include {path}: {e}")
+            continue
+        nested_split = split and depth == 0 and _standalone(text, *match.span())
+        if nested_split:
+            segments.append(Segment("".join(current), frozenset(files)))
+            current = []
+            files.clear()
+        files.add(path)
+        current.append(
+            _expand(source, directory, stack + (path,), nested_split, segments, files)
+        )
+        if nested_split:
+            segments.append(Segment("".join(current), frozenset(files)))
+            current = []
+            files.clear()
+            files.add(stack[-1])
+    current.append(text[pos:])
+    return "".join(current)
+
+
+def expand(main: tp.Union[str, Path]) -> tp.Tuple[str, tp.List[Segment]]:
+    """Split a project into the preamble and the segments of its body
+
+    Inclusions are resolved relative to the directory of the main file, like
+    LaTeX does when it is run from there. The preamble (up to
+    ``\\begin{document}``, with its inclusions inlined) is empty for documents
+    without ``\\begin{document}``. Segments holding only comments are dropped.
+    """
+    main = Path(main)
+    text = main.read_text()
+    directory = main.parent
+    prologue = ""
+    prologue_files = {main}
+    begin = _BEGIN_DOCUMENT.search(text)
+    if begin is not None:
+        prologue = _expand(
+            text[: begin.end()], directory, (main,), False, [], prologue_files
+        )
+        text = text[begin.end() :]
+        end = _END_DOCUMENT.search(text)
+        if end is not None:
+            text = text[: end.start()]
+
+    segments = []
+    files = {main}
+    rest = _expand(text, directory, (main,), True, segments, files)
+    segments.append(Segment(rest, frozenset(files)))
+    segments = [
+        Segment(s.text, s.files | prologue_files)
+        for s in segments
+        if _COMMENT.sub("", s.text).strip()
+    ]
+    if begin is not None:
+        segments = [
+            Segment(prologue + s.text + "\n\\end{document}\n", s.files)
+            for s in segments
+        ]
+    return prologue, segments
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class Watcher:
+    """Convert a LaTeX project and rebuild it when its files change
+
+    Arguments:
+        main: main LaTeX file of the project
+        output: markdown file written on every build
+        macros: macro preamble, see :py:func:`latex_to_myst.pipeline.load_macros`
+        cache: parsed AST cache, shared with the other entry points
+        engine: filter engine, see :py:data:`latex_to_myst.pipeline.ENGINES`
+        writer: markdown writer, see :py:data:`latex_to_myst.pipeline.WRITERS`
+    """
+
+    def __init__(
+        self,
+        main: tp.Union[str, Path],
+        output: tp.Union[str, Path],
+        macros: str = "",
+        cache: ASTCache = None,
+        engine: str = "legacy",
+        writer: str = "pandoc",
+    ):
+        self.main = Path(main)
+        self.output = Path(output)
+        self.macros = macros
+        self.cache = cache
+        self.engine = engine
+        self.writer = writer
+        self.files = {self.main}
+        # results of the first phase keyed by the digest of the segment source
+        self.infos: tp.Dict[str, ShardInfo] = {}
+        # results of the second phase keyed by the digest of the segment
+        # source, the substitution offset and the labels it references
+        self.outputs: tp.Dict[tp.Tuple, ShardOutput] = {}
+        self.n_parsed = 0
+        self.n_filtered = 0
+
+    def build(self) -> str:
+        """Convert the project, reusing the results of unchanged segments"""
+        _, segments = expand(self.main)
+        self.files = {self.main}.union(*(s.files for s in segments))
+        self.n_parsed = self.n_filtered = 0
+
+        infos = {}
+        for segment in segments:
+            key = _digest(segment.text)
+            if key not in infos:
+                infos[key] = self.infos.get(key)
+                if infos[key] is None:
+                    infos[key] = parse_shard(segment.text, self.macros, self.cache)
+                    self.n_parsed += 1
+        self.infos = infos
+
+        labels = {}
+        for segment in segments:
+            labels.update(infos[_digest(segment.text)].labels)
+
+        outputs = {}
+        results = []
+        offset = 0
+        for segment in segments:
+            digest = _digest(segment.text)
+            info = infos[digest]
+            referenced = tuple(sorted((r, labels.get(r)) for r in info.references))
+            key = (digest, offset, referenced)
+            if key not in outputs:
+                outputs[key] = self.outputs.get(key)
+                if outputs[key] is None:
+                    outputs[key] = convert_shard(
+                        info.ast, labels, offset, engine=self.engine, writer=self.writer
+                    )
+                    self.n_filtered += 1
+            results.append(outputs[key])
+            offset += info.n_substitutions
+        self.outputs = outputs
+        if not results:
+            return ""
+        return merge_shards(results, writer=self.writer)
+
+    def rebuild(self) -> None:
+        """Build the project and write the output file"""
+        start = time.perf_counter()
+        markdown = self.build()
+        self.output.write_text(markdown)
+        print(
+            f"Wrote {self.output} in {time.perf_counter() - start:.2f}s "
+            f"({self.n_parsed} segments parsed, {self.n_filtered} filtered)",
+            file=sys.stderr,
+        )
+
+    def _mtimes(self) -> tp.Dict[Path, tp.Optional[int]]:
+        mtimes = {}
+        for path in self.files:
+            try:
+                mtimes[path] = path.stat().st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def watch(self, interval: float = POLL_INTERVAL) -> None:
+        """Rebuild whenever a file of the project changes, until interrupted"""
+        self.rebuild()
+        mtimes = self._mtimes()
+        print(
+            f"Watching {len(self.files)} files, press Ctrl-C to stop", file=sys.stderr
+        )
+        try:
+            while True:
+                time.sleep(interval)
+                current = self._mtimes()
+                if current == mtimes:
+                    continue
+                changed = sorted(str(p) for p in current if current[p] != mtimes.get(p))
+                logger.info(f"Changed: {', '.join(changed)}")
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    logger.error(f"Rebuild failed: {e}")
+                mtimes = self._mtimes()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,688 @@
+"""Native MyST markdown writer
+
+By default the filtered document is serialized by handing it back to pandoc,
+which means encoding the whole AST as JSON, piping it to a second pandoc
+process and decoding the result. :py:func:`write_markdown` writes the element
+types produced by the filters directly to a stream instead, following the
+output of pandoc's markdown writer (line wrapping at 72 columns, escaping,
+YAML front matter with the ``substitutions``).
+
+Documents with elements that the writer does not handle (tables, notes,
+citations, ...) are reported by :py:func:`unsupported_elements` and are left
+to pandoc by :py:func:`latex_to_myst.pipeline.write_output`.
+"""
+import io
+import re
+import unicodedata
+import typing as tp
+import logging
+import panflute as pf
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = 72
+# raw formats that pandoc's markdown writer emits verbatim
+RAW_FORMATS = ("markdown",)
+
+_BLOCKS = (
+    pf.Para,
+    pf.Plain,
+    pf.RawBlock,
+    pf.Div,
+    pf.Header,
+    pf.CodeBlock,
+    pf.BulletList,
+    pf.OrderedList,
+    pf.ListItem,
+    pf.BlockQuote,
+    pf.HorizontalRule,
+)
+_INLINES = (
+    pf.Str,
+    pf.Space,
+    pf.SoftBreak,
+    pf.LineBreak,
+    pf.Emph,
+    pf.Strong,
+    pf.Strikeout,
+    pf.Superscript,
+    pf.Subscript,
+    pf.SmallCaps,
+    pf.Code,
+    pf.Math,
+    pf.RawInline,
+    pf.Link,
+    pf.Image,
+    pf.Span,
+    pf.Quoted,
+)
+_META = (pf.MetaMap, pf.MetaInlines, pf.MetaString, pf.MetaBool, pf.MetaList)
+
+_LIST_STYLES = ("Decimal", "DefaultStyle")
+_LIST_DELIMITERS = {
+    "Period": "{}.",
+    "DefaultDelim": "{}.",
+    "OneParen": "{})",
+    "TwoParens": "({})",
+}
+_YAML_PUNCTUATION = "-?:,[]{}#&*!|>'\"%@`"
+_URL = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*:[^\s<>]*$")
+_ORDERED_MARKER = re.compile(
+    r"^(?:(?:[0-9]{1,9}|[a-z]|[ivxlcdm]+|[IVXLCDM]{2,}|#)[.)]|[A-Z]\)"
+    r"|\((?:[0-9]{1,9}|[a-zA-Z]|[ivxlcdm]+|[IVXLCDM]+|#)\))$"
+)
+# words that would start a list at the beginning of a line
+_LIST_MARKERS = ("-", "+", "1.", "1)")
+# separates consecutive lists, rendered like a raw html block
+_LIST_SEPARATOR = "```{=html}\n<!-- -->\n```\n"
+
+
+def _unsupported(elem: pf.Element) -> tp.Optional[str]:
+    """Reason why the writer cannot write the element, None if it can"""
+    if isinstance(elem, pf.Doc):
+        return None
+    if not isinstance(elem, _BLOCKS + _INLINES + _META):
+        return type(elem).__name__
+    if isinstance(elem, (pf.RawBlock, pf.RawInline)):
+        if elem.format not in RAW_FORMATS:
+            return f"{type(elem).__name__} in {elem.format}"
+    elif isinstance(elem, pf.Header) and elem.identifier:
+        return "Header with identifier"
+    elif isinstance(elem, pf.OrderedList):
+        if elem.style not in _LIST_STYLES or elem.delimiter not in _LIST_DELIMITERS:
+            return f"OrderedList in {elem.style}"
+    elif isinstance(elem, (pf.Link, pf.Image)):
+        if not elem.url or re.search(r"[\s()<>]", elem.url):
+            return f"{type(elem).__name__} to {elem.url!r}"
+        if isinstance(elem, pf.Image) and elem.title.startswith("fig:"):
+            return "Figure"
+    elif isinstance(elem, (pf.MetaInlines, pf.MetaString, pf.MetaList)):
+        if not (elem.text if isinstance(elem, pf.MetaString) else len(elem.content)):
+            return f"empty {type(elem).__name__}"
+    return None
+
+
+def unsupported_elements(doc: pf.Doc) -> tp.Set[str]:
+    """Names of the elements of the document that the writer cannot write"""
+    found = set()
+    stack = [doc]
+    while stack:
+        elem = stack.pop()
+        reason = _unsupported(elem)
+        if reason is not None:
+            found.add(reason)
+            continue
+        for child in elem._children:
+            obj = getattr(elem, child)
+            if isinstance(obj, pf.Element):
+                stack.append(obj)
+            elif isinstance(obj, pf.ListContainer):
+                stack.extend(obj)
+            elif isinstance(obj, pf.DictContainer):
+                stack.extend(obj.values())
+    return found
+
+
+def _width(text: str) -> int:
+    """Number of columns the text takes up in a terminal"""
+    if text.isascii():
+        return len(text)
+    width = 0
+    for c in text:
+        if unicodedata.combining(c):
+            continue
+        width += 2 if unicodedata.east_asian_width(c) in "WF" else 1
+    return width
+
+
+class _Layout:
+    """Line breaking and indentation of the output
+
+    A minimal version of the pretty printer used by pandoc: text is
+    accumulated into lines that are broken at breakable spaces once they
+    would exceed the number of columns. Empty lines are only written once
+    more content follows, so they can still be dropped at the end of a block
+    and the output never ends in empty lines.
+    """
+
+    def __init__(self, stream: tp.TextIO, columns: int = COLUMNS):
+        self.stream = stream
+        self.columns = columns
+        self.prefixes = []  # indentation of the lines started from now on
+        self.line = None  # parts of the current line, the prefix first
+        self.column = 0
+        self.written = 0  # number of lines written
+        self.empty_lines = []  # empty lines not written yet
+        self.space = False  # breakable space before the chunk
+        self.chunk = []  # text since the last breakable space
+        self.chunk_width = 0
+        self.blank = False  # hard line breaks are absorbed after an empty line
+
+    # ---------------------------
+    # lines
+    # ---------------------------
+
+    def _start_line(self) -> None:
+        prefix = "".join(self.prefixes)
+        self.line = [prefix]
+        self.column = _width(prefix)
+
+    def _end_line(self) -> None:
+        """Finish the current line, started or not"""
+        if self.line is None:
+            self._start_line()
+        if len(self.line) == 1:
+            self.empty_lines.append(self.line[0].rstrip())
+        else:
+            for empty in self.empty_lines:
+                self._write_line(empty)
+            self.empty_lines = []
+            self._write_line("".join(self.line))
+        self.line = None
+
+    def _write_line(self, text: str) -> None:
+        if self.written:
+            self.stream.write("\n")
+        self.stream.write(text)
+        self.written += 1
+
+    def _flush(self) -> None:
+        """Place the pending chunk on the current or the next line"""
+        if not self.chunk:
+            return
+        if self.line is None:
+            self._start_line()
+        elif self.space and len(self.line) > 1:
+            if self.column + 1 + self.chunk_width > self.columns:
+                self._end_line()
+                self._start_line()
+            else:
+                self.line.append(" ")
+                self.column += 1
+        self.line.extend(self.chunk)
+        self.column += self.chunk_width
+        self.blank = False
+        self.chunk = []
+        self.chunk_width = 0
+        self.space = False
+
+    # ---------------------------
+    # primitives
+    # ---------------------------
+
+    def text(self, text: str) -> None:
+        """Unbreakable text, newlines in the text are hard line breaks"""
+        for n, line in enumerate(text.split("\n")):
+            if n:
+                self.newline()
+            if line:
+                self.chunk.append(line)
+                self.chunk_width += _width(line)
+
+    def breakable_space(self) -> None:
+        self._flush()
+        if self.line is not None and len(self.line) > 1:
+            self.space = True
+
+    def newline(self) -> None:
+        """Hard line break"""
+        self._flush()
+        self.space = False
+        if self.line is None and self.blank:
+            return
+        self._end_line()
+
+    def cr(self) -> None:
+        """Line break unless at the start of a line"""
+        self._flush()
+        self.space = False
+        if self.line is not None:
+            self._end_line()
+
+    def blankline(self) -> None:
+        """Make sure there is an empty line before what follows"""
+        self.cr()
+        if self.written and not self.empty_lines:
+            self._end_line()
+        self.blank = True
+
+    def mark(self) -> tp.Tuple[int, int]:
+        """Position to :py:meth:`chomp` back to"""
+        self._flush()
+        return self.written, len(self.empty_lines)
+
+    def chomp(self, mark: tp.Tuple[int, int]) -> None:
+        """Drop the empty lines at the end of what followed the mark"""
+        self.cr()
+        written, n_empty = mark
+        del self.empty_lines[0 if self.written > written else n_empty :]
+
+    def push(self, prefix: str) -> None:
+        """Indent the lines started from now on
+
+        A line already started, e.g. by a list marker, keeps its indentation.
+        """
+        self._flush()
+        self.prefixes.append(prefix)
+        self.blank = False
+
+    def pop(self) -> None:
+        self.cr()
+        self.prefixes.pop()
+
+    def close(self) -> None:
+        self.cr()
+
+
+def _escape(text: str) -> str:
+    """Escape the characters of a Str that have a meaning in markdown"""
+    out = []
+    n = 0
+    if text.startswith("#"):
+        word = text.split(" ", 1)[0]
+        if not word.strip("#"):
+            out.append("\\#")
+            n = 1
+    elif text.startswith("@"):
+        if text[1:2].isalnum() or text[1:2] == "_":
+            out.append("\\@")
+            n = 1
+    while n < len(text):
+        c = text[n]
+        rest = text[n + 1 : n + 3]
+        if c in "\\`*_[]<>|^~$'\"":
+            out.append("\\" + c)
+        elif c == "-" and rest.startswith("-"):
+            out.append("\\-")
+        elif c == "." and rest == "..":
+            out.append("\\...")
+            n += 2
+        elif c.isalnum() and rest[:1] == "_" and rest[1:2].isalnum():
+            out.append(c + "_" + rest[1])
+            n += 2
+        else:
+            out.append(c)
+        n += 1
+    return "".join(out)
+
+
+def _attributes(
+    identifier: str, classes: tp.Sequence[str], attributes: tp.Dict[str, str]
+) -> tp.List[str]:
+    """Attributes as ``#id``, ``.class`` and ``key="value"`` items"""
+    items = []
+    if identifier:
+        items.append("#" + identifier)
+    items.extend("." + c for c in classes)
+    for key, value in attributes.items():
+        value = value.replace("\\", "\\\\").replace('"', '\\"')
+        items.append(f'{key}="{value}"')
+    return items
+
+
+def _is_tight(elem: tp.Union[pf.BulletList, pf.OrderedList]) -> bool:
+    return all(
+        not len(item.content) or isinstance(item.content[0], pf.Plain)
+        for item in elem.content
+    )
+
+
+class MarkdownWriter:
+    """Write a filtered document as MyST markdown
+
+    Arguments:
+        stream: text stream the markdown is written to
+        columns: line length at which paragraphs are wrapped
+    """
+
+    def __init__(self, stream: tp.TextIO, columns: int = COLUMNS):
+        self.stream = stream
+        self.columns = columns
+        self.layout = _Layout(stream, columns)
+        self.in_list = False
+
+    def write(self, doc: pf.Doc) -> None:
+        """Write the document, which must not have unsupported elements"""
+        meta = [
+            (key, value)
+            for key, value in sorted(doc.metadata.content.items())
+            if not isinstance(value, pf.MetaMap) or len(value.content)
+        ]
+        if meta:
+            self.layout.text("---")
+            self.layout.cr()
+            self.meta_map(meta)
+            self.layout.text("---")
+            self.layout.blankline()
+        self.blocks(doc.content)
+        self.layout.close()
+
+    def render(self, write: tp.Callable[["MarkdownWriter"], None]) -> str:
+        """Render to a string with a separate writer"""
+        with io.StringIO() as stream:
+            writer = MarkdownWriter(stream, self.columns)
+            write(writer)
+            writer.layout.close()
+            return stream.getvalue()
+
+    # ---------------------------
+    # metadata
+    # ---------------------------
+
+    def meta_map(self, items: tp.Iterable[tp.Tuple[str, pf.MetaValue]]) -> None:
+        layout = self.layout
+        for key, value in items:
+            if isinstance(value, pf.MetaMap):
+                layout.text(f"{key}:")
+                layout.cr()
+                layout.push("  ")
+                self.meta_map(sorted(value.content.items()))
+                layout.pop()
+            elif isinstance(value, pf.MetaList):
+                layout.text(f"{key}:")
+                layout.cr()
+                for item in value.content:
+                    layout.text("- ")
+                    layout.push("  ")
+                    self.meta_value(item)
+                    layout.pop()
+            else:
+                layout.text(f"{key}: ")
+                self.meta_value(value)
+            layout.cr()
+
+    def meta_value(self, value: pf.MetaValue) -> None:
+        if isinstance(value, pf.MetaBool):
+            self.layout.text("true" if value.boolean else "false")
+            return
+        if isinstance(value, pf.MetaString):
+            text = value.text
+        else:
+            text = self.render(lambda w: w.inlines(value.content))
+        if "\n" in text:
+            self.layout.text("|")
+            self.layout.cr()
+            self.layout.push("  ")
+            self.layout.text(text)
+            self.layout.pop()
+        elif ":" in text or "#" in text or text[:1] in _YAML_PUNCTUATION:
+            text = text.replace("\\", "\\\\").replace('"', '\\"')
+            self.layout.text(f'"{text}"')
+        else:
+            self.layout.text(text)
+
+    # ---------------------------
+    # blocks
+    # ---------------------------
+
+    def blocks(self, blocks: tp.Sequence[pf.Block]) -> None:
+        """Write a list of blocks the way pandoc joins them"""
+        blocks = list(blocks)
+        for n, block in enumerate(blocks):
+            following = blocks[n + 1] if n + 1 < len(blocks) else None
+            if isinstance(block, pf.RawBlock):
+                text = block.text
+                if (
+                    following is not None
+                    and text
+                    and not text.endswith("\n")
+                    and not isinstance(following, (pf.Plain, pf.RawBlock))
+                ):
+                    text += "\n"
+                self.layout.text(text)
+                self.layout.newline()
+            elif isinstance(block, pf.Plain) and (
+                isinstance(following, pf.Div)
+                or not (self.in_list or isinstance(following, pf.RawBlock))
+            ):
+                self.paragraph(block.content)
+            else:
+                self.block(block)
+            if isinstance(block, (pf.BulletList, pf.OrderedList)) and (
+                type(following) == type(block)
+                or isinstance(following, pf.CodeBlock)
+                and not (following.identifier or following.classes)
+                and not following.attributes
+            ):
+                self.layout.text(_LIST_SEPARATOR)
+
+    def block(self, elem: pf.Block) -> None:
+        layout = self.layout
+        if isinstance(elem, pf.Para):
+            self.paragraph(elem.content)
+        elif isinstance(elem, pf.Plain):
+            self.plain(elem.content)
+        elif isinstance(elem, pf.Div):
+            self.div(elem)
+        elif isinstance(elem, pf.Header):
+            layout.text("#" * elem.level + " ")
+            self.inlines(elem.content, wrap=False)
+            attributes = _attributes("", elem.classes, elem.attributes)
+            if attributes:
+                layout.text(" {" + " ".join(attributes) + "}")
+            layout.blankline()
+        elif isinstance(elem, pf.CodeBlock):
+            self.code_block(elem)
+        elif isinstance(elem, (pf.BulletList, pf.OrderedList)):
+            self.list(elem)
+        elif isinstance(elem, pf.BlockQuote):
+            layout.push("> ")
+            mark = layout.mark()
+            self.blocks(elem.content)
+            layout.chomp(mark)
+            layout.pop()
+            layout.blankline()
+        elif isinstance(elem, pf.HorizontalRule):
+            layout.blankline()
+            layout.text("-" * self.columns)
+            layout.blankline()
+        else:
+            raise TypeError(type(elem))
+
+    def paragraph(self, elems: tp.Sequence[pf.Inline]) -> None:
+        self.plain(elems)
+        self.layout.blankline()
+
+    def plain(self, elems: tp.Sequence[pf.Inline]) -> None:
+        elems = list(elems)
+        if elems and isinstance(elems[0], pf.Str):
+            text = elems[0].text
+            if (
+                len(elems) == 1 or isinstance(elems[1], (pf.Space, pf.SoftBreak))
+            ) and _ORDERED_MARKER.match(text):
+                self.layout.text(re.sub(r"([.()])", r"\\\1", text))
+                elems = elems[1:]
+            elif text in ("+", "-") or text.startswith("%") and not text[1:2].strip():
+                self.layout.text("\\")
+        self.inlines(elems)
+        self.layout.cr()
+
+    def div(self, elem: pf.Div) -> None:
+        layout = self.layout
+        attributes = _attributes(elem.identifier, elem.classes, elem.attributes)
+        if not attributes:
+            layout.text("<div>")
+            layout.blankline()
+        elif len(attributes) == 1 and elem.classes:
+            layout.text("::: " + elem.classes[0])
+        else:
+            layout.text("::: {" + " ".join(attributes) + "}")
+        layout.cr()
+        mark = layout.mark()
+        self.blocks(elem.content)
+        layout.chomp(mark)
+        if not attributes:
+            layout.blankline()
+            layout.text("</div>")
+        else:
+            layout.text(":::")
+        layout.blankline()
+
+    def code_block(self, elem: pf.CodeBlock) -> None:
+        layout = self.layout
+        attributes = _attributes(elem.identifier, elem.classes, elem.attributes)
+        if not attributes:
+            layout.push("    ")
+            layout.text(elem.text)
+            layout.pop()
+            layout.blankline()
+            return
+        ticks = max([len(t) for t in re.findall("`+", elem.text)] + [2]) + 1
+        if len(attributes) == 1 and elem.classes:
+            info = elem.classes[0]
+        else:
+            info = "{" + " ".join(attributes) + "}"
+        layout.text("`" * ticks + " " + info)
+        layout.cr()
+        layout.text(elem.text)
+        layout.cr()
+        layout.text("`" * ticks)
+        layout.blankline()
+
+    def list(self, elem: tp.Union[pf.BulletList, pf.OrderedList]) -> None:
+        layout = self.layout
+        tight = _is_tight(elem)
+        in_list, self.in_list = self.in_list, True
+        for n, item in enumerate(elem.content):
+            if n and not tight:
+                layout.blankline()
+            if isinstance(elem, pf.BulletList):
+                marker = "-"
+            else:
+                marker = _LIST_DELIMITERS[elem.delimiter].format(elem.start + n)
+            marker = marker.ljust(3) + " "
+            layout.text(marker)
+            layout.push(" " * len(marker))
+            mark = layout.mark()
+            self.blocks(item.content)
+            if tight:
+                layout.chomp(mark)
+            layout.pop()
+        self.in_list = in_list
+        layout.blankline()
+
+    # ---------------------------
+    # inlines
+    # ---------------------------
+
+    def inlines(self, elems: tp.Sequence[pf.Inline], wrap: bool = True) -> None:
+        elems = list(elems)
+        for n, elem in enumerate(elems):
+            following = elems[n + 1 : n + 3]
+            if (
+                isinstance(elem, (pf.Space, pf.SoftBreak))
+                and len(following) == 2
+                and isinstance(following[0], pf.Str)
+                and following[0].text in _LIST_MARKERS
+                and isinstance(following[1], (pf.Space, pf.SoftBreak))
+            ):
+                # a line must not start with something read as a list marker
+                self.layout.text(" ")
+            else:
+                self.inline(elem, wrap)
+
+    def inline(self, elem: pf.Inline, wrap: bool = True) -> None:
+        layout = self.layout
+        if isinstance(elem, pf.Str):
+            layout.text(_escape(elem.text))
+        elif isinstance(elem, (pf.Space, pf.SoftBreak)):
+            if wrap:
+                layout.breakable_space()
+            else:
+                layout.text(" ")
+        elif isinstance(elem, pf.LineBreak):
+            layout.text("\\")
+            layout.newline()
+        elif isinstance(elem, pf.Emph):
+            self.delimited("*", elem.content, wrap)
+        elif isinstance(elem, pf.Strong):
+            self.delimited("**", elem.content, wrap)
+        elif isinstance(elem, pf.Strikeout):
+            self.delimited("~~", elem.content, wrap)
+        elif isinstance(elem, pf.Superscript):
+            self.delimited("^", elem.content, wrap)
+        elif isinstance(elem, pf.Subscript):
+            self.delimited("~", elem.content, wrap)
+        elif isinstance(elem, pf.SmallCaps):
+            self.delimited("[", elem.content, wrap, "]{.smallcaps}")
+        elif isinstance(elem, pf.Quoted):
+            quote = "'" if elem.quote_type == "SingleQuote" else '"'
+            self.delimited(quote, elem.content, wrap)
+        elif isinstance(elem, pf.Code):
+            runs = [len(t) for t in re.findall("`+", elem.text)]
+            ticks = "`" * (max(runs, default=0) + 1)
+            spacer = " " if runs else ""
+            layout.text(f"{ticks}{spacer}{elem.text}{spacer}{ticks}")
+            self.attributes(elem, wrap)
+        elif isinstance(elem, pf.Math):
+            dollars = "$" if elem.format == "InlineMath" else "$$"
+            layout.text(f"{dollars}{elem.text}{dollars}")
+        elif isinstance(elem, pf.RawInline):
+            layout.text(elem.text)
+        elif isinstance(elem, pf.Span):
+            if elem.identifier or elem.classes or elem.attributes:
+                self.delimited("[", elem.content, wrap, "]")
+                self.attributes(elem, wrap)
+            else:
+                self.inlines(elem.content, wrap)
+        elif isinstance(elem, pf.Link):
+            if (
+                _URL.match(elem.url)
+                and pf.stringify(elem) in (elem.url, elem.url[len("mailto:") :])
+                and not elem.title
+                and not (elem.identifier or elem.classes or elem.attributes)
+            ):
+                layout.text(f"<{elem.url}>")
+                return
+            self.delimited("[", elem.content, wrap, "]")
+            layout.text(f"({elem.url}{self.title(elem.title)})")
+            self.attributes(elem, wrap)
+        elif isinstance(elem, pf.Image):
+            self.delimited("![", elem.content, wrap, "]")
+            layout.text(f"({elem.url}{self.title(elem.title)})")
+            self.attributes(elem, wrap)
+        else:
+            raise TypeError(type(elem))
+
+    @staticmethod
+    def title(title: str) -> str:
+        if not title:
+            return ""
+        return ' "' + title.replace('"', '\\"') + '"'
+
+    def delimited(
+        self,
+        opening: str,
+        elems: tp.Sequence[pf.Inline],
+        wrap: bool,
+        closing: str = None,
+    ) -> None:
+        self.layout.text(opening)
+        self.inlines(elems, wrap)
+        self.layout.text(opening if closing is None else closing)
+
+    def attributes(self, elem: pf.Element, wrap: bool = True) -> None:
+        items = _attributes(elem.identifier, elem.classes, elem.attributes)
+        if not items:
+            return
+        self.layout.text("{")
+        for n, item in enumerate(items):
+            if n:
+                if wrap:
+                    self.layout.breakable_space()
+                else:
+                    self.layout.text(" ")
+            self.layout.text(item)
+        self.layout.text("}")
+
+
+def write_markdown(doc: pf.Doc, stream: tp.TextIO, columns: int = COLUMNS) -> None:
+    """Write the document as MyST markdown to the stream
+
+    Raises ValueError if the document has elements the writer does not
+    handle, see :py:func:`unsupported_elements`.
+    """
+    unsupported = unsupported_elements(doc)
+    if unsupported:
+        raise ValueError(f"Unsupported elements: {', '.join(sorted(unsupported))}")
+    MarkdownWriter(stream, columns).write(doc)
@@ -10,8 +10,10 @@ with open("README.rst") as readme_file:
 with open("HISTORY.rst") as history_file:
     history = history_file.read()
 
-requirements = ["panflute>=2.1", "numpy>=1.20"]
+requirements = ["panflute>=2.1"]
 test_requirements = ["pytest>=6.2"]
+# faster encoding of the pandoc AST, see latex_to_myst.codec
+extras_requirements = {"fast": ["orjson"]}
 
 setup(
     author="Tingkai Liu",
@@ -29,13 +31,19 @@ setup(
     ],
     description="LaTeX to MyST converter",
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="BSD 3-Clause license",
     long_description=readme + "\n\n" + history,
     include_package_data=True,
     keywords="latex_to_myst",
     name="latex_to_myst",
     packages=find_packages(include=["latex_to_myst", "latex_to_myst"]),
-    entry_points={"console_scripts": ["latex2myst = latex_to_myst:main"]},
+    entry_points={
+        "console_scripts": [
+            "latex2myst = latex_to_myst:main",
+            "latex2myst-batch = latex_to_myst.batch:main",
+        ]
+    },
     test_suite="tests",
     tests_require=test_requirements,
     url="https://github.com/TK-21st/latex-to-myst",
@@ -0,0 +1,116 @@
+import asyncio
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from latex_to_myst import Converter, aio
+from latex_to_myst.aio import AsyncConverter
+from latex_to_myst.labelstore import LabelStore, source_key
+from latex_to_myst.pipeline import convert, load_macros
+
+
+CURR_DIR = Path(__file__).parent
+NAMES = ["amsthm", "math", "subfigure", "nested_divs"]
+
+
+def _sample(name):
+    return (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+
+
+def test_concurrent_conversions(monkeypatch):
+    macros = load_macros()
+    expected = {name: convert(_sample(name), macros) for name in NAMES}
+    running = []
+    peak = []
+    run_pandoc = aio.run_pandoc
+
+    async def tracked(*args):
+        running.append(None)
+        peak.append(len(running))
+        try:
+            return await run_pandoc(*args)
+        finally:
+            running.pop()
+
+    monkeypatch.setattr(aio, "run_pandoc", tracked)
+    converter = AsyncConverter(max_pandoc=2)
+
+    async def main():
+        return await asyncio.gather(*(converter.convert(_sample(n)) for n in NAMES * 3))
+
+    assert asyncio.run(main()) == [expected[name] for name in NAMES * 3]
+    assert max(peak) == 2
+
+
+@pytest.mark.parametrize("writer", ["pandoc", "native"])
+def test_process_executor(writer, tmp_path):
+    source = CURR_DIR / "sample_files" / "amsthm.tex"
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        converter = AsyncConverter(executor=executor, writer=writer, engine="fused")
+        target = tmp_path / "amsthm.md"
+        markdown = asyncio.run(converter.convert_file(source, target))
+    assert markdown == target.read_text() == source.with_suffix(".md").read_text()
+
+
+def test_convert_function_shares_limit(monkeypatch):
+    running = []
+    peak = []
+    run_pandoc = aio.run_pandoc
+
+    async def tracked(*args):
+        running.append(None)
+        peak.append(len(running))
+        try:
+            return await run_pandoc(*args)
+        finally:
+            running.pop()
+
+    monkeypatch.setattr(aio, "run_pandoc", tracked)
+    monkeypatch.setattr(aio, "_default", None)
+
+    async def main():
+        return await asyncio.gather(*(aio.convert(_sample(n)) for n in NAMES * 2))
+
+    asyncio.run(main())
+    assert max(peak) <= aio.DEFAULT_MAX_PANDOC
+    assert aio._default.max_pandoc == aio.DEFAULT_MAX_PANDOC
+
+
+def test_convert_function_and_errors():
+    assert asyncio.run(aio.convert(_sample("math"))) == convert(
+        _sample("math"), load_macros()
+    )
+    with pytest.raises(IOError):
+        asyncio.run(aio.convert("\\begin{x"))
+
+
+def test_server_backend():
+    from latex_to_myst.backend import ServerBackend
+    from latex_to_myst.pipeline import pandoc_version
+
+    if pandoc_version() < (2, 18):
+        pytest.skip("pandoc server needs pandoc >= 2.18")
+    server = ServerBackend()
+    try:
+        converter = AsyncConverter(backend=server)
+        assert asyncio.run(converter.convert(_sample("amsthm"))) == convert(
+            _sample("amsthm"), load_macros()
+        )
+    finally:
+        server.close()
+
+
+def test_label_store(tmp_path):
+    chapters = {
+        "a": r"\section{A}\label{sec:a} See \ref{sec:b}.",
+        "b": r"\section{B}\label{sec:b} See \ref{sec:a}.",
+    }
+    for name, text in chapters.items():
+        (tmp_path / f"{name}.tex").write_text(text)
+    store = LabelStore(tmp_path / "labels.db")
+    store.update(source_key(tmp_path / "b.tex"), {"sec:b": "header"})
+    converter = AsyncConverter(label_store=store)
+    markdown = asyncio.run(converter.convert_file(tmp_path / "a.tex"))
+    assert "{ref}`sec:b`" in markdown
+    assert store.labels(source_key(tmp_path / "a.tex")) == {"sec:a": "header"}
+    serial = Converter(label_store=store).convert_file(tmp_path / "a.tex")
+    assert markdown == serial
@@ -0,0 +1,98 @@
+import os
+import subprocess
+from latex_to_myst.assets import (
+    MANIFEST_FILE,
+    Asset,
+    publish_assets,
+    resolve_assets,
+)
+from latex_to_myst.pipeline import parse, run_actions
+
+
+TABLE_OF_FIGURES = r"""
+\begin{figure}
+\begin{tabular}{cc}
+\includegraphics{figs/a} & \includegraphics{figs/b.png}
+\end{tabular}
+\caption{Table}
+\end{figure}
+"""
+
+
+def test_image_urls():
+    doc = run_actions(
+        parse(TABLE_OF_FIGURES + r"\includegraphics{logo.png}"), engine="fused"
+    )
+    assert doc.image_urls == ["figs/a", "figs/b.png", "logo.png"]
+
+
+def test_resolve_assets(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    (src / "figs").mkdir(parents=True)
+    (src / "figs" / "a.pdf").write_bytes(b"pdf")
+    (src / "figs" / "b.png").write_bytes(b"png")
+    assets = resolve_assets(
+        ["figs/a", "figs/b.png", "figs/b.png", "missing.png", "../up.png", "/abs.png"],
+        src,
+        out,
+    )
+    assert assets == [
+        Asset("figs/a", src / "figs" / "a.pdf", out / "figs" / "a.pdf"),
+        Asset("figs/b.png", src / "figs" / "b.png", out / "figs" / "b.png"),
+    ]
+
+
+def test_publish_assets(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "logo.png").write_bytes(b"logo")
+    (src / "copy.png").write_bytes(b"logo")
+    (src / "plot.png").write_bytes(b"plot")
+    assets = [
+        Asset("logo.png", src / "logo.png", out / "ch1" / "logo.png"),
+        Asset("logo.png", src / "logo.png", out / "ch2" / "logo.png"),
+        Asset("copy.png", src / "copy.png", out / "ch2" / "copy.png"),
+        Asset("plot.png", src / "plot.png", out / "ch1" / "plot.png"),
+    ]
+    results = publish_assets(assets, out, jobs=2)
+    assert {res.action for res in results} == {"copied"}
+    assert (out / "ch2" / "copy.png").read_bytes() == b"logo"
+    assert not os.path.samefile(out / "ch1" / "logo.png", out / "ch2" / "copy.png")
+    assert (out / MANIFEST_FILE).exists()
+
+    results = publish_assets(assets, out, jobs=2)
+    assert {res.action for res in results} == {"unchanged"}
+
+    (src / "plot.png").write_bytes(b"new plot")
+    results = publish_assets(assets, out)
+    assert [res.action for res in results][-1] == "copied"
+    assert (out / "ch1" / "plot.png").read_bytes() == b"new plot"
+
+
+def test_publish_linked_assets(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    (src / "logo.png").write_bytes(b"logo")
+    (src / "copy.png").write_bytes(b"logo")
+    assets = [
+        Asset("logo.png", src / "logo.png", out / "ch1" / "logo.png"),
+        Asset("copy.png", src / "copy.png", out / "ch2" / "copy.png"),
+    ]
+    results = publish_assets(assets, out, link=True)
+    assert [res.action for res in results] == ["linked", "linked"]
+    assert os.path.samefile(out / "ch1" / "logo.png", out / "ch2" / "copy.png")
+    assert os.path.samefile(src / "logo.png", out / "ch1" / "logo.png")
+
+
+def test_batch_copy_assets(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    (src / "figs").mkdir(parents=True)
+    (src / "figs" / "a.png").write_bytes(b"a")
+    (src / "figs" / "b.png").write_bytes(b"b")
+    (src / "chapter.tex").write_text(TABLE_OF_FIGURES)
+    cmd = ["latex2myst-batch", str(src), "-o", str(out), "-j", "1", "--copy-assets"]
+    ret = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Assets: 2 copied, 0 linked, 0 unchanged, 0 failed" in ret.stdout
+    assert (out / "figs" / "a.png").read_bytes() == b"a"
+    ret = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Assets: 0 copied, 0 linked, 2 unchanged, 0 failed" in ret.stdout
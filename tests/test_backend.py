@@ -0,0 +1,57 @@
+import pickle
+from pathlib import Path
+import pytest
+from latex_to_myst import backend
+from latex_to_myst.backend import (
+    ServerBackend,
+    SubprocessBackend,
+    create_backend,
+    get_backend,
+    set_backend,
+)
+from latex_to_myst.pipeline import convert, load_macros, pandoc_version
+
+
+CURR_DIR = Path(__file__).parent
+
+
+@pytest.fixture(scope="module")
+def server():
+    if pandoc_version() < (2, 18):
+        pytest.skip("pandoc server needs pandoc >= 2.18")
+    server = ServerBackend()
+    yield server
+    server.close()
+
+
+@pytest.mark.parametrize("name", ["math", "amsthm", "subfigure"])
+def test_server_matches_subprocess(server, name):
+    text = (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+    macros = load_macros()
+    expected = convert(text, macros)
+    previous = set_backend(server)
+    try:
+        assert convert(text, macros) == expected
+    finally:
+        set_backend(previous)
+    assert isinstance(get_backend(), SubprocessBackend)
+
+
+def test_server_errors_and_pickling(server):
+    with pytest.raises(IOError):
+        server.convert("\\begin{x", "latex", "json")
+    copy = pickle.loads(pickle.dumps(server))
+    assert copy.url == server.url and copy._process is None
+    assert copy.convert("*a*", "markdown", "latex", standalone=False) == "\\emph{a}"
+    copy.close()
+    assert server.convert("*a*", "markdown", "latex", standalone=False) == "\\emph{a}"
+
+
+def test_server_fallback(monkeypatch):
+    def unavailable(self, port):
+        raise RuntimeError("The pandoc server needs pandoc >= 2.18.")
+
+    monkeypatch.setattr(backend.ServerBackend, "_command", unavailable)
+    assert isinstance(create_backend("server"), SubprocessBackend)
+    with pytest.raises(ValueError):
+        create_backend("pool")
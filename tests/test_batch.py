@@ -0,0 +1,69 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def test_batch(tmp_path):
+    src = tmp_path / "src"
+    (src / "nested").mkdir(parents=True)
+    shutil.copy(CURR_DIR / "sample_files" / "math.tex", src / "math.tex")
+    shutil.copy(CURR_DIR / "sample_files" / "amsthm.tex", src / "nested" / "amsthm.tex")
+    out = tmp_path / "out"
+    subprocess.run(
+        ["latex2myst-batch", str(src), "-o", str(out), "-j", "2"],
+        check=True,
+    )
+    for block_type, target in [("math", "math.md"), ("amsthm", "nested/amsthm.md")]:
+        with open(CURR_DIR / "sample_files" / f"{block_type}.md") as f:
+            assert (out / target).read_text() == f.read()
+
+
+def test_batch_failure(tmp_path):
+    out = tmp_path / "out"
+    bad = tmp_path / "bad.tex"
+    bad.write_bytes(b"\xff\xfe not utf-8")
+    ret = subprocess.run(
+        ["latex2myst-batch", str(tmp_path / "*.tex"), "-o", str(out)],
+        capture_output=True,
+        text=True,
+    )
+    assert ret.returncode == 1
+    assert "[failed]" in ret.stdout
+    assert "Converted 0/1 documents" in ret.stdout
+
+
+def test_batch_output_collision(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        shutil.copy(CURR_DIR / "sample_files" / "math.tex", tmp_path / name)
+    out = tmp_path / "out"
+    ret = subprocess.run(
+        ["latex2myst-batch", str(tmp_path / "a"), str(tmp_path / "b"), "-o", str(out)],
+        capture_output=True,
+        text=True,
+    )
+    assert ret.returncode == 2
+    assert "would both be converted to 'math.md'" in ret.stderr
+    assert not out.exists()
+
+
+def test_batch_asset_failure(tmp_path):
+    src = tmp_path / "src"
+    (src / "img").mkdir(parents=True)
+    (src / "img" / "a.png").write_bytes(b"png")
+    (src / "doc.tex").write_text("\\includegraphics{img/a.png}\n")
+    out = tmp_path / "out"
+    out.mkdir()
+    # the image cannot be copied below a file
+    (out / "img").write_text("")
+    ret = subprocess.run(
+        ["latex2myst-batch", str(src), "-o", str(out), "--copy-assets"],
+        capture_output=True,
+        text=True,
+    )
+    assert ret.returncode == 1
+    assert "Assets: 0 copied, 0 linked, 0 unchanged, 1 failed" in ret.stdout
+    assert "Converted 1/1 documents" in ret.stdout
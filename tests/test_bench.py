@@ -0,0 +1,70 @@
+import json
+import importlib.util
+from pathlib import Path
+from latex_to_myst.helpers import SUPPORTED_AMSTHM_BLOCKS
+from latex_to_myst.main import ACTIONS
+from latex_to_myst.pipeline import (
+    convert,
+    load_macros,
+    parse,
+    run_actions,
+    to_markdown,
+)
+
+
+CURR_DIR = Path(__file__).parent
+_spec = importlib.util.spec_from_file_location(
+    "bench", CURR_DIR.parent / "benchmarks" / "bench.py"
+)
+bench = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(bench)
+
+
+def test_generate():
+    corpus = bench.Corpus(sections=2, theorems=2, depth=4)
+    text = bench.generate(corpus)
+    assert text == bench.generate(corpus)
+    for block in SUPPORTED_AMSTHM_BLOCKS:
+        assert text.count(f"\\begin{{{block}}}") == 4
+    assert text.count("\\begin{block}") == 8
+    assert text.count("\\begin{equation}") == 10
+
+
+def test_subfigures(caplog):
+    corpus = bench.Corpus(sections=2, subfigures=3, refs=20)
+    markdown = convert(bench.generate(corpus), load_macros())
+    n_images = corpus.sections * corpus.subfigures * bench.SUBFIGURE_PANELS
+    assert markdown.count("{{figure-") == n_images
+    assert f"figure-{n_images - 1}: |" in markdown
+    assert markdown.count("{list-table}") == corpus.sections * corpus.subfigures
+    assert "not found" not in caplog.text
+
+
+def test_run_and_compare(tmp_path):
+    corpus = bench.Corpus(sections=1, equations=1, figures=1, refs=2)
+    result = bench.run(corpus, repeat=1)
+    stages = result["stages"]
+    assert {"parse", "prepare", "finalize", "write:pandoc"} <= stages.keys()
+    assert all(f"action:{name}" in stages for name, _ in ACTIONS)
+    assert {"fused", "compact", "load:compact", "index:compact"} <= stages.keys()
+    memory = result["memory"]
+    assert memory["compact"]["nodes"] > 0 and memory["compact"]["per_node"] > 0
+    assert memory["panflute"]["bytes"] > 0 and result["peak_rss"] > 0
+
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(result))
+    argv = ["--sections", "1", "--compare", str(baseline), "--threshold", "1e9"]
+    assert bench.main(argv) == 0
+    assert bench.compare(result, result) == []
+    slower = json.loads(json.dumps(result))
+    slower["stages"]["parse"]["min"] *= 2
+    assert bench.compare(result, slower) == ["parse"]
+
+
+def test_engines_match_legacy_on_corpus():
+    macros = load_macros()
+    text = bench.generate(bench.Corpus(sections=3, theorems=2, subfigures=2))
+    legacy = to_markdown(run_actions(parse(text, macros), engine="legacy"))
+    fused = to_markdown(run_actions(parse(text, macros), engine="fused"))
+    assert legacy == fused
+    assert convert(text, macros, engine="compact") == legacy
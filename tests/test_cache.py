@@ -0,0 +1,48 @@
+from pathlib import Path
+from latex_to_myst import pipeline
+from latex_to_myst.cache import ASTCache
+from latex_to_myst.pipeline import (
+    load_macros,
+    parse,
+    pandoc_version,
+    run_actions,
+    to_markdown,
+)
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = ASTCache(tmp_path, pandoc_version=pandoc_version())
+    text = (CURR_DIR / "sample_files" / "math.tex").read_text()
+    macros = load_macros()
+    uncached = to_markdown(run_actions(parse(text, macros)))
+    first = to_markdown(run_actions(parse(text, macros, cache=cache)))
+    second = to_markdown(run_actions(parse(text, macros, cache=cache)))
+    assert uncached == first == second
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.key(text, macros) != cache.key(text, "")
+
+
+def test_cache_eviction(tmp_path):
+    cache = ASTCache(tmp_path, max_size=0)
+    cache.put("a", "[]")
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.evictions == 1
+
+
+def test_pandoc_version_record(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    probes = []
+
+    def probe():
+        probes.append(1)
+        return (2, 19)
+
+    monkeypatch.setattr(pipeline, "_probe_pandoc_version", probe)
+    assert pipeline.pandoc_version.__wrapped__() == (2, 19)
+    assert pipeline.pandoc_version.__wrapped__() == (2, 19)
+    assert len(probes) == 1
+    assert (tmp_path / "latex_to_myst" / pipeline.PANDOC_VERSION_FILE).exists()
@@ -0,0 +1,62 @@
+import functools
+import subprocess
+from pathlib import Path
+import pytest
+from latex_to_myst.checkpoint import CheckpointStore, stage_names
+from latex_to_myst.pipeline import load_macros, parse, run_actions, to_markdown
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def test_resume_from_every_stage(tmp_path):
+    store = CheckpointStore(tmp_path)
+    text = (CURR_DIR / "sample_files" / "amsthm.tex").read_text()
+    macros = load_macros()
+    key = store.key(text, macros)
+    doc = parse(text, macros)
+    store.save(key, "parse", doc)
+    save = functools.partial(store.save, key)
+    expected = to_markdown(run_actions(doc, checkpoint=save))
+    assert store.stages(key) == list(stage_names())
+
+    for name in stage_names():
+        doc = run_actions(store.load(key, name), resume_from=name)
+        assert to_markdown(doc) == expected
+
+    store.save(key, "Math", store.load(key, "Math"))
+    assert store.stages(key) == ["parse", "Math"]
+    store.clear(key)
+    with pytest.raises(FileNotFoundError):
+        store.load(key, "parse")
+
+
+def test_failed_filter_has_no_checkpoint(caplog):
+    def fail(elem, doc):
+        raise RuntimeError("broken filter")
+
+    saved = []
+    run_actions(
+        parse("Text"),
+        actions=[("Fail", fail), ("Pass", lambda elem, doc: None)],
+        checkpoint=lambda name, doc: saved.append(name),
+    )
+    assert saved == ["Pass"]
+    assert "Parsing failed in filter Fail: RuntimeError: broken filter" in caplog.text
+    with pytest.raises(ValueError):
+        run_actions(parse("Text"), resume_from="Math", engine="fused")
+
+
+def test_cli_resume(tmp_path):
+    source = CURR_DIR / "sample_files" / "math.tex"
+    out = tmp_path / "out.md"
+    cmd = ["latex2myst", str(source), str(out), "--checkpoint-dir", str(tmp_path)]
+    proc = subprocess.run(cmd + ["--resume-from", "Link"], capture_output=True)
+    assert proc.returncode == 1 and not out.exists()
+    subprocess.run(cmd + ["--checkpoint"], check=True)
+    assert out.read_text() == source.with_suffix(".md").read_text()
+    out.unlink()
+    subprocess.run(cmd + ["--resume-from", "Link"], check=True)
+    assert out.read_text() == source.with_suffix(".md").read_text()
+    proc = subprocess.run(cmd + ["--resume-from", "Unknown"], capture_output=True)
+    assert proc.returncode == 2
@@ -0,0 +1,65 @@
+import sys
+import subprocess
+from pathlib import Path
+import pytest
+from latex_to_myst import cli, startup
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def _run(*args, stdin=""):
+    return subprocess.run(
+        ["latex2myst", *args],
+        input=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def test_stdin_stdout():
+    source = CURR_DIR / "sample_files" / "math.tex"
+    proc = _run("-", "-", "-l", "info", stdin=source.read_text())
+    assert proc.returncode == cli.EXIT_OK
+    assert proc.stdout == source.with_suffix(".md").read_text()
+    assert "[INFO]" in proc.stderr and "[INFO]" not in proc.stdout
+
+
+def test_stdout_from_file():
+    source = CURR_DIR / "sample_files" / "amsthm.tex"
+    proc = _run(str(source), "-")
+    assert proc.returncode == cli.EXIT_OK
+    assert proc.stdout == source.with_suffix(".md").read_text()
+    proc = _run(str(source), "-", "--engine", "compact")
+    assert proc.stdout == source.with_suffix(".md").read_text()
+
+
+def test_exit_codes(tmp_path):
+    assert _run(str(tmp_path / "missing.tex"), "-").returncode == cli.EXIT_USAGE
+    assert _run("-", "-", "--watch").returncode == cli.EXIT_USAGE
+    proc = _run("-", str(tmp_path / "out.md"), stdin="\\begin{x")
+    assert proc.returncode == cli.EXIT_FAILURE
+    assert not (tmp_path / "out.md").exists()
+
+
+def test_pandoc_missing(monkeypatch):
+    def missing():
+        raise OSError("Path to pandoc executable does not exists")
+
+    monkeypatch.setattr(cli, "check_pandoc_version", missing)
+    monkeypatch.setattr(sys, "argv", ["latex2myst", "-", "-"])
+    with pytest.raises(SystemExit) as exc_info:
+        cli.main()
+    assert exc_info.value.code == cli.EXIT_PANDOC
+
+
+def test_lazy_imports():
+    modules = startup.OPTIONAL_MODULES
+    code = f"import sys, latex_to_myst.cli; print([m for m in {modules} if m in sys.modules])"
+    proc = subprocess.run(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True
+    )
+    assert proc.stdout.strip() == "[]"
+    imported = {t.module for t in startup.import_times()}
+    assert set(startup.CONVERSION_MODULES) <= imported
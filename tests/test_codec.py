@@ -0,0 +1,57 @@
+import io
+import pytest
+import panflute as pf
+from pathlib import Path
+from latex_to_myst import codec
+from latex_to_myst.backend import SubprocessBackend
+from latex_to_myst.pipeline import load_macros, parse_json
+from latex_to_myst.profiling import Profiler
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def _codecs():
+    codecs = [codec.JSONCodec()]
+    if codec.orjson is not None:
+        codecs.append(codec.OrjsonCodec())
+    return codecs
+
+
+@pytest.mark.parametrize("json_codec", _codecs(), ids=lambda c: c.name)
+def test_codec_matches_panflute(json_codec):
+    ast = parse_json((CURR_DIR / "sample_files" / "amsthm.tex").read_text())
+    doc = json_codec.load_doc(ast.encode())
+    expected = pf.load(io.StringIO(ast))
+    assert repr(doc) == repr(expected)
+    assert doc.format == expected.format
+    with io.StringIO() as f:
+        pf.dump(expected, f)
+        assert json_codec.dump_doc(doc) == f.getvalue().encode()
+    assert json_codec.loads(json_codec.dumps({"a": ["é", 1]})) == {"a": ["é", 1]}
+
+
+def test_create_codec(monkeypatch):
+    assert codec.create_codec("json").name == "json"
+    with pytest.raises(ValueError):
+        codec.create_codec("yaml")
+    monkeypatch.setattr(codec, "orjson", None)
+    assert codec.create_codec("auto").name == "json"
+    with pytest.raises(ModuleNotFoundError):
+        codec.create_codec("orjson")
+
+
+def test_stats_and_bytes_pipes():
+    text = (CURR_DIR / "sample_files" / "math.tex").read_text()
+    backend = SubprocessBackend()
+    data = backend.convert_bytes(text.encode(), "latex", "json")
+    assert data.decode().strip() == backend.convert(text, "latex", "json")
+
+    profiler = Profiler()
+    doc = codec.load_doc(data)
+    out = codec.dump_doc(doc)
+    report = profiler.report()["codec"]
+    assert report["name"] == codec.get_codec().name
+    assert report["decode_calls"] == 1 and report["decode_bytes"] == len(data)
+    assert report["encode_calls"] == 1 and report["encode_bytes"] == len(out)
+    assert report["decode_seconds"] > 0
@@ -0,0 +1,110 @@
+import io
+import logging
+import panflute as pf
+from pathlib import Path
+from latex_to_myst import compact
+from latex_to_myst.codec import load_doc
+from latex_to_myst.compact_engine import CompactEngine
+from latex_to_myst.main import prepare
+from latex_to_myst.pipeline import (
+    ast_to_markdown,
+    load_macros,
+    parse,
+    parse_bytes,
+    parse_json,
+    run_actions,
+    to_markdown,
+)
+
+
+CURR_DIR = Path(__file__).parent
+
+EDGE_CASES = r"""
+\begin{figure}
+\begin{tabular}{cc}
+\includegraphics{a} & \includegraphics{b}
+\end{tabular}
+\caption{Table}\label{fig:table}
+\end{figure}
+"Quoted" \cite{x} \texttt{code} \emph{Emphasized \label{em}}
+\begin{enumerate}\item Item \label{item}\end{enumerate}
+\footnote{Note \ref{fig:table}}
+\[ x = 1 \label{eq:x} \] \[ y \]
+\begin{verbatim}
+verbatim
+\end{verbatim}
+"""
+
+
+def test_compact_label_index():
+    macros = load_macros()
+    texts = [path.read_text() for path in sorted(CURR_DIR.glob("sample_files/*.tex"))]
+    for text in texts + [EDGE_CASES]:
+        ast = parse_json(text, macros)
+        doc = pf.load(io.StringIO(ast))
+        prepare(doc)
+        root = compact.load(ast)
+        index = compact.build_label_index(root)
+        assert index.types() == doc.label_index.types()
+        assert index.references == doc.label_index.references
+        assert index.duplicates == doc.label_index.duplicates
+        assert root.images == doc.image_counts[doc]
+
+
+def test_compact_nodes():
+    root = compact.load(parse_json(EDGE_CASES))
+    nodes = list(compact.walk(root))
+    assert nodes[-1] is root
+    assert compact.count(root) == len(nodes)
+    math = [node for node in nodes if node.tag == "DisplayMath"]
+    assert [node.text.strip() for node in math] == ["x = 1 \\label{eq:x}", "y"]
+    (code,) = [node for node in nodes if node.tag == "CodeBlock"]
+    assert code.text == "verbatim"
+    (table,) = [node for node in nodes if node.tag == "Table"]
+    assert table.images == 2
+    assert all(not hasattr(node, "__dict__") for node in nodes)
+
+
+def test_count_substitutions():
+    text = (CURR_DIR / "sample_files" / "subfigure.tex").read_text()
+    text += r"\includegraphics{single}"
+    doc = run_actions(parse(text))
+    n_substitutions = len(doc.metadata["substitutions"].content)
+    assert (
+        compact.count_substitutions(compact.load(parse_json(text))) == n_substitutions
+    )
+
+
+def _compare_engines(text, macros=""):
+    ast = parse_bytes(text, macros)
+    legacy = run_actions(load_doc(ast))
+    result = CompactEngine().run(ast)
+    assert ast_to_markdown(result.ast) == to_markdown(legacy)
+    assert result.image_urls == legacy.image_urls
+
+
+def test_compact_engine_matches_legacy(caplog):
+    caplog.set_level(logging.INFO, logger="latex_to_myst.compact_engine")
+    macros = load_macros()
+    texts = [path.read_text() for path in sorted(CURR_DIR.glob("sample_files/*.tex"))]
+    for text in texts + [EDGE_CASES]:
+        _compare_engines(text, macros)
+    assert "legacy engine" not in caplog.text
+
+
+def test_compact_engine_falls_back(caplog):
+    caplog.set_level(logging.INFO, logger="latex_to_myst.compact_engine")
+    # a header with images
+    _compare_engines(r"\section{Logo \includegraphics{logo}} Text")
+    assert "Using the legacy engine: Header with images" in caplog.text
+    caplog.clear()
+    # Basic fails on the code block after the header
+    _compare_engines("\\section{A}\n\\begin{verbatim}\nx\n\\end{verbatim}\n")
+    assert "Compact engine failed" in caplog.text
+
+
+def test_compact_roundtrip():
+    ast = parse_bytes(EDGE_CASES)
+    assert pf.load(io.BytesIO(compact.dumps(compact.loads(ast)))).to_json() == (
+        pf.load(io.BytesIO(ast)).to_json()
+    )
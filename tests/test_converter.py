@@ -0,0 +1,54 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from latex_to_myst import Converter
+from latex_to_myst.labelstore import ANONYMOUS_SOURCE, LabelStore
+from latex_to_myst.pipeline import convert, load_macros
+
+
+CURR_DIR = Path(__file__).parent
+NAMES = ["amsthm", "math", "subfigure", "nested_divs", "figure"]
+
+
+def _sample(name):
+    return (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+
+
+def test_convert_file(tmp_path):
+    converter = Converter()
+    source = CURR_DIR / "sample_files" / "amsthm.tex"
+    target = tmp_path / "amsthm.md"
+    markdown = converter.convert_file(source, target)
+    assert target.read_text() == markdown
+    assert markdown == source.with_suffix(".md").read_text()
+
+
+@pytest.mark.parametrize("engine", ["legacy", "fused", "compact"])
+def test_repeated_and_threaded(engine):
+    macros = load_macros()
+    expected = {name: convert(_sample(name), macros, engine=engine) for name in NAMES}
+    converter = Converter(engine=engine, writer="native")
+    for name in NAMES + NAMES[::-1]:
+        assert converter.convert(_sample(name)) == expected[name]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        names = NAMES * 4
+        results = list(pool.map(lambda name: converter.convert(_sample(name)), names))
+    assert results == [expected[name] for name in names]
+
+
+def test_invalid_configuration():
+    with pytest.raises(ValueError):
+        Converter(engine="turbo")
+    with pytest.raises(ValueError):
+        Converter(writer="html")
+
+
+def test_label_store_without_source(tmp_path):
+    store = LabelStore(tmp_path / "labels.db")
+    store.update("chapter.tex", {"sec:other": "header"})
+    converter = Converter(label_store=store)
+    markdown = converter.convert(
+        r"\section{Intro}\label{sec:intro} See \ref{sec:other}."
+    )
+    assert "{ref}`sec:other`" in markdown
+    assert store.labels(ANONYMOUS_SOURCE) == {"sec:intro": "header"}
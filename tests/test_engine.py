@@ -0,0 +1,57 @@
+from pathlib import Path
+import pytest
+import panflute as pf
+from latex_to_myst.engine import FusedEngine
+from latex_to_myst.helpers import add_metadata
+from latex_to_myst.main import ActionSpec
+from latex_to_myst.pipeline import load_macros, parse, run_actions, to_markdown
+
+
+CURR_DIR = Path(__file__).parent
+SAMPLES = sorted((CURR_DIR / "sample_files").glob("*.tex"))
+
+
+@pytest.mark.parametrize("sample", SAMPLES, ids=[p.stem for p in SAMPLES])
+def test_fused_engine_matches_legacy(sample):
+    macros = load_macros()
+    text = sample.read_text()
+    legacy = to_markdown(run_actions(parse(text, macros), engine="legacy"))
+    fused = to_markdown(run_actions(parse(text, macros), engine="fused"))
+    assert legacy == fused
+
+
+def test_fused_engine_all_samples():
+    macros = load_macros()
+    text = "\n\n".join(p.read_text() for p in SAMPLES)
+    legacy = to_markdown(run_actions(parse(text, macros), engine="legacy"))
+    fused = to_markdown(run_actions(parse(text, macros), engine="fused"))
+    assert legacy == fused
+
+
+def test_created_metadata_goes_through_later_actions():
+    def add(elem, doc):
+        if not isinstance(elem, pf.Para):
+            return
+        if "notes" not in doc.metadata:
+            add_metadata(doc, doc.metadata.content, "notes", pf.MetaMap())
+        notes = doc.metadata["notes"].content
+        add_metadata(doc, notes, f"note-{len(notes)}", pf.MetaInlines(pf.Str("n")))
+
+    def visit(elem, doc):
+        if isinstance(elem, pf.Str):
+            doc.visited.append(elem.text)
+
+    actions = [("add", add), ("visit", visit)]
+    specs = {"add": ActionSpec((pf.Para,)), "visit": ActionSpec((pf.Str,))}
+    docs = []
+    for run in (
+        lambda doc: [pf.run_filter(action, doc=doc) for _, action in actions],
+        FusedEngine(actions, specs).run,
+    ):
+        doc = pf.Doc(pf.Para(pf.Str("a")), pf.Para(pf.Str("b")))
+        doc.visited = []
+        run(doc)
+        docs.append(doc)
+    legacy, fused = docs
+    assert sorted(fused.visited) == sorted(legacy.visited) == ["a", "b", "n", "n"]
+    assert not hasattr(fused, "created_metadata")
@@ -0,0 +1,50 @@
+import pickle
+from latex_to_myst.equations import (
+    Equation,
+    EquationCache,
+    get_equation_cache,
+    set_equation_cache,
+    split_equation,
+)
+from latex_to_myst.pipeline import parse, run_actions, to_markdown
+
+
+EQUATION = r"""
+\begin{equation}
+a = b \label{eq:ab}
+\end{equation}
+"""
+
+
+def test_split_equation():
+    assert split_equation(r"a \label{eq:a} = b") == Equation("eq:a", "a  = b")
+    assert split_equation("a = b") == Equation(None, "a = b")
+
+
+def test_equation_cache_lru():
+    cache = EquationCache(maxsize=2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+    assert (cache.hits, cache.misses, len(cache)) == (1, 3, 2)
+    cache.get("b")
+    assert cache.misses == 4
+    copy = pickle.loads(pickle.dumps(cache))
+    assert (len(copy), copy.maxsize) == (0, 2)
+    assert len(EquationCache(maxsize=0)) == 0
+
+
+def test_shared_across_documents():
+    previous = get_equation_cache()
+    cache = EquationCache()
+    set_equation_cache(cache)
+    try:
+        first = to_markdown(run_actions(parse(EQUATION)))
+        # the label index of prepare misses, the math filter hits
+        assert (cache.hits, cache.misses) == (1, 1)
+        second = to_markdown(run_actions(parse(EQUATION)))
+        assert (cache.hits, cache.misses) == (3, 1)
+        assert first == second and ":label: eq:ab" in first
+    finally:
+        set_equation_cache(previous)
@@ -0,0 +1,85 @@
+from pathlib import Path
+import pytest
+import panflute as pf
+from latex_to_myst.helpers import (
+    child_elements,
+    count_images,
+    create_directive_block,
+    directive_level,
+    directive_levels,
+    remove_nodes,
+    stringify_until_match,
+)
+from latex_to_myst import math
+from latex_to_myst.pipeline import load_macros, parse, run_actions, to_markdown
+
+CURR_DIR = Path(__file__).parent
+
+
+def test_directive_levels():
+    image = pf.Image(url="a.png")
+    math = pf.Math("x", format="DisplayMath")
+    inner = pf.Div(pf.Para(math), classes=["theorem"])
+    outer = pf.Div(pf.Para(pf.Str("text")), inner, classes=["proof"])
+    doc = pf.Doc(outer, pf.Para(image))
+
+    levels = directive_levels(doc)
+    assert levels[math] == 1
+    assert levels[inner] == 2
+    assert levels[outer] == 3
+    assert levels[image] == 1
+    assert levels[doc] == 3
+    assert directive_level(outer, doc, starting_level=1) == 4
+
+
+def test_directive_level_all_children():
+    # the images of a table are in its body, not in its (first) head attribute
+    cells = [pf.TableCell(pf.Plain(pf.Image(url=f"{n}.png"))) for n in range(2)]
+    table = pf.Table(
+        pf.TableBody(pf.TableRow(*cells)), head=pf.TableHead(), caption=pf.Caption()
+    )
+    assert directive_level(table, pf.Doc(table)) == 2
+
+
+def test_create_directive_block_uses_prepared_levels():
+    div = pf.Div(pf.Para(pf.Str("text")), classes=["theorem"])
+    doc = pf.Doc(div)
+    doc.element_levels = {div: 3}
+    block = create_directive_block(div, doc, div.content, "prf:theorem", pf.Div)
+    assert block.content[0].text == "`````{prf:theorem} "
+    assert block.content[-1].text == "`````"
+
+
+def test_create_directive_block_without_prepare():
+    # a filter run on its own, e.g. as a pandoc filter, computes the levels
+    text = (CURR_DIR / "sample_files" / "amsthm.tex").read_text()
+    doc = math.main(parse(text, load_macros()))
+    markdown = to_markdown(doc)
+    assert "````{prf:theorem} Name 1" in markdown
+    assert "\n```{prf:proof}" in markdown
+
+
+# the documents of the compact engine have no image counts
+@pytest.mark.parametrize("engine", ["legacy", "fused"])
+@pytest.mark.parametrize("name", ["figure", "subfigure", "nested_divs"])
+def test_image_counts_stay_consistent(name, engine):
+    text = (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+    doc = run_actions(parse(text), engine=engine)
+    stack = [doc]
+    while stack:
+        elem = stack.pop()
+        if elem in doc.image_counts:
+            assert doc.image_counts[elem] == count_images(elem, {})
+        stack.extend(child_elements(elem))
+
+
+def test_stringify_until_match():
+    para = pf.Para(
+        pf.Str("Theorem"), pf.Space(), pf.Str("1.1"), pf.Space(), pf.Str("Body")
+    )
+    nodes = stringify_until_match(para, "Theorem 1.1 ")
+    assert nodes == list(para.content[:3])
+    assert stringify_until_match(para, "Theorem 2") is None
+
+    remove_nodes(para, nodes)
+    assert pf.stringify(para).strip() == "Body"
@@ -0,0 +1,71 @@
+import panflute as pf
+from latex_to_myst import helpers, labels
+from latex_to_myst.labels import Label, build_label_index
+from latex_to_myst.main import prepare
+from latex_to_myst.hyperlink import action as link_action
+from latex_to_myst.pipeline import parse
+
+
+TEXT = r"""
+\section{Intro}\label{sec:intro}
+\begin{theorem}[Main]
+    Statement.
+    \label{thm:main}
+\end{theorem}
+\begin{equation} x = 1 \label{eq:x} \end{equation}
+\[ y = 2 \]
+\begin{figure}\includegraphics{a.png}\caption{A}\label{fig:a}\end{figure}
+\begin{theorem}[Other]
+    Again.
+    \label{thm:main}
+\end{theorem}
+See \ref{sec:intro}, \ref{thm:main}, \eqref{eq:x}, \ref{fig:a} and \ref{missing}.
+"""
+
+
+def test_label_index():
+    doc = parse(TEXT)
+    index = build_label_index(doc)
+    assert index.get("sec:intro") == Label("header", "ref")
+    # the \label of a theorem is on an untyped span, as in the legacy lookup
+    assert index.get("thm:main") == Label(None, None)
+    assert index.get("eq:x") == Label("displaymath", "eq")
+    assert index.get("fig:a") == Label("figure", "numref")
+    assert labels.UNLABELLED_EQUATION in index
+    assert index.duplicates == {"thm:main"}
+    assert index.dangling() == {"missing"}
+    assert index.dangling(external=["missing"]) == set()
+    assert isinstance(index.elements["eq:x"], pf.Math)
+
+
+def test_dangling_references_reported(caplog):
+    doc = parse(TEXT)
+    prepare(doc)
+    assert "References to undefined labels: ['missing']" in caplog.text
+    caplog.clear()
+    doc = parse(TEXT)
+    doc.external_labels = {"missing": "header"}
+    prepare(doc)
+    assert "undefined labels" not in caplog.text
+
+
+def test_links_resolved_from_index(monkeypatch):
+    doc = parse(TEXT)
+    prepare(doc)
+    calls = []
+
+    def counted(*args):
+        calls.append(args)
+
+    monkeypatch.setattr(helpers, "get_element_type", counted)
+    monkeypatch.setattr(labels, "get_element_type", counted)
+    doc = pf.run_filter(link_action, doc=doc)
+    assert not calls
+    markdown = pf.stringify(doc)
+    for ref in [
+        "{ref}`sec:intro`",
+        "{eq}`eq:x`",
+        "{numref}`fig:a`",
+    ]:
+        assert ref in markdown
+    assert "[thm:main]" in markdown
@@ -0,0 +1,95 @@
+import pickle
+import threading
+from latex_to_myst.labelstore import LabelStore, source_key
+from latex_to_myst.pipeline import convert
+from latex_to_myst.batch import convert_batch
+from latex_to_myst.shard import convert_sharded
+
+
+CHAPTER_1 = r"""
+\section{Intro}\label{sec:intro}
+See Section \ref{sec:results} and Figure \ref{fig:plot}.
+"""
+
+CHAPTER_2 = r"""
+\section{Results}\label{sec:results}
+\begin{figure}\includegraphics{plot.png}\caption{Plot}\label{fig:plot}\end{figure}
+Back to Section \ref{sec:intro}.
+"""
+
+
+def test_label_store(tmp_path):
+    store = LabelStore(tmp_path / "labels.db")
+    store.update("a.tex", {"sec:a": "header", "eq:a": "displaymath"})
+    store.update("b.tex", {"sec:b": "header", "span": None})
+    assert store.sources() == ["a.tex", "b.tex"]
+    assert store.resolve(["sec:a", "sec:b", "span", "missing"]) == {
+        "sec:a": "header",
+        "sec:b": "header",
+        "span": None,
+    }
+    # the labels of a source itself are not external
+    assert store.resolve(["sec:a", "sec:b"], "a.tex") == {"sec:b": "header"}
+
+    # updates replace the labels of a single source
+    store.update("a.tex", {"fig:a": "figure"})
+    assert store.labels("a.tex") == {"fig:a": "figure"}
+    assert store.labels("b.tex") == {"sec:b": "header", "span": None}
+    store.remove("b.tex")
+    assert store.sources() == ["a.tex"]
+
+    copy = pickle.loads(pickle.dumps(store))
+    assert copy.labels("a.tex") == {"fig:a": "figure"}
+    result = []
+    thread = threading.Thread(target=lambda: result.append(store.sources()))
+    thread.start()
+    thread.join()
+    assert result == [["a.tex"]]
+
+
+def test_references_across_documents(tmp_path):
+    store = LabelStore(tmp_path / "labels.db")
+    md_1 = convert(CHAPTER_1, label_store=store, source="ch1.tex")
+    # chapter 2 is not in the store yet
+    assert "{ref}`sec:results`" not in md_1
+    md_2 = convert(CHAPTER_2, label_store=store, source="ch2.tex")
+    assert "{ref}`sec:intro`" in md_2
+    md_1 = convert(CHAPTER_1, label_store=store, source="ch1.tex")
+    assert "{ref}`sec:results`" in md_1
+    assert "{numref}`fig:plot`" in md_1
+    assert store.labels("ch1.tex") == {"sec:intro": "header"}
+
+    # reconverting a chapter without the figure updates the store
+    convert(
+        CHAPTER_2.replace(r"\label{fig:plot}", ""), label_store=store, source="ch2.tex"
+    )
+    assert "fig:plot" not in store.labels("ch2.tex")
+    assert "{numref}`fig:plot`" not in convert(
+        CHAPTER_1, label_store=store, source="ch1.tex"
+    )
+
+    sharded = convert_sharded(
+        CHAPTER_1 + CHAPTER_1.replace("intro", "other"),
+        jobs=2,
+        label_store=store,
+        source="ch3.tex",
+    )
+    assert "{ref}`sec:results`" in sharded
+    assert store.labels("ch3.tex") == {"sec:intro": "header", "sec:other": "header"}
+
+
+def test_batch_gathers_labels_first(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.tex").write_text(CHAPTER_1)
+    (src / "b.tex").write_text(CHAPTER_2)
+    store = LabelStore(tmp_path / "labels.db")
+    results = list(
+        convert_batch([str(src)], tmp_path / "out", jobs=1, label_store=store)
+    )
+    assert all(res.ok for res in results)
+    assert "{ref}`sec:results`" in (tmp_path / "out" / "a.md").read_text()
+    assert "{ref}`sec:intro`" in (tmp_path / "out" / "b.md").read_text()
+    assert store.sources() == sorted(
+        [source_key(src / "a.tex"), source_key(src / "b.tex")]
+    )
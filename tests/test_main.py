@@ -0,0 +1,21 @@
+import pytest
+from latex_to_myst.pipeline import ENGINES, convert
+
+SECTIONS = r"""
+\section{Intro}\label{sec:intro}
+Text.
+\begin{theorem}
+\section{Inside}\label{sec:inside}
+Body.
+\end{theorem}
+\subsection{Other}
+More.
+"""
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_section_labels(engine):
+    out = convert(SECTIONS, engine=engine)
+    assert "(sec:intro)=\n\n# Intro" in out
+    assert "(sec:inside)=\n\n# Inside" in out
+    assert "(other)=\n\n## Other" in out
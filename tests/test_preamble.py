@@ -0,0 +1,33 @@
+from latex_to_myst.preamble import compile_preamble
+
+
+MACROS = r"""\newtheorem{theorem}{Theorem}
+\newtheorem{lemma}[theorem]{Lemma}
+\newcommand{\R}{\mathbb{R}}
+\newcommand\norm[1]{\left\| #1 \right\|_{\R}} % uses \R
+\def\unused{nothing}
+\makeatletter
+"""
+
+
+def test_split_preserves_source():
+    preamble = compile_preamble(MACROS)
+    assert "".join(d.source for d in preamble.definitions) == MACROS
+    assert [sorted(d.defines) for d in preamble.definitions] == [
+        ["theorem"],
+        ["lemma"],
+        ["\\R"],
+        ["\\norm"],
+        ["\\unused"],
+        [],
+    ]
+
+
+def test_for_document_selects_dependencies():
+    preamble = compile_preamble(MACROS)
+    selected = preamble.for_document(r"\begin{lemma} $\norm{x}$ \end{lemma}")
+    assert "\\newtheorem{theorem}" in selected
+    assert "\\newcommand{\\R}" in selected
+    assert "\\unused" not in selected
+    assert "\\makeatletter" in selected
+    assert preamble.for_document(r"\csname unused\endcsname") == MACROS
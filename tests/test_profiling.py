@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+import pytest
+import panflute as pf
+from latex_to_myst import helpers, profiling
+from latex_to_myst.main import ACTION_SPECS, ACTIONS
+from latex_to_myst.pipeline import load_macros, parse, run_actions, to_markdown
+from latex_to_myst.profiling import Profiler, stage
+
+
+CURR_DIR = Path(__file__).parent
+
+
+@pytest.mark.parametrize("engine", ["legacy", "fused"])
+def test_profile_conversion(engine, tmp_path):
+    text = (CURR_DIR / "sample_files" / "amsthm.tex").read_text()
+    macros = load_macros()
+    expected = to_markdown(run_actions(parse(text, macros), engine=engine))
+
+    stringify = pf.stringify
+    profiler = Profiler(tmp_path / "stats")
+    with profiler:
+        assert pf.stringify is not stringify
+        with stage(profiler, "parse"):
+            doc = parse(text, macros)
+        doc = run_actions(doc, engine=engine, profiler=profiler)
+        with stage(profiler, "write"):
+            markdown = to_markdown(doc)
+    assert pf.stringify is stringify
+    assert helpers.directive_levels.__name__ == "directive_levels"
+    assert not hasattr(helpers.directive_levels, "__wrapped__")
+    assert markdown == expected
+
+    stages = {s.name: s for s in profiler.stages.values()}
+    assert {"parse", "prepare", "finalize", "write"} <= stages.keys()
+    assert stages["prepare"].calls["directive_levels"] == 1
+    assert stages["action:Math"].replaced > 0
+    elements = []
+    parse(text, macros).walk(lambda e, doc: elements.append(e))
+    if engine == "legacy":
+        # the first action visits every element of the parsed document, the
+        # others every element of the same rewritten document
+        assert stages["action:Math"].visited == len(elements)
+        visited = {stages[f"action:{name}"].visited for name, _ in ACTIONS[1:]}
+        assert len(visited) == 1 and visited.pop() > 0
+        assert all(stages[f"action:{name}"].wall > 0 for name, _ in ACTIONS)
+        assert stages["action:Math"].visited > stages["action:Math"].replaced
+    else:
+        # only the element types of its spec reach an action
+        math_types = ACTION_SPECS["Math"].types
+        n_math = sum(isinstance(e, math_types) for e in elements)
+        assert stages["action:Math"].visited == n_math > 0
+        assert stages["filters"].wall > 0
+
+    profiler.write(tmp_path / "profile.json")
+    report = json.loads((tmp_path / "profile.json").read_text())
+    assert [s["name"] for s in report["stages"]] == list(stages)
+    assert report["calls"]["stringify"] > 0
+    assert len(report["pstats"]) == len([s for s in stages.values() if s.entered])
+
+
+def test_single_active_profiler():
+    with Profiler():
+        with pytest.raises(RuntimeError):
+            with Profiler():
+                pass
+    with Profiler():
+        pass
+
+
+def test_failed_patching_releases_profiler(monkeypatch):
+    original = helpers.count_images
+    monkeypatch.setattr(
+        profiling,
+        "HOT_FUNCTIONS",
+        profiling.HOT_FUNCTIONS + (("latex_to_myst.helpers", "missing"),),
+    )
+    with pytest.raises(AttributeError):
+        with Profiler():
+            pass
+    assert helpers.count_images is original
+    monkeypatch.undo()
+    with Profiler():
+        pass
+
+
+def test_nested_stages_exclusive():
+    profiler = Profiler()
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            sum(range(10000))
+    outer, inner = profiler.stages["outer"], profiler.stages["inner"]
+    assert inner.wall > 0 and outer.wall >= 0
+    assert profiler.report()["total_wall"] == pytest.approx(outer.wall + inner.wall)
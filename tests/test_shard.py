@@ -0,0 +1,72 @@
+import re
+from pathlib import Path
+from latex_to_myst.pipeline import convert, load_macros
+from latex_to_myst.shard import convert_sharded, split_document
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def _sample(name):
+    return (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+
+
+def test_split_document():
+    text = (
+        "\\documentclass{book}\n\\begin{document}\n"
+        "intro\n"
+        "\\chapter{A}\n\\section{A.1}\n"
+        "% \\chapter{commented}\n"
+        "\\begin{figure}\\chapter{nested}\\end{figure}\n"
+        "\\chapter{B}\nb\n"
+        "\\end{document}\n"
+    )
+    shards = split_document(text, 10)
+    assert len(shards) == 3
+    for shard in shards:
+        assert shard.startswith("\\documentclass{book}\n\\begin{document}")
+        assert shard.endswith("\\end{document}\n")
+    assert "\\section{A.1}" in shards[1] and "nested" in shards[1]
+    assert "\\chapter{B}" in shards[2]
+    assert len(split_document(text, 1)) == 1
+    assert split_document("no sections", 4) == ["no sections"]
+
+
+def test_sharded_conversion_matches_serial():
+    sections = [
+        "\\section{Theorems}\\label{sec:thm}\n"
+        "See Theorem \\ref{thm:label} and Section \\ref{sec:math}.\n\n"
+        + _sample("amsthm"),
+        "\\section{Math}\\label{sec:math}\n"
+        "Back to Section \\ref{sec:thm}.\n\n" + _sample("math"),
+        "\\section{Divs}\n" + _sample("nested_divs"),
+    ]
+    text = "\n".join(sections)
+    macros = load_macros()
+    assert len(split_document(text, 3)) > 1
+    serial = convert(text, macros)
+    assert "{prf:ref}`thm:label`" in serial
+    assert convert_sharded(text, macros, jobs=2, n_shards=3) == serial
+
+
+def test_sharded_substitutions_unique():
+    text = "\n".join(f"\\section{{S{i}}}\n" + _sample("subfigure") for i in range(3))
+    markdown = convert_sharded(text, load_macros(), jobs=2, n_shards=3)
+    front_matter = markdown.split("\n---\n", 1)[0]
+    ids = re.findall(r"^  (figure-\d+):", front_matter, flags=re.M)
+    assert len(ids) == 6 and len(set(ids)) == 6
+    assert sorted(re.findall(r"\{\{(figure-\d+)\}\}", markdown)) == sorted(ids)
+
+
+def test_sharded_subfigures_match_serial():
+    # single figures before the subfigures do not advance the numbers
+    text = "\n".join(
+        f"\\section{{S{i}}}\n" + _sample("figure") + _sample("subfigure")
+        for i in range(3)
+    )
+    macros = load_macros()
+    serial = convert(text, macros)
+    assert "{{figure-2}}" in serial
+    assert convert_sharded(text, macros, jobs=2, n_shards=3) == serial
+    sharded = convert_sharded(text, macros, jobs=2, n_shards=3, engine="compact")
+    assert sharded == serial
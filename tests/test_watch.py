@@ -0,0 +1,77 @@
+from pathlib import Path
+from latex_to_myst.pipeline import convert, load_macros
+from latex_to_myst.watch import Watcher, expand
+
+
+CURR_DIR = Path(__file__).parent
+
+
+def _sample(name):
+    return (CURR_DIR / "sample_files" / f"{name}.tex").read_text()
+
+
+def _project(tmp_path):
+    (tmp_path / "preamble.tex").write_text("\\newcommand{\\R}{\\mathbb{R}}\n")
+    (tmp_path / "thm.tex").write_text(
+        "\\section{Theorems}\\label{sec:thm}\n"
+        "See Section \\ref{sec:math}.\n\n" + _sample("amsthm")
+    )
+    (tmp_path / "math.tex").write_text(
+        "\\section{Math}\\label{sec:math}\n"
+        "Back to Section \\ref{sec:thm} with \\input{inline}.\n\n" + _sample("math")
+    )
+    (tmp_path / "inline.tex").write_text("$x \\in \\R$")
+    main = tmp_path / "main.tex"
+    main.write_text(
+        "\\documentclass{article}\n\\input{preamble}\n\\begin{document}\n"
+        "\\input{thm}\n"
+        "% \\input{missing}\n"
+        "\\include{math.tex}\n"
+        "\\end{document}\n"
+    )
+    return main
+
+
+def test_expand(tmp_path):
+    main = _project(tmp_path)
+    prologue, segments = expand(main)
+    assert "\\newcommand{\\R}" in prologue
+    assert len(segments) == 2
+    assert "Theorems" in segments[0].text and "Math" not in segments[0].text
+    assert "$x \\in \\R$" in segments[1].text
+    names = [sorted(p.name for p in s.files) for s in segments]
+    assert names[0] == ["main.tex", "preamble.tex", "thm.tex"]
+    assert names[1] == ["inline.tex", "main.tex", "math.tex", "preamble.tex"]
+
+
+def test_incremental_rebuild(tmp_path, capsys, caplog):
+    main = _project(tmp_path)
+    macros = load_macros()
+    watcher = Watcher(main, tmp_path / "out.md", macros)
+    watcher.rebuild()
+    assert (watcher.n_parsed, watcher.n_filtered) == (2, 2)
+    assert capsys.readouterr().err.startswith(f"Wrote {tmp_path / 'out.md'} in ")
+    assert not [r for r in caplog.records if r.levelname == "WARNING"]
+    assert watcher.files == set(tmp_path.glob("*.tex"))
+
+    watcher.build()
+    assert (watcher.n_parsed, watcher.n_filtered) == (0, 0)
+
+    math = tmp_path / "math.tex"
+    math.write_text(math.read_text() + "\nOne more paragraph.\n")
+    markdown = watcher.build()
+    assert (watcher.n_parsed, watcher.n_filtered) == (1, 1)
+    assert "One more paragraph." in markdown
+    assert "{ref}`sec:thm`" in markdown
+
+    serial = convert(
+        main.read_text()
+        .replace("\\input{preamble}", (tmp_path / "preamble.tex").read_text())
+        .replace("\\input{thm}", (tmp_path / "thm.tex").read_text())
+        .replace(
+            "\\include{math.tex}",
+            math.read_text().replace("\\input{inline}", "$x \\in \\R$"),
+        ),
+        macros,
+    )
+    assert markdown == serial
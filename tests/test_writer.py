@@ -0,0 +1,102 @@
+import io
+from pathlib import Path
+import pytest
+import panflute as pf
+from latex_to_myst.pipeline import load_macros, parse, run_actions, to_markdown
+from latex_to_myst.writer import unsupported_elements, write_markdown
+
+
+CURR_DIR = Path(__file__).parent
+SAMPLES = sorted((CURR_DIR / "sample_files").glob("*.tex"))
+
+
+def _native(doc):
+    stream = io.StringIO()
+    write_markdown(doc, stream)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("sample", SAMPLES, ids=[p.stem for p in SAMPLES])
+def test_native_writer_matches_pandoc(sample):
+    doc = run_actions(parse(sample.read_text(), load_macros()))
+    assert not unsupported_elements(doc)
+    assert _native(doc) == to_markdown(doc)
+
+
+def _words(n):
+    elems = []
+    for i in range(n):
+        elems += [pf.Str(f"word{i}"), pf.Space()]
+    return elems
+
+
+DOCS = {
+    "wrapping": pf.Doc(
+        pf.Para(*_words(20), pf.Str("-"), pf.Space(), pf.Str("1."), pf.Space()),
+        pf.Para(pf.Str("1."), pf.Space(), pf.Str("#"), pf.Space(), pf.Str("a*b_c")),
+    ),
+    "lists": pf.Doc(
+        pf.BulletList(
+            pf.ListItem(pf.Plain(*_words(18))),
+            pf.ListItem(
+                pf.Plain(pf.Str("b")),
+                pf.OrderedList(pf.ListItem(pf.Para(pf.Str("c"))), start=9),
+            ),
+        ),
+        pf.BulletList(pf.ListItem(pf.Plain(pf.Str("d")))),
+        pf.CodeBlock("code"),
+    ),
+    "divs": pf.Doc(
+        pf.Div(
+            pf.Plain(pf.Str("a")),
+            pf.Div(pf.Para(pf.Str("b")), classes=["inner"]),
+            identifier="outer",
+        ),
+        pf.BlockQuote(
+            pf.Para(pf.Str("q")), pf.RawBlock("```{x}\n```", format="markdown")
+        ),
+        pf.Header(pf.Str("Title"), level=2, classes=["unnumbered"]),
+    ),
+    "inlines": pf.Doc(
+        pf.Para(
+            pf.Emph(pf.Str("e")),
+            pf.Space(),
+            pf.Code("a`b"),
+            pf.Space(),
+            pf.Math("x^2", format="InlineMath"),
+            pf.Space(),
+            pf.Span(pf.Str("s"), classes=["c"], attributes={"k": "v"}),
+            pf.Space(),
+            pf.Link(pf.Str("http://a.b"), url="http://a.b"),
+            pf.Space(),
+            pf.Image(pf.Str("alt"), url="img.png", attributes={"width": "50%"}),
+            pf.LineBreak(),
+            pf.Quoted(pf.Str("q"), quote_type="DoubleQuote"),
+        )
+    ),
+    "metadata": pf.Doc(
+        pf.Para(pf.Str("x")),
+        metadata={
+            "substitutions": pf.MetaMap(
+                a=pf.MetaInlines(pf.Str("one")),
+                b=pf.MetaInlines(pf.RawInline("```{x}\ny\n```", format="markdown")),
+            ),
+            "title": pf.MetaInlines(pf.Str("T: x")),
+        },
+    ),
+}
+
+
+@pytest.mark.parametrize("name", DOCS)
+def test_native_writer_constructed(name):
+    doc = DOCS[name]
+    assert not unsupported_elements(doc)
+    assert _native(doc) == to_markdown(doc)
+
+
+def test_native_writer_fallback():
+    doc = pf.Doc(pf.Para(pf.Str("a"), pf.Note(pf.Para(pf.Str("note")))))
+    assert unsupported_elements(doc) == {"Note"}
+    with pytest.raises(ValueError):
+        _native(doc)
+    assert to_markdown(doc, writer="native") == to_markdown(doc)